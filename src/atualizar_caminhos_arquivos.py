@@ -11,6 +11,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from pathlib import Path
 from utils import listar_arquivos_xml_em
+from utils import descobrir_todos_xmls
 from utils import atualizar_status_xml
 from utils import normalizar_data
 from utils import formatar_data_iso_para_br
@@ -88,8 +89,8 @@ def atualizar_caminhos_no_banco(db_path: str = 'omie.db') -> None:
     # Busca arquivos XML recursivamente em todas as subpastas
     arquivos_xml = []
     if resultado_dir.exists():
-        # Busca recursiva usando glob
-        arquivos_xml = list(resultado_dir.rglob("*.xml"))
+        # Busca recursiva via os.scandir (subpastas em paralelo)
+        arquivos_xml = descobrir_todos_xmls(resultado_dir)
         logger.info(f"[ATUALIZADOR.CAMINHOS.DESCOBERTA] {len(arquivos_xml):,} arquivos XML encontrados recursivamente")
     else:
         logger.warning(f"[ATUALIZADOR.CAMINHOS.DESCOBERTA] Pasta resultado não existe: {resultado_dir}")
@@ -265,7 +266,6 @@ def _atualizar_banco_otimizado(db_path: str, mapeamento_chaves: Dict) -> None:
 def _criar_indices_otimizados(conn: sqlite3.Connection) -> None:
     """Cria índices otimizados se não existirem."""
     indices = [
-        "CREATE INDEX IF NOT EXISTS idx_chave_nfe_otim ON notas(cChaveNFe)",
         "CREATE INDEX IF NOT EXISTS idx_xml_baixado_otim ON notas(xml_baixado)",
         "CREATE INDEX IF NOT EXISTS idx_caminho_arquivo ON notas(caminho_arquivo)",
         "CREATE INDEX IF NOT EXISTS idx_xml_vazio ON notas(xml_vazio)",
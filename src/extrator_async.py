@@ -343,7 +343,7 @@ async def baixar_xmls(client: OmieClient, db_name: str):
         logger.info("[XML] Nenhum XML pendente para download")
         return
 
-    semaphore = asyncio.Semaphore(client.semaphore._value)
+    semaphore = asyncio.Semaphore(client.calls_per_second)
     async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as session:
         await asyncio.gather(
             *[
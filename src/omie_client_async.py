@@ -3,9 +3,21 @@
 import asyncio
 import aiohttp
 import configparser
+import logging
+import weakref
 from typing import Any, Callable, Coroutine
 from functools import wraps
 
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Excecões
+# ==============================================================================
+
+class RespostaNaoJsonError(ValueError):
+    """Resposta da API Omie sem corpo JSON (ex.: pagina HTML de WAF com status 200)."""
+    pass
+
 # ==============================================================================
 # Decorador de Retry para chamadas assincronas
 # ==============================================================================
@@ -66,7 +78,28 @@ class OmieClient:
         self.app_secret = app_secret
         self.base_url_nf = base_url_nf
         self.base_url_xml = base_url_xml
-        self.semaphore = asyncio.Semaphore(calls_per_second)  # Limita concorrência simultânea
+        self.calls_per_second = calls_per_second
+        # Um Semaphore por event loop: asyncio.Semaphore fica preso ao loop que o usa primeiro
+        self._limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _limiter(self) -> asyncio.Semaphore:
+        """
+        Retorna o limitador de concorrência do event loop em execucoo, criando-o sob demanda.
+
+        Permite usar o mesmo cliente em varios loops (ex.: `asyncio.run` por worker)
+        sem o erro "got Future attached to a different loop".
+
+        Returns:
+            Semaphore com `calls_per_second` vagas, exclusivo do loop atual.
+        """
+        loop = asyncio.get_running_loop()
+        limiter = self._limiters.get(loop)
+        if limiter is None:
+            limiter = asyncio.Semaphore(self.calls_per_second)
+            self._limiters[loop] = limiter
+        return limiter
 
     @with_retries(max_retries=3, delay=2)
     async def call_api(
@@ -87,7 +120,8 @@ class OmieClient:
             Dicionario com a resposta JSON da API.
 
         Raises:
-            ValueError: Se a resposta noo for um JSON valido do tipo esperado.
+            RespostaNaoJsonError: Se a resposta noo for JSON (ex.: pagina HTML de erro),
+                apos esgotar as tentativas.
             HTTPError: Em caso de falha de status HTTP.
         """
         payload = {
@@ -100,13 +134,17 @@ class OmieClient:
         # Define a URL correta com base no tipo de chamada
         url = self.base_url_nf if metodo == "ListarNF" else self.base_url_xml
 
-        async with self.semaphore:  # Limita chamadas simultâneas
+        async with self._limiter():  # Limita chamadas simultâneas (por event loop)
             async with session.post(url, json=payload, timeout=60) as response:
                 response.raise_for_status()
-                resultado = await response.json()
-                if not isinstance(resultado, dict):
-                    raise ValueError("Resposta inesperada da API Omie")
-                return resultado
+                # Omie/WAF pode devolver pagina HTML com status 200: trata como falha retentavel
+                content_type = response.headers.get("Content-Type", "")
+                if "json" not in content_type:
+                    logger.warning(
+                        f"[API] Resposta noo-JSON ({content_type or 'sem Content-Type'}) em {metodo}; nova tentativa"
+                    )
+                    raise RespostaNaoJsonError(f"Content-Type inesperado: {content_type}")
+                return await response.json(content_type=None)
 
 
 # ==============================================================================
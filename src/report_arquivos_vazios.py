@@ -156,11 +156,12 @@ def encontrar_arquivos_vazios_ou_zero_otimizado(root_dir: str) -> List[Dict]:
     arquivos = []
     contador = 0
     
-    for arquivo in root.rglob("*"):
-        if arquivo.is_file():
+    # os.walk (scandir): arquivo/pasta vem do tipo lido no readdir, sem stat por entrada
+    for pasta, _, nomes in os.walk(root):
+        for nome in nomes:
             # Filtros rapidos
-            if arquivo.suffix.lower() not in EXTENSOES_IGNORADAS:
-                arquivos.append(str(arquivo))
+            if os.path.splitext(nome)[1].lower() not in EXTENSOES_IGNORADAS:
+                arquivos.append(os.path.join(pasta, nome))
                 contador += 1
                 
                 # Log de progresso
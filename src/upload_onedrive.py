@@ -24,6 +24,7 @@ Arquitetura:
 
 Dependências:
 - requests: HTTP client para API calls
+- aiohttp: HTTP client assincrono para upload concorrente
 - pathlib: Manipulacoo de caminhos
 - configparser: Leitura de configuracões
 
@@ -36,15 +37,19 @@ Versoo: 3.0
 # IMPORTS E DEPENDÊNCIAS
 # =============================================================================
 
+import asyncio
 import os
 import json
 import logging
 import configparser
 import time
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Dict, Set, List, Any, Tuple
 from dotenv import load_dotenv
 
+import aiohttp
 import requests
 from requests import Response
 
@@ -60,24 +65,15 @@ logger = logging.getLogger(__name__)
 # CONFIGURAcoO E CONSTANTES
 # =============================================================================
 
-# Carregamento de configuracões
-load_dotenv()
-config = configparser.ConfigParser()
-config.read("configuracao.ini")
-
-# Configuracões de upload
-UPLOAD_ENABLED = config.getboolean("ONEDRIVE", "upload_onedrive", fallback=False)
-
-# Variaveis sensiveis carregadas do ambiente
-CLIENT_ID = os.getenv("ONEDRIVE_CLIENT_ID")
-CLIENT_SECRET = os.getenv("ONEDRIVE_CLIENT_SECRET") 
-TENANT_ID = os.getenv("ONEDRIVE_TENANT_ID")
-SHAREPOINT_SITE = os.getenv("SHAREPOINT_SITE")
-SHAREPOINT_FOLDER = os.getenv("SHAREPOINT_FOLDER")
-DRIVE_NAME = os.getenv("ONEDRIVE_DRIVE_NAME")
-
-# Validacoo de variaveis obrigatorias
-REQUIRED_VARS = [CLIENT_ID, CLIENT_SECRET, TENANT_ID, SHAREPOINT_SITE, SHAREPOINT_FOLDER, DRIVE_NAME]
+# Nomes das variaveis de ambiente obrigatorias (campo em Settings -> variavel)
+REQUIRED_ENV_VARS: Dict[str, str] = {
+    "client_id": "ONEDRIVE_CLIENT_ID",
+    "client_secret": "ONEDRIVE_CLIENT_SECRET",
+    "tenant_id": "ONEDRIVE_TENANT_ID",
+    "sharepoint_site": "SHAREPOINT_SITE",
+    "sharepoint_folder": "SHAREPOINT_FOLDER",
+    "drive_name": "ONEDRIVE_DRIVE_NAME",
+}
 
 # Caminhos de cache e historico
 UPLOAD_DB_PATH = Path("uploads_realizados.json")
@@ -93,6 +89,7 @@ RETRY_DELAY = 2.0
 CHUNK_SIZE = 10 * 1024 * 1024  # 10MB chunks para arquivos grandes
 LARGE_FILE_THRESHOLD = 4 * 1024 * 1024  # 4MB threshold para upload resumivel
 TIMEOUT = 60.0  # Timeout para requisicões HTTP
+MAX_UPLOADS_CONCORRENTES = 4  # Uploads simultaneos no modo assincrono
 
 # =============================================================================
 # CLASSES DE EXCEcoO CUSTOMIZADAS
@@ -118,6 +115,69 @@ class OneDriveConfigError(OneDriveUploadError):
     pass
 
 
+# =============================================================================
+# CONFIGURAcoO CARREGADA SOB DEMANDA
+# =============================================================================
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Configuracões do upload OneDrive (INI + variaveis de ambiente).
+
+    Attributes:
+        upload_enabled: Flag [ONEDRIVE] upload_onedrive do configuracao.ini
+        client_id: ID da aplicacoo no Azure AD
+        client_secret: Segredo da aplicacoo
+        tenant_id: ID do tenant
+        sharepoint_site: Site do SharePoint
+        sharepoint_folder: Pasta base no SharePoint
+        drive_name: ID do drive de destino
+    """
+
+    upload_enabled: bool = False
+    client_id: Optional[str] = None
+    client_secret: Optional[str] = None
+    tenant_id: Optional[str] = None
+    sharepoint_site: Optional[str] = None
+    sharepoint_folder: Optional[str] = None
+    drive_name: Optional[str] = None
+
+    @property
+    def variaveis_ausentes(self) -> List[str]:
+        """Retorna os nomes das variaveis de ambiente obrigatorias noo definidas."""
+        return [
+            env_var for campo, env_var in REQUIRED_ENV_VARS.items()
+            if not getattr(self, campo)
+        ]
+
+    @property
+    def completo(self) -> bool:
+        """True se todas as variaveis obrigatorias estoo presentes."""
+        return not self.variaveis_ausentes
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Carrega as configuracões do OneDrive na primeira chamada e as reutiliza.
+
+    A leitura do .env e do configuracao.ini acontece apenas quando o upload
+    e de fato utilizado, e noo na importacoo do modulo.
+
+    Returns:
+        Settings: Configuracões imutaveis do upload
+    """
+    load_dotenv()
+    config = configparser.ConfigParser()
+    config.read("configuracao.ini")
+
+    valores = {campo: os.getenv(env_var) for campo, env_var in REQUIRED_ENV_VARS.items()}
+    return Settings(
+        upload_enabled=config.getboolean("ONEDRIVE", "upload_onedrive", fallback=False),
+        **valores
+    )
+
+
 # =============================================================================
 # FUNcÕES DE VALIDAcoO E CONFIGURAcoO
 # =============================================================================
@@ -138,17 +198,15 @@ def validar_configuracao_onedrive() -> bool:
         OneDriveConfigError: Se alguma configuracoo esta ausente ou invalida
     """
     try:
+        settings = get_settings()
+
         # Verifica se upload esta habilitado
-        if not UPLOAD_ENABLED:
+        if not settings.upload_enabled:
             logger.info("[ONEDRIVE] Upload desabilitado na configuracoo")
             return False
         
         # Verifica variaveis de ambiente obrigatorias
-        missing_vars = []
-        for i, var in enumerate(REQUIRED_VARS):
-            if not var:
-                var_names = ["CLIENT_ID", "CLIENT_SECRET", "TENANT_ID", "SHAREPOINT_SITE", "SHAREPOINT_FOLDER", "DRIVE_NAME"]
-                missing_vars.append(var_names[i])
+        missing_vars = settings.variaveis_ausentes
         
         if missing_vars:
             raise OneDriveConfigError(
@@ -206,8 +264,17 @@ class OneDriveClient:
             OneDriveConfigError: Se a configuracoo for invalida
         """
         try:
+            self.settings: Settings = get_settings()
+            self.enabled: bool = self.settings.upload_enabled and self.settings.completo
+            if not self.settings.upload_enabled:
+                logger.warning("[ONEDRIVE] Upload desabilitado na configuracoo")
+            elif not self.settings.completo:
+                logger.warning(
+                    f"[ONEDRIVE] Variaveis de ambiente ausentes: {self.settings.variaveis_ausentes}"
+                )
+
             self.access_token: Optional[str] = None
-            self.drive_id: str = DRIVE_NAME  # Usando diretamente o ID do drive
+            self.drive_id: str = self.settings.drive_name  # Usando diretamente o ID do drive
             self.pastas_cache: Dict[str, str] = {}
             self.upload_history: Set[str] = set()
             
@@ -340,13 +407,13 @@ class OneDriveClient:
             logger.info("[ONEDRIVE] Iniciando autenticacoo OAuth2...")
             
             # Constroi URL do token dinamicamente
-            token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
+            token_url = f"https://login.microsoftonline.com/{self.settings.tenant_id}/oauth2/v2.0/token"
             
             # Dados para requisicoo de token
             token_data = {
                 "grant_type": "client_credentials",
-                "client_id": CLIENT_ID,
-                "client_secret": CLIENT_SECRET,
+                "client_id": self.settings.client_id,
+                "client_secret": self.settings.client_secret,
                 "scope": SCOPES
             }
             
@@ -712,6 +779,223 @@ class OneDriveClient:
             return 0
 
 
+# =============================================================================
+# CLIENTE ONEDRIVE ASSÍNCRONO
+# =============================================================================
+
+class AsyncOneDriveUploader(OneDriveClient):
+    """
+    Variante assincrona do cliente para upload concorrente de varios arquivos.
+
+    Reutiliza autenticacoo, cache de pastas e historico do OneDriveClient
+    (operacões sincronas, executadas uma vez antes dos uploads) e envia os
+    arquivos em paralelo numa unica aiohttp.ClientSession, limitados por
+    um semaforo para respeitar o throttling do Graph.
+
+    Example:
+        >>> uploader = AsyncOneDriveUploader()
+        >>> uploader.autenticar()
+        >>> resultados = asyncio.run(uploader.upload_many([Path("a.zip"), Path("b.zip")]))
+    """
+
+    async def _arquivo_existe_async(
+        self,
+        session: aiohttp.ClientSession,
+        nome_arquivo: str,
+        folder_id: str
+    ) -> bool:
+        """
+        Verifica de forma assincrona se um arquivo ja existe na pasta do OneDrive.
+
+        Args:
+            session: Sessoo HTTP compartilhada
+            nome_arquivo: Nome do arquivo a verificar
+            folder_id: ID da pasta de destino
+
+        Returns:
+            bool: True se o arquivo ja existe
+        """
+        check_url = f"{GRAPH_API_BASE}/drives/{self.drive_id}/items/{folder_id}:/{nome_arquivo}"
+        try:
+            async with session.get(check_url, headers=self._obter_headers()) as response:
+                return response.status == 200
+        except aiohttp.ClientError as e:
+            logger.warning(f"[ONEDRIVE] Erro ao verificar existência de {nome_arquivo}: {e}")
+            return False
+
+    async def _enviar_conteudo_async(
+        self,
+        session: aiohttp.ClientSession,
+        caminho_arquivo: Path,
+        folder_id: str
+    ) -> bool:
+        """
+        Envia o conteudo do arquivo: PUT simples ou sessoo de upload em chunks.
+
+        Arquivos acima de LARGE_FILE_THRESHOLD usam createUploadSession com
+        blocos de CHUNK_SIZE (multiplo de 320KiB, exigido pelo Graph).
+
+        Args:
+            session: Sessoo HTTP compartilhada
+            caminho_arquivo: Arquivo local
+            folder_id: ID da pasta de destino
+
+        Returns:
+            bool: True se o upload foi concluido
+        """
+        nome = caminho_arquivo.name
+        tamanho = caminho_arquivo.stat().st_size
+
+        if tamanho <= LARGE_FILE_THRESHOLD:
+            upload_url = f"{GRAPH_API_BASE}/drives/{self.drive_id}/items/{folder_id}:/{nome}:/content"
+            async with session.put(
+                upload_url,
+                headers=self._obter_headers(),
+                data=caminho_arquivo.read_bytes()
+            ) as response:
+                if response.status in (200, 201):
+                    return True
+                logger.error(f"[ONEDRIVE] ❌ Falha no upload: {response.status} - {await response.text()}")
+                return False
+
+        # Upload resumivel para arquivos grandes
+        sessao_url = f"{GRAPH_API_BASE}/drives/{self.drive_id}/items/{folder_id}:/{nome}:/createUploadSession"
+        headers = self._obter_headers()
+        headers["Content-Type"] = "application/json"
+        async with session.post(sessao_url, headers=headers, json={}) as response:
+            if response.status != 200:
+                logger.error(f"[ONEDRIVE] ❌ Falha ao criar sessão de upload: {response.status} - {await response.text()}")
+                return False
+            upload_url = (await response.json())["uploadUrl"]
+
+        with open(caminho_arquivo, 'rb') as f:
+            inicio = 0
+            while inicio < tamanho:
+                bloco = f.read(CHUNK_SIZE)
+                fim = inicio + len(bloco) - 1
+                # A uploadUrl ja e pre-autenticada: noo enviar Authorization
+                headers_bloco = {
+                    "Content-Length": str(len(bloco)),
+                    "Content-Range": f"bytes {inicio}-{fim}/{tamanho}"
+                }
+                async with session.put(upload_url, headers=headers_bloco, data=bloco) as response:
+                    if response.status not in (200, 201, 202):
+                        logger.error(f"[ONEDRIVE] ❌ Falha no bloco {inicio}-{fim} de {nome}: {response.status}")
+                        return False
+                inicio = fim + 1
+
+        return True
+
+    async def _upload_arquivo_async(
+        self,
+        session: aiohttp.ClientSession,
+        semaforo: asyncio.Semaphore,
+        caminho_arquivo: Path,
+        pasta_completa: str,
+        folder_id: str
+    ) -> bool:
+        """
+        Realiza upload de um arquivo respeitando o limite de concorrência.
+
+        Args:
+            session: Sessoo HTTP compartilhada
+            semaforo: Limite de uploads simultaneos
+            caminho_arquivo: Arquivo local
+            pasta_completa: Nome da pasta de destino (chave do historico)
+            folder_id: ID da pasta de destino
+
+        Returns:
+            bool: True se upload foi bem-sucedido ou arquivo ja existia
+        """
+        arquivo_key = f"{pasta_completa}/{caminho_arquivo.name}"
+        if arquivo_key in self.upload_history:
+            logger.info(f"[ONEDRIVE] ⏭️ Arquivo já enviado anteriormente: {caminho_arquivo.name}")
+            return True
+
+        async with semaforo:
+            try:
+                if await self._arquivo_existe_async(session, caminho_arquivo.name, folder_id):
+                    logger.info(f"[ONEDRIVE] ⏭️ Arquivo já existe no OneDrive: {caminho_arquivo.name}")
+                    self.upload_history.add(arquivo_key)
+                    return True
+
+                tempo_inicio = time.time()
+                if not await self._enviar_conteudo_async(session, caminho_arquivo, folder_id):
+                    return False
+
+                self.upload_history.add(arquivo_key)
+                logger.info(f"[ONEDRIVE] ✅ Upload concluído: {caminho_arquivo.name} → {pasta_completa} ({time.time() - tempo_inicio:.1f}s)")
+                return True
+
+            except Exception as e:
+                logger.error(f"[ONEDRIVE] ❌ Erro no upload de {caminho_arquivo.name}: {e}")
+                return False
+
+    async def upload_many(
+        self,
+        caminhos_arquivos: List[Path],
+        pasta_base: str = "XML_Compactados",
+        max_concorrentes: int = MAX_UPLOADS_CONCORRENTES
+    ) -> Dict[str, bool]:
+        """
+        Realiza upload concorrente de multiplos arquivos.
+
+        As pastas de destino (por mês) soo resolvidas/criadas antes dos uploads,
+        de forma sincrona, para evitar criacoo duplicada de pastas em paralelo.
+
+        Args:
+            caminhos_arquivos: Lista de caminhos de arquivos
+            pasta_base: Pasta base no OneDrive
+            max_concorrentes: Numero maximo de uploads simultaneos
+
+        Returns:
+            Dict[str, bool]: Resultado do upload de cada arquivo
+        """
+        resultados: Dict[str, bool] = {}
+        tarefas: List[Tuple[Path, str, str]] = []
+
+        for caminho_arquivo in caminhos_arquivos:
+            if not caminho_arquivo.exists():
+                logger.error(f"[ONEDRIVE] ❌ Arquivo não encontrado: {caminho_arquivo}")
+                resultados[str(caminho_arquivo)] = False
+                continue
+
+            mes_pasta = extrair_mes_do_path(caminho_arquivo)
+            if mes_pasta == "outros":
+                mes_pasta = time.strftime('%Y-%m')
+            pasta_completa = f"{pasta_base}_{mes_pasta}"
+
+            try:
+                folder_id = self._criar_pasta_se_necessario(pasta_completa)
+            except Exception as e:
+                logger.error(f"[ONEDRIVE] ❌ Erro ao preparar pasta para {caminho_arquivo.name}: {e}")
+                resultados[str(caminho_arquivo)] = False
+                continue
+
+            tarefas.append((caminho_arquivo, pasta_completa, folder_id))
+
+        logger.info(f"[ONEDRIVE] Iniciando upload concorrente: {len(tarefas)} arquivos (máx. {max_concorrentes} simultâneos)")
+        tempo_inicio = time.time()
+
+        semaforo = asyncio.Semaphore(max_concorrentes)
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=120)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            sucessos = await asyncio.gather(*(
+                self._upload_arquivo_async(session, semaforo, caminho, pasta, folder_id)
+                for caminho, pasta, folder_id in tarefas
+            ))
+
+        for (caminho_arquivo, _, _), sucesso in zip(tarefas, sucessos):
+            resultados[str(caminho_arquivo)] = sucesso
+
+        # Historico salvo uma unica vez ao final (evita escritas concorrentes)
+        self._salvar_historico_uploads()
+
+        total_sucessos = sum(1 for sucesso in resultados.values() if sucesso)
+        logger.info(f"[ONEDRIVE]  Upload concorrente concluído: {total_sucessos}/{len(resultados)} sucessos em {time.time() - tempo_inicio:.1f}s")
+        return resultados
+
+
 # =============================================================================
 # FUNcÕES PRINCIPAIS DE UPLOAD
 # =============================================================================
@@ -773,6 +1057,41 @@ def fazer_upload_lote(caminhos_arquivos: List[Path], pasta_base: str = "XML_Comp
         return {}
 
 
+async def upload_many(caminhos_arquivos: List[Path], pasta_base: str = "XML_Compactados") -> Dict[str, bool]:
+    """
+    Realiza upload concorrente de multiplos arquivos para o OneDrive.
+
+    Equivalente assincrono de fazer_upload_lote(): ate MAX_UPLOADS_CONCORRENTES
+    arquivos soo enviados em paralelo numa unica sessoo HTTP.
+
+    Args:
+        caminhos_arquivos: Lista de caminhos de arquivos para upload
+        pasta_base: Pasta base no OneDrive para organizacoo
+
+    Returns:
+        Dict[str, bool]: Dicionario com resultado do upload de cada arquivo
+
+    Example:
+        >>> resultados = asyncio.run(upload_many([Path("arquivo1.zip"), Path("arquivo2.zip")]))
+    """
+    if not validar_configuracao_onedrive():
+        logger.warning("[ONEDRIVE] ⚠️ Upload desabilitado ou configuração inválida")
+        return {}
+
+    try:
+        uploader = AsyncOneDriveUploader()
+        # Token obtido uma vez (requisicoo sincrona) e reutilizado por todos os uploads
+        if not uploader.autenticar():
+            logger.error("[ONEDRIVE] ❌ Falha na autenticação")
+            return {}
+
+        return await uploader.upload_many(caminhos_arquivos, pasta_base)
+
+    except Exception as e:
+        logger.error(f"[ONEDRIVE] ❌ Erro crítico no upload concorrente: {e}")
+        return {}
+
+
 def upload_arquivo_unico(caminho_arquivo: Path, pasta_destino: str = "XML_Compactados") -> bool:
     """
     Realiza upload de um unico arquivo para o OneDrive.
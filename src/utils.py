@@ -10,10 +10,12 @@ Este módulo fornece funções essenciais organizadas por categoria:
 - obter_registros_pendentes()
 - obter_registros_filtrados()
 - buscar_registros_invalidos_para_reprocessar()
+- buscar_registros_invalidos_para_reprocessar_iter() - Versoo em streaming
 
 ## PROCESSAMENTO DE REGISTROS INVÁLIDOS
 - marcar_registros_invalidos_e_listar_dias()
 - limpar_registros_invalidos_reprocessados()
+- reprocessar_invalidos() - Identificacoo, busca e limpeza numa unica transacoo
 
 ## VALIDAÇÃO E NORMALIZAÇÃO DE DADOS
 - normalizar_data()
@@ -33,21 +35,28 @@ Este módulo fornece funções essenciais organizadas por categoria:
 - criar_lockfile()
 - listar_arquivos_xml_em()
 - descobrir_todos_xmls() - Busca recursiva eficiente
+- iterar_caminhos_xml() - Busca recursiva em streaming (caminhos str)
+- limpar_cache_xmls() - Descarta varreduras de pastas em cache
 
 ## CONTROLE DE RATE LIMITING
 - respeitar_limite_requisicoes()
 - respeitar_limite_requisicoes_async()
+- AsyncRateLimiter - Limitador assíncrono por event loop
 
 ## OPERAÇÕES DE BANCO DE DADOS
 - iniciar_db()
 - salvar_nota()
 - salvar_varias_notas()
+- inserir_notas_batch() - Carga em massa numa unica transacoo
 - atualizar_status_xml()
+- atualizar_status_xml_lote() - Status de varios XMLs numa unica transacoo
+- iter_notas_por_data_numero() - Notas por data/numero em streaming
 - marcar_como_erro()
 - marcar_como_baixado()
 
 ## TRANSFORMAÇÃO DE DADOS
 - transformar_em_tuple()
+- transformar_em_tuples_batch() - Conversoo coluna a coluna de lotes
 
 Características técnicas:
 - Operações batch para máxima performance
@@ -70,6 +79,7 @@ Padrões implementados (PEP 8):
 # IMPORTAÇÕES DA BIBLIOTECA PADRÃO
 # =============================================================================
 import asyncio
+import atexit
 import concurrent.futures
 import json
 import logging
@@ -78,13 +88,17 @@ import re
 import sqlite3
 import time
 import warnings
+import weakref
+from collections import deque, namedtuple
 from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
+from itertools import chain, repeat
 from pathlib import Path
-from threading import Lock
+from threading import Lock, local
 from time import monotonic, sleep
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 from xml.etree import ElementTree as ET
 
 # =============================================================================
@@ -108,13 +122,31 @@ XPATHS: Dict[str, str] = {
     "cnpj_cpf": ".//{*}dest/{*}CNPJ|.//{*}dest/{*}CPF"
 }
 
-# Configurações de otimização SQLite
-SQLITE_PRAGMAS: Dict[str, str] = {
+# PRAGMAs persistentes: gravados no arquivo do banco, basta aplicar uma vez (iniciar_db)
+# page_size so tem efeito em banco novo (ou apos VACUUM fora do modo WAL)
+SQLITE_PRAGMAS_PERSISTENTES: Dict[str, str] = {
+    "page_size": "4096",
     "journal_mode": "WAL",
+}
+
+# PRAGMAs por conexão: precisam ser reaplicados a cada sqlite3.connect
+SQLITE_PRAGMAS_CONEXAO: Dict[str, str] = {
     "synchronous": "NORMAL",
     "temp_store": "MEMORY",
-    "cache_size": "-64000",  # 64MB cache
-    "mmap_size": "268435456"  # 256MB mmap
+    "cache_size": "-65536",  # 64MB cache
+    "mmap_size": "268435456",  # 256MB mmap
+    "wal_autocheckpoint": "1000"
+}
+
+# PRAGMAs por conexão num unico script (executescript: uma chamada em vez de uma por PRAGMA)
+_SCRIPT_PRAGMAS_CONEXAO = "".join(
+    f"PRAGMA {pragma} = {valor};" for pragma, valor in SQLITE_PRAGMAS_CONEXAO.items()
+)
+
+# Configurações de otimização SQLite (conjunto completo, mantido para compatibilidade)
+SQLITE_PRAGMAS: Dict[str, str] = {
+    "journal_mode": SQLITE_PRAGMAS_PERSISTENTES["journal_mode"],
+    **SQLITE_PRAGMAS_CONEXAO
 }
 
 # Schema SQL para criação de tabelas
@@ -150,9 +182,16 @@ SCHEMA_NOTAS_CREATE = """
         
         -- Campos de controle
         xml_baixado BOOLEAN DEFAULT 0,
-        anomesdia INTEGER DEFAULT NULL,
+        -- YYYYMMDD derivado de dEmi pelo proprio SQLite a cada escrita (sempre indexavel)
+        anomesdia INTEGER GENERATED ALWAYS AS (
+            CASE WHEN dEmi LIKE '____-__-__' THEN CAST(REPLACE(dEmi, '-', '') AS INTEGER) END
+        ) STORED,
         caminho_arquivo TEXT DEFAULT NULL,
-        xml_vazio INTEGER DEFAULT 0
+        xml_vazio INTEGER DEFAULT 0,
+        
+        -- Chave gravada ja normalizada (sem espacos nem marcador vazio): permite
+        -- as consultas de invalidos compararem com IN ('', '-') sem TRIM()
+        CHECK (cChaveNFe = TRIM(cChaveNFe) AND cChaveNFe NOT IN ('', '-'))
     )
 """
 
@@ -168,8 +207,221 @@ SCHEMA_NOTAS_INSERT = """
 # Para compatibilidade retroativa
 SCHEMA_NOTAS = SCHEMA_NOTAS_INSERT  # Mantém referência antiga
 
-# Estado global para rate limiting assíncrono
-_ultima_chamada_async = 0.0
+# Expressão da coluna gerada anomesdia (YYYYMMDD a partir do dEmi ISO), a mesma
+# dos schemas acima; usada para migrar bancos antigos que não têm a coluna
+_SQL_ANOMESDIA_GERADA = "CASE WHEN dEmi LIKE '____-__-__' THEN CAST(REPLACE(dEmi, '-', '') AS INTEGER) END"
+
+# Tamanho dos caches (lru_cache) das funcões de data: uma entrada por dia/formato distinto
+CACHE_DATAS_MAXSIZE: int = 8192
+
+# Pastas de dia cujas varreduras de XMLs ficam em cache (gerar_xml_path*)
+CACHE_PASTAS_XML_MAXSIZE: int = 512
+
+# XMLs com menos bytes que isso são marcados como vazios (xml_vazio = 1)
+TAMANHO_MINIMO_XML: int = 100
+
+# Linhas lidas por fetchmany() nas consultas em streaming
+TAMANHO_BLOCO_CURSOR: int = 1000
+
+# Tamanho do cache de statements preparados por conexão (padrão sqlite3: 128)
+SQLITE_CACHED_STATEMENTS: int = 256
+
+# Parametros por comando aceitos por qualquer SQLite (SQLITE_MAX_VARIABLE_NUMBER antes do 3.32)
+SQLITE_MAX_VARIAVEIS: int = 999
+
+# INSERT OR IGNORE de varias notas por comando (salvar_varias_notas): prefixo e grupo
+# VALUES derivados de SCHEMA_NOTAS_INSERT, linhas por comando limitadas pelos parametros
+_SQL_INSERT_NOTAS_PREFIXO, _SQL_INSERT_NOTAS_GRUPO = (
+    parte.strip() for parte in SCHEMA_NOTAS_INSERT.replace("INSERT INTO", "INSERT OR IGNORE INTO").rsplit("VALUES", 1)
+)
+LINHAS_POR_INSERT: int = SQLITE_MAX_VARIAVEIS // _SQL_INSERT_NOTAS_GRUPO.count("?")
+
+# Colunas lidas por padrão no reprocessamento de invalidos (use ("*",) para todas)
+COLUNAS_MINIMAS: Tuple[str, ...] = ('cChaveNFe', 'dEmi', 'nNF', 'xml_baixado')
+
+# Indices secundarios em dEmi removidos e recriados em cargas grandes (inserir_notas_batch).
+# O indice UNIQUE de cChaveNFe permanece: ele garante o INSERT OR IGNORE.
+INDICES_RECRIADOS_NA_CARGA: Tuple[str, ...] = (
+    'idx_xml_baixado_dEmi', 'idx_dEmi_baixado', 'idx_dEmi_nNF',
+    'idx_data_emissao', 'idx_notas_data', 'idx_notas_pendentes',
+)
+
+# A partir deste volume recriar os indices custa menos que mantê-los linha a linha
+LIMIAR_RECRIAR_INDICES: int = 50_000
+
+# Consultas SQL estáticas (texto fixo permite reuso do cache de statements)
+_Q_ALL_PENDENTES = """
+    SELECT nIdNF, cChaveNFe, dEmi, cnpj_cpf, cRazao
+    FROM notas
+    WHERE xml_baixado = 0
+    ORDER BY dEmi, nNF
+"""
+
+# Filtro por datas via JOIN com tabela temporária (evita IN (...) dinâmico)
+_Q_PENDENTES_IN_DATES_TEMPLATE = """
+    SELECT n.nIdNF, n.cChaveNFe, n.dEmi, n.cnpj_cpf, n.cRazao
+    FROM notas n
+    JOIN temp._dias_filtro d ON d.dia = n.dEmi
+    WHERE n.xml_baixado = 0
+    ORDER BY n.dEmi, n.nNF
+"""
+
+_Q_REPROCESSAR_POR_DIAS_TEMPLATE = """
+    SELECT {colunas} FROM notas n
+    JOIN temp._dias_filtro d ON d.dia = n.dEmi
+    WHERE n.xml_baixado = 0
+    ORDER BY n.dEmi, n.nNF
+"""
+
+_Q_REPROCESSAR_CONTAGEM_POR_DIA = """
+    SELECT n.dEmi, COUNT(*) FROM notas n
+    JOIN temp._dias_filtro d ON d.dia = n.dEmi
+    WHERE n.xml_baixado = 0
+    GROUP BY n.dEmi
+    ORDER BY n.dEmi
+"""
+
+_Q_LIMPAR_POR_DIAS = """
+    DELETE FROM notas
+    WHERE xml_baixado = 0 AND dEmi IN (SELECT dia FROM temp._dias_filtro)
+"""
+
+_Q_FILTRADOS_BASE = """
+    SELECT nIdNF, cChaveNFe, dEmi, nNF
+    FROM notas
+    WHERE xml_baixado = 0
+"""
+
+_Q_FILTRADOS_ORDER = " ORDER BY dEmi, nNF"
+
+_Q_ATUALIZAR_STATUS_XML = """
+    UPDATE notas
+    SET xml_baixado = 1, caminho_arquivo = ?, xml_vazio = ?
+    WHERE cChaveNFe = ?
+"""
+
+# Nome de tabela aceito em SQL montado por f-string (validar_parametros_banco):
+# identificador ASCII, sem começar por digito, até 63 caracteres
+_PADRAO_NOME_TABELA = re.compile(r'[A-Za-z_][A-Za-z0-9_]{0,62}')
+
+# Registros com campos essenciais invalidos (chave, data de emissoo ou numero ausentes)
+# Condicões de invalidade por coluna. O texto de cada uma é identico ao WHERE do
+# indice parcial correspondente (_INDICES_INVALIDOS): so assim o planejador os usa.
+# Sem TRIM(): transformar_em_tuple grava os campos ja sem espacos (vazio vira NULL)
+_SQL_INVALIDO_CHAVE = "(cChaveNFe IS NULL OR cChaveNFe IN ('', '-'))"
+_SQL_INVALIDO_DEMI = "(dEmi IS NULL OR dEmi IN ('', '-'))"
+_SQL_INVALIDO_NNF = "(nNF IS NULL OR nNF IN ('', '-'))"
+
+_SQL_INVALIDOS_WHERE = f"({_SQL_INVALIDO_CHAVE} OR {_SQL_INVALIDO_DEMI} OR {_SQL_INVALIDO_NNF})"
+
+# OR entre colunas obriga varredura completa; a UNION de uma perna por coluna
+# permite que cada perna leia apenas o seu indice parcial (minusculo)
+_SQL_INVALIDOS_ROWIDS = f"""
+    SELECT rowid FROM notas WHERE {_SQL_INVALIDO_CHAVE}
+    UNION
+    SELECT rowid FROM notas WHERE {_SQL_INVALIDO_DEMI}
+    UNION
+    SELECT rowid FROM notas WHERE {_SQL_INVALIDO_NNF}
+"""
+
+# Indices parciais cobrindo apenas as linhas invalidas (nome -> condicoo)
+_INDICES_INVALIDOS: Dict[str, Tuple[str, str]] = {
+    'idx_notas_invalido_chave': ('cChaveNFe', _SQL_INVALIDO_CHAVE),
+    'idx_notas_invalido_demi': ('dEmi', _SQL_INVALIDO_DEMI),
+    'idx_notas_invalido_nnf': ('nNF', _SQL_INVALIDO_NNF),
+}
+
+# Pendentes na ordem da verificacoo (anomesdia DESC, cChaveNFe) com as colunas
+# lidas: consulta respondida só pelo índice, sem ordenacoo. xml_baixado no fim
+# para o SQLite (< 3.45) considerar o índice parcial como cobertura
+_SQL_INDICE_PENDENTES_COVER = (
+    "CREATE INDEX IF NOT EXISTS idx_pendentes_cover ON {table}"
+    "(anomesdia DESC, cChaveNFe, nNF, dEmi, xml_baixado) WHERE xml_baixado = 0"
+)
+
+# Comandos de criar_indices_otimizados(); {table} é o nome da tabela (validado)
+_INDICES_OTIMIZADOS: Tuple[str, ...] = (
+    # Índices simples conforme estrutura do banco
+    "CREATE INDEX IF NOT EXISTS idx_baixado ON {table}(xml_baixado)",
+    "CREATE INDEX IF NOT EXISTS idx_dEmi_baixado ON {table}(dEmi, xml_baixado)",
+    "CREATE INDEX IF NOT EXISTS idx_xml_baixado_dEmi ON {table}(xml_baixado, dEmi)",
+    "CREATE INDEX IF NOT EXISTS idx_dEmi_nNF ON {table}(dEmi, nNF)",
+    "CREATE INDEX IF NOT EXISTS idx_data_emissao ON {table}(dEmi) WHERE dEmi IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_notas_baixado ON {table}(xml_baixado)",
+    "CREATE INDEX IF NOT EXISTS idx_notas_data ON {table}(dEmi, nNF, cChaveNFe)",
+    "CREATE INDEX IF NOT EXISTS idx_notas_pendentes ON {table}(dEmi) WHERE xml_baixado = 0",
+    "CREATE INDEX IF NOT EXISTS idx_xml_vazio ON {table}(xml_vazio) WHERE xml_vazio = 1",
+    # Contagens de baixados/vazios sem ler a tabela (índice de cobertura)
+    "CREATE INDEX IF NOT EXISTS idx_baixado_vazio ON {table}(xml_baixado, xml_vazio)",
+    *(
+        f"CREATE INDEX IF NOT EXISTS {nome} ON {{table}}({coluna}) WHERE {condicao}"
+        for nome, (coluna, condicao) in _INDICES_INVALIDOS.items()
+    ),
+    
+    # Índices para a coluna anomesdia (YYYYMMDD)
+    "CREATE INDEX IF NOT EXISTS idx_anomesdia ON {table}(anomesdia)",
+    "CREATE INDEX IF NOT EXISTS idx_anomesdia_baixado ON {table}(anomesdia, xml_baixado)",
+    
+    # Pendentes (anomesdia DESC, cChaveNFe), cobrindo as colunas lidas
+    _SQL_INDICE_PENDENTES_COVER,
+    # Substituido por idx_pendentes_cover
+    "DROP INDEX IF EXISTS idx_anomesdia_pendentes",
+)
+
+# cChaveNFe é PRIMARY KEY (índice único implícito): os índices extras só sobre
+# essa coluna, criados por versões anteriores, apenas custam escrita. Removidos
+# somente quando a tabela tem de fato essa chave primaria
+_INDICES_CHAVE_REDUNDANTES: Tuple[str, ...] = tuple(
+    f"DROP INDEX IF EXISTS {nome}"
+    for nome in ("idx_{table}_chave", "idx_chave", "idx_chave_nfe", "idx_chave_nfe_otim")
+)
+
+# Normalizacoo de data para YYYY-MM-DD em SQL (dd/mm/yyyy, yyyymmdd e ISO); NULL se desconhecido.
+# {valor} é a coluna ou parametro normalizado
+_SQL_DATA_NORMALIZADA_TEMPLATE = """
+    CASE
+        WHEN TRIM({valor}) GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]'
+            THEN substr(TRIM({valor}), 7, 4) || '-' || substr(TRIM({valor}), 4, 2) || '-' || substr(TRIM({valor}), 1, 2)
+        WHEN TRIM({valor}) GLOB '[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]'
+            THEN substr(TRIM({valor}), 1, 4) || '-' || substr(TRIM({valor}), 5, 2) || '-' || substr(TRIM({valor}), 7, 2)
+        WHEN TRIM({valor}) GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+            THEN TRIM({valor})
+    END
+"""
+_SQL_DEMI_NORMALIZADO = _SQL_DATA_NORMALIZADA_TEMPLATE.format(valor="dEmi")
+
+# dEmi lido do XML (?1) normalizado no proprio UPDATE; norm_data() só para formatos
+# que o CASE noo reconhece (COALESCE noo avalia o fallback quando o CASE resolve)
+_Q_ATUALIZAR_DEMI = f"""
+    UPDATE notas
+    SET dEmi = COALESCE({_SQL_DATA_NORMALIZADA_TEMPLATE.format(valor="?1")}, norm_data(?1))
+    WHERE cChaveNFe = ?2
+"""
+
+# Resumo dos invalidos numa unica consulta: (total, dias distintos, amostra de chaves).
+# A CTE usada tres vezes é materializada uma unica vez pelo SQLite; so o total e duas
+# strings agregadas (group_concat) cruzam para o Python. norm_data() (normalizar_data
+# registrada via _registrar_funcoes_sqlite) so e chamada para formatos que o CASE noo reconhece
+_Q_INVALIDOS_RESUMO = f"""
+    WITH invalidos(id) AS ({_SQL_INVALIDOS_ROWIDS})
+    SELECT
+        (SELECT COUNT(*) FROM invalidos),
+        (
+            SELECT group_concat(dia) FROM (
+                SELECT DISTINCT COALESCE({_SQL_DEMI_NORMALIZADO}, norm_data(dEmi)) AS dia
+                FROM notas
+                WHERE rowid IN (SELECT id FROM invalidos)
+                  AND dEmi IS NOT NULL AND dEmi NOT IN ('', '-')
+            )
+        ),
+        (
+            SELECT group_concat(cChaveNFe) FROM (
+                SELECT cChaveNFe FROM notas
+                WHERE rowid IN (SELECT id FROM invalidos) AND cChaveNFe IS NOT NULL
+                LIMIT 10
+            )
+        )
+"""
 
 # =============================================================================
 # CLASSES E DATACLASSES
@@ -178,17 +430,39 @@ _ultima_chamada_async = 0.0
 class DatabaseConfig:
     """Configuração personalizada para banco de dados SQLite."""
     
-    cache_size: str = "-64000"  # 64MB cache
+    cache_size: str = "-65536"  # 64MB cache
     mmap_size: str = "268435456"  # 256MB memory-mapped
     journal_mode: str = "WAL"
     synchronous: str = "NORMAL"
     temp_store: str = "MEMORY"
+    wal_autocheckpoint: str = "1000"  # Páginas no WAL antes do checkpoint automático
+    locking_mode: str = "NORMAL"
     timeout: int = 30  # Timeout em segundos
     
+    @classmethod
+    def exclusive(cls, **kwargs) -> "DatabaseConfig":
+        """
+        Configuração com locking_mode=EXCLUSIVE, para fases de escrita de um único processo.
+        
+        A conexão mantém o lock do arquivo entre transacões, sem adquirir e
+        liberar a cada commit; outras conexões ficam bloqueadas até ela fechar.
+        Não usar em conexões compartilhadas (pool por thread).
+        
+        Args:
+            **kwargs: Demais campos de DatabaseConfig
+            
+        Returns:
+            DatabaseConfig: Configuração com lock exclusivo
+        """
+        return cls(locking_mode="EXCLUSIVE", **kwargs)
+    
     def get_pragmas(self) -> Dict[str, str]:
         """
         Retorna dicionário com os PRAGMAs de configuração do banco.
         
+        busy_timeout é derivado de `timeout`, para que o PRAGMA aplicado após
+        o connect não reduza a espera configurada em sqlite3.connect().
+        
         Returns:
             Dict[str, str]: PRAGMAs de configuração
         """
@@ -197,7 +471,10 @@ class DatabaseConfig:
             "mmap_size": self.mmap_size,
             "journal_mode": self.journal_mode,
             "synchronous": self.synchronous,
-            "temp_store": self.temp_store
+            "temp_store": self.temp_store,
+            "busy_timeout": str(int(self.timeout * 1000)),
+            "wal_autocheckpoint": self.wal_autocheckpoint,
+            "locking_mode": self.locking_mode
         }
 
 
@@ -229,6 +506,206 @@ class RegistroInvalidoError(ValueError):
 # =============================================================================
 # CONSULTA E MANIPULAÇÃO DE REGISTROS
 # =============================================================================
+def _carregar_dias_filtro(conn: sqlite3.Connection, dias: List[str]) -> None:
+    """
+    Carrega datas na tabela temporaria temp._dias_filtro da conexao.
+
+    Permite filtrar por lista variavel de datas com JOIN em SQL de texto
+    fixo, em vez de montar um IN (...) com numero variavel de placeholders.
+
+    Args:
+        conn: Conexao SQLite ativa
+        dias: Datas ja normalizadas (formato do banco)
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _dias_filtro (dia TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM temp._dias_filtro")
+    conn.executemany(
+        "INSERT OR IGNORE INTO temp._dias_filtro (dia) VALUES (?)",
+        ((dia,) for dia in dias)
+    )
+
+
+@lru_cache(maxsize=32)
+def _sql_reprocessar_por_dias(colunas: Tuple[str, ...]) -> str:
+    """
+    Monta (e memoriza) o SELECT de reprocessamento para a lista de colunas.
+    
+    Cada conjunto de colunas gera sempre o mesmo texto SQL, preservando o
+    acerto no cache de statements da conexão.
+    
+    Raises:
+        ValueError: Se algum nome de coluna noo for um identificador valido
+    """
+    if colunas == ('*',):
+        return _Q_REPROCESSAR_POR_DIAS_TEMPLATE.format(colunas="n.*")
+    invalidas = [coluna for coluna in colunas if not coluna.isidentifier()]
+    if not colunas or invalidas:
+        raise ValueError(f"Colunas invalidas para reprocessamento: {invalidas or colunas}")
+    return _Q_REPROCESSAR_POR_DIAS_TEMPLATE.format(
+        colunas=", ".join(f"n.{coluna}" for coluna in colunas)
+    )
+
+
+@lru_cache(maxsize=32)
+def _sql_notas_por_data_numero(colunas: Tuple[str, ...]) -> str:
+    """
+    Monta (e memoriza) o SELECT ordenado por dEmi, nNF para a lista de colunas.
+    
+    Raises:
+        ValueError: Se algum nome de coluna noo for um identificador valido
+    """
+    invalidas = [coluna for coluna in colunas if not coluna.isidentifier()]
+    if not colunas or invalidas:
+        raise ValueError(f"Colunas invalidas para listagem: {invalidas or colunas}")
+    return f"SELECT {', '.join(colunas)} FROM notas ORDER BY dEmi ASC, nNF ASC"
+
+
+def _configurar_conexao(conn: sqlite3.Connection) -> None:
+    """
+    Aplica os PRAGMAs por conexão (SQLITE_PRAGMAS_CONEXAO).
+
+    journal_mode e page_size são persistentes no arquivo e ficam a cargo
+    de iniciar_db(); aqui entram apenas os ajustes que se perdem ao fechar.
+    Qualquer trace callback é removido explicitamente: com ele ativo, cada
+    statement executado gera uma chamada Python extra.
+    
+    Os PRAGMAs vão num unico executescript (_SCRIPT_PRAGMAS_CONEXAO). Como
+    executescript faz COMMIT de transacoo pendente, chame logo após o connect.
+
+    Args:
+        conn: Conexão SQLite recém-aberta
+    """
+    conn.set_trace_callback(None)
+    conn.executescript(_SCRIPT_PRAGMAS_CONEXAO)
+
+
+# Conexões reutilizaveis por thread (uma por banco), fechadas no encerramento do processo
+_conexoes_thread = local()
+_conexoes_abertas: List[sqlite3.Connection] = []
+_conexoes_lock = Lock()
+_bancos_otimizados: set = set()
+_bancos_analisados: set = set()
+
+
+def _obter_conexao(db_path: str) -> sqlite3.Connection:
+    """
+    Retorna a conexão da thread atual para o banco, abrindo-a na primeira chamada.
+
+    A conexão é aberta e configurada (_configurar_conexao) uma unica vez por
+    thread e reutilizada nas chamadas seguintes, evitando o custo de abrir o
+    arquivo e reaplicar PRAGMAs a cada operacoo. Use `with conn:` para delimitar
+    transacões; a conexão noo deve ser fechada pelo chamador.
+
+    Args:
+        db_path: Caminho para o arquivo do banco SQLite
+
+    Returns:
+        sqlite3.Connection: Conexão configurada, exclusiva da thread atual
+    """
+    conexoes = getattr(_conexoes_thread, "por_banco", None)
+    if conexoes is None:
+        conexoes = _conexoes_thread.por_banco = {}
+    
+    conn = conexoes.get(db_path)
+    if conn is None:
+        # check_same_thread=False apenas para permitir o fechamento no atexit (thread principal)
+        conn = sqlite3.connect(
+            db_path,
+            cached_statements=SQLITE_CACHED_STATEMENTS,
+            check_same_thread=False
+        )
+        _configurar_conexao(conn)
+        _registrar_funcoes_sqlite(conn)
+        # Primeiro uso do banco neste processo: índice de reprocessamento e ANALYZE
+        # das tabelas que ainda não têm estatísticas
+        if db_path not in _bancos_otimizados:
+            _bancos_otimizados.add(db_path)
+            _garantir_indices_consulta(conn)
+            try:
+                conn.execute("PRAGMA analysis_limit = 400")
+                conn.execute("PRAGMA optimize = 0x10002")
+            except sqlite3.Error as e:
+                logger.debug(f"[DB] Aviso ao executar PRAGMA optimize inicial: {e}")
+        conexoes[db_path] = conn
+        with _conexoes_lock:
+            _conexoes_abertas.append(conn)
+    
+    return conn
+
+
+def _garantir_indices_consulta(conn: sqlite3.Connection) -> None:
+    """
+    Garante os índices usados pelas consultas de reprocessamento e de invalidos.
+
+    - idx_xml_baixado_dEmi: filtros `xml_baixado = 0 AND dEmi IN (...)` viram
+      range scan no índice em vez de varrer a tabela.
+    - _INDICES_INVALIDOS: índices parciais que contêm apenas as linhas
+      invalidas; cada perna de _SQL_INVALIDOS_ROWIDS lê só o seu.
+    - idx_pendentes_cover: índice parcial (xml_baixado = 0) na ordem
+      anomesdia DESC, cChaveNFe; leituras e contagens de pendentes não varrem
+      a tabela. Criado apenas quando a tabela tem a coluna anomesdia.
+
+    Na criação, executa ANALYZE para o planejador conhecer a seletividade.
+
+    Args:
+        conn: Conexão SQLite ativa
+    """
+    indices = {'idx_xml_baixado_dEmi': "CREATE INDEX IF NOT EXISTS idx_xml_baixado_dEmi ON notas(xml_baixado, dEmi)"}
+    for nome, (coluna, condicao) in _INDICES_INVALIDOS.items():
+        indices[nome] = f"CREATE INDEX IF NOT EXISTS {nome} ON notas({coluna}) WHERE {condicao}"
+    
+    try:
+        colunas = {linha[1] for linha in conn.execute("PRAGMA table_xinfo(notas)")}
+        if 'anomesdia' in colunas:
+            indices['idx_pendentes_cover'] = _SQL_INDICE_PENDENTES_COVER.format(table='notas')
+        
+        existentes = {
+            nome for (nome,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        }
+        faltantes = [nome for nome in indices if nome not in existentes]
+        if faltantes:
+            for nome in faltantes:
+                conn.execute(indices[nome])
+            conn.execute("ANALYZE notas")
+            conn.commit()
+            logger.info(f"[ÍNDICE] Índices criados e estatísticas atualizadas: {faltantes}")
+    except sqlite3.Error as e:
+        logger.debug(f"[ÍNDICE] Aviso ao garantir índices de consulta: {e}")
+
+
+def _otimizar_conexao(conn: sqlite3.Connection) -> None:
+    """
+    Executa PRAGMA optimize antes de fechar a conexão.
+
+    Atualiza sqlite_stat1 apenas para as tabelas/índices que as consultas da
+    conexão indicaram como desatualizados. analysis_limit limita o custo do
+    ANALYZE em versões do SQLite anteriores à 3.46 (que não o limitam sozinhas).
+
+    Args:
+        conn: Conexão SQLite prestes a ser fechada
+    """
+    try:
+        conn.execute("PRAGMA analysis_limit = 400")
+        conn.execute("PRAGMA optimize")
+    except sqlite3.Error as e:
+        logger.debug(f"[DB] Aviso ao executar PRAGMA optimize: {e}")
+
+
+def _fechar_conexoes() -> None:
+    """Fecha as conexões reutilizaveis, executando PRAGMA optimize antes de cada fechamento."""
+    with _conexoes_lock:
+        while _conexoes_abertas:
+            conn = _conexoes_abertas.pop()
+            _otimizar_conexao(conn)
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.debug(f"[DB] Aviso ao fechar conexão: {e}")
+
+
+atexit.register(_fechar_conexoes)
+
+
 def obter_registros_pendentes(db_path: str, dias_filtrar: Optional[List[str]] = None) -> List[Tuple]:
     """
     Obtem registros de notas fiscais pendentes de download do banco SQLite.
@@ -257,10 +734,9 @@ def obter_registros_pendentes(db_path: str, dias_filtrar: Optional[List[str]] =
         >>> registros_filtrados = obter_registros_pendentes("omie.db", ["17/07/2025", "18/07/2025"])
     """
     try:
-        with sqlite3.connect(db_path) as conn:
+        with sqlite3.connect(db_path, cached_statements=SQLITE_CACHED_STATEMENTS) as conn:
             # Otimizacões de performance SQLite
-            for pragma, valor in SQLITE_PRAGMAS.items():
-                conn.execute(f"PRAGMA {pragma}={valor}")
+            _configurar_conexao(conn)
             
             # Criacoo de indices para otimizacoo de consultas
             conn.execute("CREATE INDEX IF NOT EXISTS idx_xml_baixado ON notas (xml_baixado)")
@@ -283,27 +759,14 @@ def obter_registros_pendentes(db_path: str, dias_filtrar: Optional[List[str]] =
                     logger.warning("[PENDENTES] Nenhuma data valida fornecida para filtro")
                     return []
                 
-                # Construcoo de consulta otimizada com placeholders
-                placeholders = ','.join(['?' for _ in dias_normalizados])
-                query = f"""
-                    SELECT nIdNF, cChaveNFe, dEmi, cnpj_cpf, cRazao 
-                    FROM notas 
-                    WHERE xml_baixado = 0 AND dEmi IN ({placeholders})
-                    ORDER BY dEmi, nNF
-                """
-                
-                rows = conn.execute(query, dias_normalizados).fetchall()
+                # Datas carregadas em tabela temporaria: texto SQL permanece estatico
+                _carregar_dias_filtro(conn, dias_normalizados)
+                rows = conn.execute(_Q_PENDENTES_IN_DATES_TEMPLATE).fetchall()
                 logger.info(f"[PENDENTES] Encontrados {len(rows)} registros para os dias especificados")
-                
+
             else:
                 # Consulta para todos os registros pendentes
-                query = """
-                    SELECT nIdNF, cChaveNFe, dEmi, cnpj_cpf, cRazao 
-                    FROM notas 
-                    WHERE xml_baixado = 0
-                    ORDER BY dEmi, nNF
-                """
-                rows = conn.execute(query).fetchall()
+                rows = conn.execute(_Q_ALL_PENDENTES).fetchall()
                 logger.info(f"[PENDENTES] Encontrados {len(rows)} registros pendentes total")
             
             return rows
@@ -355,24 +818,16 @@ def obter_registros_filtrados(db_path: str, filtros: Dict[str, Any]) -> List[Tup
         return []
     
     try:
-        with sqlite3.connect(db_path) as conn:
+        with sqlite3.connect(db_path, cached_statements=SQLITE_CACHED_STATEMENTS) as conn:
             # Configurações de performance
-            for pragma, value in SQLITE_PRAGMAS.items():
-                conn.execute(f"PRAGMA {pragma} = {value}")
-            
+            _configurar_conexao(conn)
+
             # Cria índice se não existir (para performance)
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_xml_baixado_dEmi 
+                CREATE INDEX IF NOT EXISTS idx_xml_baixado_dEmi
                 ON notas(xml_baixado, dEmi)
             """)
-            
-            # Base da query
-            base_query = """
-                SELECT nIdNF, cChaveNFe, dEmi, nNF 
-                FROM notas 
-                WHERE xml_baixado = 0
-            """
-            
+
             condicoes = []
             parametros = []
             
@@ -411,14 +866,12 @@ def obter_registros_filtrados(db_path: str, filtros: Dict[str, Any]) -> List[Tup
                 parametros.append(f"%{filtros['status_especifico']}%")
                 logger.info(f"[FILTRADOS] Filtro por status: {filtros['status_especifico']}")
                 
-            # Monta query final
+            # Monta query final (fragmentos fixos: texto identico por combinacao de filtros)
             if condicoes:
-                query = base_query + " AND " + " AND ".join(condicoes)
+                query = _Q_FILTRADOS_BASE + " AND " + " AND ".join(condicoes) + _Q_FILTRADOS_ORDER
             else:
-                query = base_query
-                
-            query += " ORDER BY dEmi, nNF"
-            
+                query = _Q_FILTRADOS_BASE + _Q_FILTRADOS_ORDER
+
             rows = conn.execute(query, parametros).fetchall()
             
             logger.info(f"[FILTRADOS] Busca filtrada encontrou {len(rows)} registros")
@@ -436,6 +889,41 @@ def obter_registros_filtrados(db_path: str, filtros: Dict[str, Any]) -> List[Tup
 # PROCESSAMENTO DE REGISTROS INVÁLIDOS
 # =============================================================================
 
+def _listar_dias_invalidos(conn: sqlite3.Connection) -> List[str]:
+    """
+    Identifica registros com campos essenciais invalidos na conexão informada.
+    
+    Nucleo de marcar_registros_invalidos_e_listar_dias(), reutilizado por
+    reprocessar_invalidos() dentro da sua transacoo.
+    
+    Args:
+        conn: Conexão com norm_data registrada (_obter_conexao)
+        
+    Returns:
+        Lista ordenada de dias unicos (formato YYYY-MM-DD) dos registros invalidos
+    """
+    total_invalidos, dias_concat, amostra_concat = conn.execute(_Q_INVALIDOS_RESUMO).fetchone()
+    
+    if not total_invalidos:
+        logger.info("[INVALIDOS] Nenhum registro invalido encontrado")
+        return []
+    
+    # Normalizacoo e DISTINCT feitos no SQLite: apenas dias unicos cruzam para o Python
+    dias_afetados = sorted(dia for dia in (dias_concat or '').split(',') if dia)
+    
+    # ATUALIZAÇÃO: Registros inválidos identificados (apenas log, sem marcação)
+    # Colunas de erro foram removidas do schema
+    logger.info("[INVALIDOS] %d registros com campos inválidos identificados", total_invalidos)
+    logger.info("[INVALIDOS] Datas afetadas: %s", dias_afetados)
+    
+    # Log adicional para debugging (amostra limitada evita spam no log)
+    if logger.isEnabledFor(logging.DEBUG):
+        amostra = amostra_concat.split(',') if amostra_concat else []
+        logger.debug("[INVALIDOS] Chaves identificadas (amostra): %s", amostra)
+    
+    return dias_afetados
+
+
 def marcar_registros_invalidos_e_listar_dias(db_path: str) -> List[str]:
     """
     Marca registros com campos essenciais invalidos e retorna dias afetados.
@@ -467,87 +955,118 @@ def marcar_registros_invalidos_e_listar_dias(db_path: str) -> List[str]:
         >>> dias = marcar_registros_invalidos_e_listar_dias("omie.db")
         >>> # ['2025-07-17', '2025-07-18']
     """
-    dias_afetados = set()
-    
     try:
-        with sqlite3.connect(db_path) as conn:
-            # Configuracões de performance
-            for pragma, valor in SQLITE_PRAGMAS.items():
-                conn.execute(f"PRAGMA {pragma}={valor}")
-            
-            cursor = conn.cursor()
-            
-            # Query para identificar registros com campos essenciais invalidos
-            query_invalidos = """
-                SELECT cChaveNFe, dEmi 
-                FROM notas
-                WHERE (
-                    cChaveNFe IS NULL OR TRIM(cChaveNFe) = '' OR cChaveNFe = '-'
-                    OR dEmi IS NULL OR TRIM(dEmi) = '' OR dEmi = '-'
-                    OR nNF IS NULL OR TRIM(nNF) = '' OR nNF = '-'
-                )
-            """
-            
-            cursor.execute(query_invalidos)
-            registros_invalidos = cursor.fetchall()
-            
-            if not registros_invalidos:
-                logger.info("[INVALIDOS] Nenhum registro invalido encontrado")
-                return []
-            
-            # Extracoo e normalizacoo das datas dos registros invalidos
-            chaves_invalidas = []
-            for chave, data_emissao in registros_invalidos:
-                if chave:
-                    chaves_invalidas.append(chave)
-                
-                # Normalizacoo da data de emissoo
-                if data_emissao:
-                    try:
-                        data_normalizada = normalizar_data(str(data_emissao).strip())
-                        if data_normalizada:
-                            dias_afetados.add(data_normalizada)
-                    except Exception as e:
-                        logger.warning(f"[INVALIDOS] Erro ao normalizar data '{data_emissao}': {e}")
-            
-            # Marcacoo dos registros como invalidos
-            if chaves_invalidas:
-                # ATUALIZAÇÃO: Registros inválidos identificados (apenas log, sem marcação)
-                # Colunas de erro foram removidas do schema
-                logger.info(f"[INVALIDOS] {len(chaves_invalidas)} registros com campos inválidos identificados")
-                logger.info(f"[INVALIDOS] Datas afetadas: {sorted(dias_afetados)}")
-                
-                # Log adicional para debugging
-                if len(chaves_invalidas) <= 10:  # Evita spam no log
-                    logger.debug(f"[INVALIDOS] Chaves identificadas: {chaves_invalidas}")
-            else:
-                logger.info("[INVALIDOS] Nenhum registro inválido encontrado")
-            
-            return sorted(dias_afetados)
+        conn = _obter_conexao(db_path)
+        with conn:
+            return _listar_dias_invalidos(conn)
             
     except sqlite3.Error as e:
-        logger.error(f"[INVALIDOS] Erro de banco de dados ao marcar registros invalidos: {e}")
+        logger.error("[INVALIDOS] Erro de banco de dados ao marcar registros invalidos: %s", e)
         return []
     except Exception as e:
-        logger.error(f"[INVALIDOS] Erro inesperado ao marcar registros invalidos: {e}")
+        logger.error("[INVALIDOS] Erro inesperado ao marcar registros invalidos: %s", e)
         return []
 
-def buscar_registros_invalidos_para_reprocessar(db_path: str, dias: List[str]) -> List[Dict]:
+def buscar_registros_invalidos_para_reprocessar_iter(
+    db_path: str,
+    dias: List[str],
+    como_tupla: bool = False,
+    colunas: Optional[List[str]] = None
+) -> Iterator[Union[Dict, Tuple]]:
+    """
+    Versoo em streaming de buscar_registros_invalidos_para_reprocessar().
+    
+    Produz os registros sob demanda, lendo o cursor em blocos de
+    TAMANHO_BLOCO_CURSOR linhas: a memoria usada independe do total de
+    registros e o consumidor começa a processar antes do fim da leitura.
+    A contagem por data e obtida por GROUP BY no proprio banco.
+    
+    Args:
+        db_path: Caminho absoluto para o banco SQLite
+        dias: Lista de datas (formato YYYY-MM-DD) para filtrar registros
+        como_tupla: Se True, produz namedtuples NotaRow (campos por atributo,
+                    ex.: registro.cChaveNFe) em vez de dicts — bem mais leve
+                    por linha quando o consumidor so le alguns campos
+        colunas: Colunas a ler (padrão: COLUNAS_MINIMAS); ["*"] le todas
+        
+    Yields:
+        Dict (ou NotaRow): Colunas selecionadas de cada registro invalido
+        
+    Note:
+        Usa a conexão reutilizavel da thread; consuma o iterador por completo
+        antes de chamar outra funcao deste modulo que filtre por dias.
+        
+    Examples:
+        >>> for registro in buscar_registros_invalidos_para_reprocessar_iter("omie.db", ["2025-07-17"]):
+        ...     reprocessar(registro)
+    """
+    if not dias:
+        logger.info("[REPROCESSAR] Nenhum dia fornecido para busca")
+        return
+    
+    try:
+        sql_reprocessar = _sql_reprocessar_por_dias(tuple(colunas or COLUNAS_MINIMAS))
+        conn = _obter_conexao(db_path)
+        
+        # Dias em tabela temporaria + JOIN: SQL de texto fixo (cache de statements)
+        # e sem limite de variaveis para listas grandes
+        with conn:
+            _carregar_dias_filtro(conn, dias)
+        
+        # Log estatistico por data calculado no SQLite (consulta omitida se INFO desativado)
+        if logger.isEnabledFor(logging.INFO):
+            contagem_por_data = dict(conn.execute(_Q_REPROCESSAR_CONTAGEM_POR_DIA))
+            logger.info(
+                "[REPROCESSAR] Encontrados %d registros invalidos para reprocessamento; contagem por data: %s",
+                sum(contagem_por_data.values()), contagem_por_data
+            )
+        
+        cursor = conn.cursor()
+        cursor.arraysize = TAMANHO_BLOCO_CURSOR
+        cursor.execute(sql_reprocessar)
+        
+        # Nomes das colunas lidos uma vez; cada linha vira tupla (namedtuple) ou dict
+        nomes_colunas = [descricao[0] for descricao in cursor.description]
+        if como_tupla:
+            NotaRow = namedtuple("NotaRow", nomes_colunas)
+            converter = NotaRow._make
+        else:
+            converter = lambda row: dict(zip(nomes_colunas, row))
+        
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            yield from map(converter, rows)
+            
+    except sqlite3.Error as e:
+        logger.error("[REPROCESSAR] Erro de banco de dados: %s", e)
+    except Exception as e:
+        logger.error("[REPROCESSAR] Erro inesperado ao buscar registros invalidos: %s", e)
+
+
+def buscar_registros_invalidos_para_reprocessar(
+    db_path: str,
+    dias: List[str],
+    colunas: Optional[List[str]] = None
+) -> List[Dict]:
     """
     Busca registros marcados como invalidos para reprocessamento.
     
-    Recupera dados completos de registros previamente marcados como 'INVALIDO'
-    para permitir reprocessamento completo sem perda de contexto.
+    Recupera as colunas necessarias (por padrão COLUNAS_MINIMAS) dos registros
+    invalidos para permitir o reprocessamento; ["*"] retorna todas as colunas.
+    Para grandes volumes prefira buscar_registros_invalidos_para_reprocessar_iter().
     
     Args:
         db_path: Caminho absoluto para o banco SQLite
         dias: Lista de datas (formato YYYY-MM-DD) para filtrar registros
+        colunas: Colunas a ler (padrão: COLUNAS_MINIMAS)
         
     Returns:
-        Lista de dicionarios contendo dados completos dos registros invalidos
+        Lista de dicionarios com as colunas selecionadas dos registros invalidos
         
     Caracteristicas:
-    - Conversoo automatica de Row para Dict para facilitar manipulacoo
+    - SELECT com colunas explicitas (menos dados por linha)
     - Filtragem por multiplas datas simultâneas
     - Logging detalhado de operacões
     - Tratamento robusto de erros
@@ -559,54 +1078,7 @@ def buscar_registros_invalidos_para_reprocessar(db_path: str, dias: List[str]) -
         >>> registros = buscar_registros_invalidos_para_reprocessar("omie.db", ["2025-07-17"])
         >>> # [{'cChaveNFe': '123...', 'dEmi': '2025-07-17', ...}]
     """
-    if not dias:
-        logger.info("[REPROCESSAR] Nenhum dia fornecido para busca")
-        return []
-    
-    try:
-        with sqlite3.connect(db_path) as conn:
-            # Configuracões de performance
-            for pragma, valor in SQLITE_PRAGMAS.items():
-                conn.execute(f"PRAGMA {pragma}={valor}")
-            
-            # Configuracoo para retornar dicionarios em vez de tuplas
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Construcoo da query com placeholders seguros
-            placeholders = ','.join(['?' for _ in dias])
-            query = f"""
-                SELECT * FROM notas
-                WHERE xml_baixado = 0 AND dEmi IN ({placeholders})
-                ORDER BY dEmi, nNF
-            """
-            
-            cursor.execute(query, dias)
-            rows = cursor.fetchall()
-            
-            # Conversoo para lista de dicionarios
-            resultados = [dict(row) for row in rows]
-            
-            logger.info(f"[REPROCESSAR] Encontrados {len(resultados)} registros invalidos para reprocessamento")
-            
-            if resultados:
-                # Log estatistico por data
-                contagem_por_data = {}
-                for registro in resultados:
-                    data = registro.get('dEmi', 'N/A')
-                    contagem_por_data[data] = contagem_por_data.get(data, 0) + 1
-                
-                for data, count in contagem_por_data.items():
-                    logger.info(f"[REPROCESSAR] Data {data}: {count} registros")
-            
-            return resultados
-            
-    except sqlite3.Error as e:
-        logger.error(f"[REPROCESSAR] Erro de banco de dados: {e}")
-        return []
-    except Exception as e:
-        logger.error(f"[REPROCESSAR] Erro inesperado ao buscar registros invalidos: {e}")
-        return []
+    return list(buscar_registros_invalidos_para_reprocessar_iter(db_path, dias, colunas=colunas))
 
 
 def limpar_registros_invalidos_reprocessados(db_path: str, dias: List[str]) -> int:
@@ -642,40 +1114,89 @@ def limpar_registros_invalidos_reprocessados(db_path: str, dias: List[str]) -> i
         return 0
     
     try:
-        with sqlite3.connect(db_path) as conn:
-            # Configuracões de performance
-            for pragma, valor in SQLITE_PRAGMAS.items():
-                conn.execute(f"PRAGMA {pragma}={valor}")
-            
+        conn = _obter_conexao(db_path)
+        with conn:
             cursor = conn.cursor()
             
-            # Construcoo da query de remocoo com placeholders seguros
-            placeholders = ','.join(['?' for _ in dias])
-            query = f"""
-                DELETE FROM notas 
-                WHERE xml_baixado = 0 AND dEmi IN ({placeholders})
-            """
-            
-            cursor.execute(query, dias)
+            # Dias em tabela temporaria; remocoo numa unica transacoo (bloco `with conn`)
+            _carregar_dias_filtro(conn, dias)
+            cursor.execute(_Q_LIMPAR_POR_DIAS)
             registros_removidos = cursor.rowcount
-            conn.commit()
             
             if registros_removidos > 0:
-                logger.info(f"[LIMPEZA] {registros_removidos} registros invalidos removidos com sucesso")
-                logger.info(f"[LIMPEZA] Dias processados: {dias}")
+                logger.info("[LIMPEZA] %d registros invalidos removidos com sucesso", registros_removidos)
+                logger.info("[LIMPEZA] Dias processados: %s", dias)
             else:
                 logger.info("[LIMPEZA] Nenhum registro invalido encontrado para remocoo")
             
             return registros_removidos
             
     except sqlite3.Error as e:
-        logger.error(f"[LIMPEZA] Erro de banco de dados durante limpeza: {e}")
+        logger.error("[LIMPEZA] Erro de banco de dados durante limpeza: %s", e)
         return 0
     except Exception as e:
-        logger.error(f"[LIMPEZA] Erro inesperado durante limpeza: {e}")
+        logger.error("[LIMPEZA] Erro inesperado durante limpeza: %s", e)
         return 0
 
 
+def reprocessar_invalidos(
+    db_path: str,
+    colunas: Optional[List[str]] = None
+) -> Tuple[List[Dict], int]:
+    """
+    Executa identificacoo, busca e limpeza de registros invalidos numa unica transacoo.
+    
+    Equivale a encadear marcar_registros_invalidos_e_listar_dias(),
+    buscar_registros_invalidos_para_reprocessar() e
+    limpar_registros_invalidos_reprocessados(), porem com uma conexão, um
+    BEGIN IMMEDIATE e um unico commit: snapshot consistente entre as etapas
+    e apenas um fsync. Em caso de erro nada é removido (rollback).
+    
+    Args:
+        db_path: Caminho absoluto para o banco SQLite
+        colunas: Colunas a ler (padrão: COLUNAS_MINIMAS); ["*"] le todas
+        
+    Returns:
+        Tupla (registros removidos para reprocessamento, quantidade removida).
+        Os registros são dicts com as colunas selecionadas.
+        
+    Examples:
+        >>> registros, removidos = reprocessar_invalidos("omie.db")
+        >>> salvar_varias_notas(registros_corrigidos, "omie.db")
+    """
+    try:
+        sql_reprocessar = _sql_reprocessar_por_dias(tuple(colunas or COLUNAS_MINIMAS))
+        conn = _obter_conexao(db_path)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            dias = _listar_dias_invalidos(conn)
+            if not dias:
+                conn.commit()
+                return [], 0
+            
+            _carregar_dias_filtro(conn, dias)
+            cursor = conn.execute(sql_reprocessar)
+            nomes_colunas = [descricao[0] for descricao in cursor.description]
+            registros = [dict(zip(nomes_colunas, row)) for row in cursor]
+            
+            registros_removidos = conn.execute(_Q_LIMPAR_POR_DIAS).rowcount
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        
+        logger.info("[REPROCESSAR] %d registros invalidos obtidos para reprocessamento", len(registros))
+        logger.info("[LIMPEZA] %d registros invalidos removidos (%d dia(s))", registros_removidos, len(dias))
+        return registros, registros_removidos
+        
+    except sqlite3.Error as e:
+        logger.error("[REPROCESSAR] Erro de banco de dados no reprocessamento de invalidos: %s", e)
+        return [], 0
+    except Exception as e:
+        logger.error("[REPROCESSAR] Erro inesperado no reprocessamento de invalidos: %s", e)
+        return [], 0
+
+
 # Mantém compatibilidade retroativa com nome antigo
 remover_registros_sem_dEmi_e_listar_dias = marcar_registros_invalidos_e_listar_dias
 
@@ -683,6 +1204,7 @@ remover_registros_sem_dEmi_e_listar_dias = marcar_registros_invalidos_e_listar_d
 # VALIDAÇÃO E NORMALIZAÇÃO DE DADOS
 # =============================================================================
 
+@lru_cache(maxsize=CACHE_DATAS_MAXSIZE)
 def normalizar_data(data: Optional[str]) -> Optional[str]:
     """
     Normaliza datas para formato ISO padroo (YYYY-MM-DD).
@@ -719,6 +1241,21 @@ def normalizar_data(data: Optional[str]) -> Optional[str]:
     if not data_limpa:
         return None
     
+    # Caminho rapido: formatos fixos resolvidos por fatiamento, sem strptime
+    ano = mes = dia = None
+    tamanho = len(data_limpa)
+    if tamanho == 10:
+        if data_limpa[4] == "-" and data_limpa[7] == "-":
+            ano, mes, dia = data_limpa[:4], data_limpa[5:7], data_limpa[8:]
+        elif data_limpa[2] == "/" and data_limpa[5] == "/":
+            ano, mes, dia = data_limpa[6:], data_limpa[3:5], data_limpa[:2]
+    elif tamanho == 8 and data_limpa.isdigit():
+        ano, mes, dia = data_limpa[:4], data_limpa[4:6], data_limpa[6:]
+    
+    # Dias 29-31 seguem para strptime (validacoo de calendario completa)
+    if ano and (ano + mes + dia).isdecimal() and 1 <= int(mes) <= 12 and 1 <= int(dia) <= 28:
+        return f"{ano}-{mes}-{dia}"
+    
     try:
         # Formato brasileiro dd/mm/yyyy
         if "/" in data_limpa:
@@ -747,6 +1284,7 @@ def normalizar_data(data: Optional[str]) -> Optional[str]:
         return None
 
 
+@lru_cache(maxsize=CACHE_DATAS_MAXSIZE)
 def formatar_data_iso_para_br(data: Optional[str]) -> Optional[str]:
     """
     Converte data ISO (YYYY-MM-DD) para formato brasileiro (dd/mm/YYYY).
@@ -775,6 +1313,7 @@ def formatar_data_iso_para_br(data: Optional[str]) -> Optional[str]:
         return data
 
 
+@lru_cache(maxsize=CACHE_DATAS_MAXSIZE)
 def validar_data_formato(data: str, formato: str) -> bool:
     """
     Valida se uma data esta no formato especificado.
@@ -804,6 +1343,46 @@ def validar_data_formato(data: str, formato: str) -> bool:
         logger.warning(f"[DATA] Erro na validacoo de formato: {e}")
         return False
 
+
+def _aquecer_cache_datas() -> None:
+    """
+    Pre-carrega os caches de datas com as variantes da data atual.
+
+    A data do dia e a mais frequente nas execucões incrementais do pipeline.
+    """
+    hoje = datetime.now()
+    iso = hoje.strftime("%Y-%m-%d")
+    for variante in (iso, hoje.strftime("%d/%m/%Y"), hoje.strftime("%Y%m%d")):
+        normalizar_data(variante)
+    formatar_data_iso_para_br(iso)
+    validar_data_formato(iso, "%Y-%m-%d")
+
+
+_aquecer_cache_datas()
+
+# Tabela de traducoo que remove todo caractere Latin-1 noo numerico numa unica
+# passada em C (str.translate), evitando o motor de regex nas cargas em massa
+_TABELA_SOMENTE_DIGITOS = str.maketrans('', '', ''.join(
+    chr(c) for c in range(256) if chr(c) not in '0123456789'
+))
+
+# Caminho lento de _somente_digitos (texto fora do Latin-1), compilado uma vez
+_PADRAO_NAO_DIGITO = re.compile(r'\D')
+
+
+def _somente_digitos(texto: str) -> str:
+    """
+    Mantém apenas os digitos (0-9) de uma string.
+    
+    Entradas fora do Latin-1 (raras) caem no caminho por regex para preservar
+    o tratamento de digitos Unicode.
+    """
+    resultado = texto.translate(_TABELA_SOMENTE_DIGITOS)
+    if resultado.isascii():
+        return resultado
+    return _PADRAO_NAO_DIGITO.sub('', resultado)
+
+
 def sanitizar_cnpj(valor: Union[str, int, None]) -> str:
     """
     Remove caracteres noo numericos de CNPJ ou CPF.
@@ -824,7 +1403,7 @@ def sanitizar_cnpj(valor: Union[str, int, None]) -> str:
         return ''
     
     try:
-        return re.sub(r'\D', '', str(valor))
+        return _somente_digitos(str(valor))
     except Exception as e:
         logger.warning(f"[CNPJ] Erro ao sanitizar CNPJ/CPF '{valor}': {e}")
         return ''
@@ -869,12 +1448,101 @@ def normalizar_valor_nf(valor: Union[str, float, int, None]) -> float:
 # TRANSFORMAÇÃO DE DADOS
 # =============================================================================
 
+def _texto_ou_none(valor) -> Optional[str]:
+    """Converte valor para string, tratando None e espacos."""
+    if valor is None:
+        return None
+    valor_str = str(valor).strip()
+    return valor_str if valor_str not in ('', '-', 'None') else None
+
+
+def _texto_limpo(valor) -> str:
+    """Converte valor para string sem espacos nas pontas (str ja limpa volta sem copia)."""
+    return valor.strip() if type(valor) is str else str(valor).strip()
+
+
+def _inteiro_ou_none(valor) -> Optional[int]:
+    """Converte valor para int, tratando erros."""
+    if valor is None:
+        return None
+    try:
+        return int(float(valor))  # Converte via float para tratar decimais
+    except (ValueError, TypeError):
+        logger.warning(f"[TUPLE] Valor inteiro invalido: {valor}")
+        return None
+
+
+# Especificacoo das colunas de SCHEMA_NOTAS_INSERT: (campo do registro, conversor)
+_ESPEC_TUPLA_NOTA: Tuple[Tuple[Optional[str], str], ...] = (
+    ('cChaveNFe', 'chave'),     # chave_nfe
+    ('nIdNF', 'int'),           # id_nf
+    ('nIdPedido', 'int'),       # id_pedido
+    ('dCan', 'str'),            # data_cancelamento
+    ('dEmi', 'data'),           # data_emissao
+    ('dInut', 'str'),           # data_inutilizacao
+    ('dReg', 'str'),            # data_registro
+    ('dSaiEnt', 'str'),         # data_saida_entrada
+    ('hEmi', 'str'),            # hora_emissao
+    ('hSaiEnt', 'str'),         # hora_saida_entrada
+    ('mod', 'str'),             # modelo
+    ('nNF', 'nnf'),             # numero_nf
+    ('serie', 'str'),           # serie
+    ('tpAmb', 'str'),           # tipo_ambiente
+    ('tpNF', 'str'),            # tipo_nf
+    ('cnpj_cpf', 'str'),        # cnpj_cpf
+    ('cRazao', 'str'),          # razao_social
+    ('vNF', 'float'),           # valor_nf
+    (None, 'none'),             # caminho_arquivo
+    (None, 'zero'),             # xml_baixado
+)
+
+
+def _gerar_montador_tupla_nota():
+    """
+    Gera, a partir de _ESPEC_TUPLA_NOTA, uma funcoo em linha reta que monta a tupla.
+    
+    O codigo gerado tem a forma
+    ``def _montar(r, chave, demi, nnf): return (chave, _inteiro(r.get('nIdNF')), ...)``
+    com a conversoo de texto expandida em linha (sem chamada de funcoo por campo),
+    eliminando o despacho generico por coluna no caminho mais quente da carga.
+    """
+    modelos = {
+        'chave': "chave",
+        'data': "_normalizar_data(demi)",
+        'nnf': "nnf",
+        'int': "_inteiro(r.get({campo!r}))",
+        'float': "_valor(r.get({campo!r}))",
+        'str': (
+            "(None if (v := r.get({campo!r})) is None "
+            "else (None if (v := str(v).strip()) in ('', '-', 'None') else v))"
+        ),
+        'none': "None",
+        'zero': "0",
+    }
+    expressoes = ",\n        ".join(
+        modelos[conversor].format(campo=campo) for campo, conversor in _ESPEC_TUPLA_NOTA
+    )
+    fonte = f"def _montar_tupla_nota(r, chave, demi, nnf):\n    return (\n        {expressoes},\n    )\n"
+    
+    namespace = {
+        '_inteiro': _inteiro_ou_none,
+        '_valor': normalizar_valor_nf,
+        '_normalizar_data': normalizar_data,
+    }
+    exec(compile(fonte, "<_montar_tupla_nota>", "exec"), namespace)
+    return namespace['_montar_tupla_nota']
+
+
+_montar_tupla_nota = _gerar_montador_tupla_nota()
+
+
 def transformar_em_tuple(registro: Dict) -> Tuple:
     """
     Transforma dicionario de nota fiscal em tupla para insercoo otimizada no banco.
     
     Realiza validacoo rigorosa, normalizacoo de dados e transformacoo de tipos
-    para garantir consistência e integridade dos dados no banco SQLite.
+    para garantir consistência e integridade dos dados no banco SQLite. Os campos
+    essenciais sao convertidos uma unica vez e reaproveitados na tupla.
     
     Validacões realizadas:
     - Campos essenciais obrigatorios
@@ -896,65 +1564,32 @@ def transformar_em_tuple(registro: Dict) -> Tuple:
         >>> registro = {'cChaveNFe': '123...', 'dEmi': '17/07/2025', 'nNF': '123'}
         >>> tupla = transformar_em_tuple(registro)
     """
-    # Validacoo de campos essenciais
-    campos_obrigatorios = ['cChaveNFe', 'dEmi', 'nNF']
-    campos_ausentes = [campo for campo in campos_obrigatorios if not registro.get(campo)]
-    
-    if campos_ausentes:
+    # Validacoo e conversoo dos campos essenciais numa unica passada
+    chave = registro.get('cChaveNFe')
+    chave = str(chave).strip() if chave is not None else None
+    demi = registro.get('dEmi')
+    demi = str(demi).strip() if demi is not None else None
+    nnf = registro.get('nNF')
+    nnf = str(nnf).strip() if nnf is not None else None
+    
+    if (not chave or chave in ('-', 'None')
+            or not demi or demi in ('-', 'None')
+            or not nnf or nnf in ('-', 'None')):
+        campos_ausentes = [
+            campo for campo, valor in (('cChaveNFe', chave), ('dEmi', demi), ('nNF', nnf))
+            if not valor or valor in ('-', 'None')
+        ]
         erro_msg = f"Campos obrigatorios ausentes: {campos_ausentes}"
         logger.error(f"[TUPLE] {erro_msg} no registro: {registro}")
         raise ValueError(erro_msg)
     
-    # Funcões auxiliares para conversoo segura de tipos
-    def safe_str(valor) -> Optional[str]:
-        """Converte valor para string, tratando None e espacos."""
-        if valor is None:
-            return None
-        valor_str = str(valor).strip()
-        return valor_str if valor_str not in ('', '-', 'None') else None
-    
-    def safe_int(valor) -> Optional[int]:
-        """Converte valor para int, tratando erros."""
-        if valor is None:
-            return None
-        try:
-            return int(float(valor))  # Converte via float para tratar decimais
-        except (ValueError, TypeError):
-            logger.warning(f"[TUPLE] Valor inteiro invalido: {valor}")
-            return None
-    
-    def safe_float(valor) -> float:
-        """Converte valor para float, retornando 0.0 se invalido."""
-        return normalizar_valor_nf(valor)
-    
     try:
-        # Construcoo da tupla com validacoo e conversoo de tipos
-        tupla = (
-            safe_str(registro['cChaveNFe']),                    # chave_nfe
-            safe_int(registro.get('nIdNF')),                    # id_nf
-            safe_int(registro.get('nIdPedido')),                # id_pedido
-            safe_str(registro.get('dCan')),                     # data_cancelamento
-            normalizar_data(safe_str(registro.get('dEmi'))),    # data_emissao
-            safe_str(registro.get('dInut')),                    # data_inutilizacao
-            safe_str(registro.get('dReg')),                     # data_registro
-            safe_str(registro.get('dSaiEnt')),                  # data_saida_entrada
-            safe_str(registro.get('hEmi')),                     # hora_emissao
-            safe_str(registro.get('hSaiEnt')),                  # hora_saida_entrada
-            safe_str(registro.get('mod')),                      # modelo
-            safe_str(registro.get('nNF')),                      # numero_nf
-            safe_str(registro.get('serie')),                    # serie
-            safe_str(registro.get('tpAmb')),                    # tipo_ambiente
-            safe_str(registro.get('tpNF')),                     # tipo_nf
-            safe_str(registro.get('cnpj_cpf')),                 # cnpj_cpf
-            safe_str(registro.get('cRazao')),                   # razao_social
-            safe_float(registro.get('vNF')),                    # valor_nf
-            None,                                               # caminho_arquivo
-            0                                                   # xml_baixado
-        )
+        # Construcoo da tupla pela funcoo gerada a partir de _ESPEC_TUPLA_NOTA
+        tupla = _montar_tupla_nota(registro, chave, demi, nnf)
         
         # Log de debug para registros processados
         if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(f"[TUPLE] Registro transformado: {registro['cChaveNFe']}")
+            logger.debug(f"[TUPLE] Registro transformado: {chave}")
         
         return tupla
         
@@ -964,17 +1599,249 @@ def transformar_em_tuple(registro: Dict) -> Tuple:
         raise
 
 
+def transformar_em_tuples_batch(registros: List[Dict]) -> List[Tuple]:
+    """
+    Transforma um lote de dicionarios em tuplas, processando coluna a coluna.
+    
+    Variante em lote de transformar_em_tuple(): cada coluna é convertida por
+    uma list comprehension com o conversor ja resolvido, sem recriar funcões
+    auxiliares nem repetir checagens de log por registro. As tuplas sao
+    montadas com zip() na mesma ordem de SCHEMA_NOTAS_INSERT.
+    
+    Args:
+        registros: Lista de dicionarios de notas fiscais
+        
+    Returns:
+        Lista de tuplas, na mesma ordem dos registros de entrada
+        
+    Raises:
+        ValueError: Se algum registro noo tiver os campos essenciais
+            (o chamador pode recorrer ao caminho por registro)
+        
+    Examples:
+        >>> tuplas = transformar_em_tuples_batch(registros)
+        >>> conn.executemany(SCHEMA_NOTAS_INSERT, tuplas)
+    """
+    if not registros:
+        return []
+    
+    texto = _texto_ou_none
+    inteiro = _inteiro_ou_none
+    
+    def coluna(campo: str, conversor) -> List[Any]:
+        return [conversor(registro.get(campo)) for registro in registros]
+    
+    # Campos essenciais convertidos uma unica vez e validados pela propria coluna
+    chaves = coluna('cChaveNFe', texto)
+    datas_emissao = coluna('dEmi', texto)
+    numeros_nf = coluna('nNF', texto)
+    if None in chaves or None in datas_emissao or None in numeros_nf:
+        # Sem log aqui: o caminho por registro do chamador registra o erro
+        raise ValueError("Campos obrigatorios ausentes em registro(s) do lote")
+    
+    colunas = (
+        chaves,                                                             # chave_nfe
+        coluna('nIdNF', inteiro),                                           # id_nf
+        coluna('nIdPedido', inteiro),                                       # id_pedido
+        coluna('dCan', texto),                                              # data_cancelamento
+        [normalizar_data(demi) for demi in datas_emissao],                  # data_emissao
+        coluna('dInut', texto),                                             # data_inutilizacao
+        coluna('dReg', texto),                                              # data_registro
+        coluna('dSaiEnt', texto),                                           # data_saida_entrada
+        coluna('hEmi', texto),                                              # hora_emissao
+        coluna('hSaiEnt', texto),                                           # hora_saida_entrada
+        coluna('mod', texto),                                               # modelo
+        numeros_nf,                                                         # numero_nf
+        coluna('serie', texto),                                             # serie
+        coluna('tpAmb', texto),                                             # tipo_ambiente
+        coluna('tpNF', texto),                                              # tipo_nf
+        coluna('cnpj_cpf', texto),                                          # cnpj_cpf
+        coluna('cRazao', texto),                                            # razao_social
+        coluna('vNF', normalizar_valor_nf),                                 # valor_nf
+        repeat(None),                                                       # caminho_arquivo
+        repeat(0),                                                          # xml_baixado
+    )
+    
+    return list(zip(*colunas))
+
+
 # =============================================================================
 # MANIPULAÇÃO DE ARQUIVOS E CAMINHOS
 # =============================================================================
 
+def iterar_caminhos_xml(resultado_dir: Union[str, Path]) -> Iterator[str]:
+    """
+    Percorre recursivamente um diretorio produzindo os caminhos (str) dos XMLs.
+    
+    Caminhamento iterativo com pilha sobre os.scandir(): usa o tipo ja
+    retornado pelo DirEntry (sem stat extra por arquivo) e noo cria um Path
+    por entrada. Diretorios ilegiveis sao ignorados, como no rglob().
+    
+    Args:
+        resultado_dir: Diretorio raiz da busca
+        
+    Yields:
+        str: Caminho de cada arquivo .xml encontrado
+    """
+    pendentes = deque([os.fspath(resultado_dir)])
+    while pendentes:
+        diretorio = pendentes.pop()
+        try:
+            with os.scandir(diretorio) as entradas:
+                for entrada in entradas:
+                    if entrada.is_dir(follow_symlinks=False):
+                        pendentes.append(entrada.path)
+                    elif entrada.name.endswith(('.xml', '.XML')) and entrada.is_file(follow_symlinks=False):
+                        yield entrada.path
+        except OSError as e:
+            logger.debug(f"[ARQUIVO] Diretorio ignorado na busca de XMLs ({diretorio}): {e}")
+
+
+def _varrer_primeiro_nivel(diretorio: str) -> Tuple[List[str], List[str]]:
+    """
+    Lê uma unica vez o primeiro nivel de um diretorio.
+    
+    Returns:
+        Tupla (caminhos dos XMLs no proprio diretorio, nomes das subpastas);
+        diretorio ilegivel ou inexistente resulta em listas vazias
+    """
+    xmls: List[str] = []
+    subpastas: List[str] = []
+    try:
+        with os.scandir(diretorio) as entradas:
+            for entrada in entradas:
+                if entrada.is_dir(follow_symlinks=False):
+                    subpastas.append(entrada.name)
+                elif entrada.name.endswith(('.xml', '.XML')) and entrada.is_file(follow_symlinks=False):
+                    xmls.append(entrada.path)
+    except OSError as e:
+        logger.debug(f"[ARQUIVO] Falha ao varrer pasta {diretorio}: {e}")
+    return xmls, subpastas
+
+
+def _caminhos_xml_das_subpastas(raizes: List[str]) -> List[str]:
+    """
+    Percorre subarvores disjuntas, em paralelo quando ha mais de uma.
+    
+    Cada thread recebe uma raiz propria, entoo cada diretorio continua sendo
+    lido uma unica vez; o resultado segue a ordem de raizes.
+    """
+    if len(raizes) <= 1:
+        return [caminho for raiz in raizes for caminho in iterar_caminhos_xml(raiz)]
+    
+    max_workers = min(32, (os.cpu_count() or 1) + 4, len(raizes))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resultados = executor.map(lambda raiz: list(iterar_caminhos_xml(raiz)), raizes)
+        return list(chain.from_iterable(resultados))
+
+
+def _descobrir_caminhos_xml(raiz: str) -> List[str]:
+    """Caminhos (str, como vêm do os.scandir) de todos os XMLs sob raiz."""
+    caminhos, subpastas = _varrer_primeiro_nivel(raiz)
+    caminhos.extend(_caminhos_xml_das_subpastas([os.path.join(raiz, nome) for nome in subpastas]))
+    return caminhos
+
+
 def descobrir_todos_xmls(resultado_dir: Path) -> List[Path]:
-    """Descobre todos os XMLs de forma robusta e eficiente."""
-    if not resultado_dir.exists():
-        return []
+    """Descobre todos os XMLs de forma robusta e eficiente (os.scandir, sem rglob).
+    
+    As subpastas do primeiro nivel sao percorridas em paralelo (uma thread por
+    subarvore). Diretorio inexistente resulta em lista vazia (sem exists() previo).
+    """
+    return [Path(caminho) for caminho in _descobrir_caminhos_xml(os.fspath(resultado_dir))]
+
+
+# Resultado da varredura de uma pasta de dia: lista de XMLs, indices por nome e por chave
+# e pasta (str) onde gravar XMLs novos (primeira subpasta por nome, ou a propria pasta do dia)
+_IndiceXmlsDia = namedtuple("_IndiceXmlsDia", ["todos", "por_nome", "por_chave", "pasta_criacao"])
+
+# Chave de 44 digitos ASCII no nome do arquivo (indice por chave e fallbacks de indexacoo)
+_PADRAO_CHAVE_NO_NOME = re.compile(r'[0-9]{44}')
+
+
+@lru_cache(maxsize=CACHE_PASTAS_XML_MAXSIZE)
+def _descobrir_todos_xmls_cached(pasta_dia_str: str, mtime_ns: int) -> _IndiceXmlsDia:
+    """
+    Varre uma pasta de dia uma unica vez e memoriza o resultado.
+    
+    A chave inclui o st_mtime_ns da pasta: criar ou remover entradas nela gera
+    nova varredura. Alteracões apenas dentro de subpastas noo mudam esse mtime,
+    por isso os pontos de entrada em lote chamam limpar_cache_xmls() no inicio.
+    
+    Args:
+        pasta_dia_str: Caminho da pasta do dia
+        mtime_ns: st_mtime_ns da pasta (parte da chave do cache)
+        
+    Returns:
+        _IndiceXmlsDia com a tupla de XMLs, o dict nome -> Path, o dict
+        chave (44 digitos presentes no nome) -> [Path] e a pasta de criacoo
+        (noo modificar)
+    """
+    # Primeiro nivel varrido aqui para registrar as subpastas na mesma passada
+    caminhos, subpastas = _varrer_primeiro_nivel(pasta_dia_str)
+    caminhos.extend(_caminhos_xml_das_subpastas(
+        [os.path.join(pasta_dia_str, nome) for nome in subpastas]
+    ))
+    
+    todos = tuple(Path(caminho) for caminho in caminhos)
+    pasta_criacao = os.path.join(pasta_dia_str, min(subpastas)) if subpastas else pasta_dia_str
+    por_nome: Dict[str, Path] = {}
+    por_chave: Dict[str, List[Path]] = {}
+    for xml_path in todos:
+        nome = xml_path.name
+        por_nome.setdefault(nome, xml_path)
+        for chave in _PADRAO_CHAVE_NO_NOME.findall(nome):
+            por_chave.setdefault(chave, []).append(xml_path)
+    return _IndiceXmlsDia(todos, por_nome, por_chave, pasta_criacao)
+
+
+def _xmls_com_chave(indice_dia: _IndiceXmlsDia, chave_limpa: str) -> List[Path]:
+    """
+    Retorna os XMLs cujo nome contém a chave, na ordem da varredura.
+    
+    Chaves de 44 digitos sao resolvidas pelo indice por chave; outros formatos
+    (chaves parciais ou noo numericas) recorrem à busca linear por substring.
+    """
+    if len(chave_limpa) == 44 and chave_limpa.isdigit():
+        return indice_dia.por_chave.get(chave_limpa, [])
+    return [xml_path for xml_path in indice_dia.todos if chave_limpa in xml_path.name]
+
+
+def _indice_xmls_do_dia(pasta_dia: Union[str, Path]) -> Optional[_IndiceXmlsDia]:
+    """
+    Retorna a varredura (memorizada) dos XMLs de uma pasta de dia.
+    
+    O unico stat() da pasta serve de teste de existência e de chave do cache.
+    
+    Returns:
+        _IndiceXmlsDia, ou None se a pasta noo existir
+    """
+    pasta_dia_str = os.fspath(pasta_dia)
+    try:
+        mtime_ns = os.stat(pasta_dia_str).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _descobrir_todos_xmls_cached(pasta_dia_str, mtime_ns)
+
+
+def _xml_existe_no_indice(indice_dia: Optional[_IndiceXmlsDia], caminho_xml: Path) -> bool:
+    """
+    Responde se o XML existe a partir da varredura do dia, sem um stat por arquivo.
     
-    # Método simples e robusto
-    return list(resultado_dir.rglob("*.xml"))
+    Só recorre a caminho_xml.exists() no caso ambiguo de nomes repetidos em
+    subpastas diferentes do mesmo dia.
+    """
+    if indice_dia is None:
+        return False
+    encontrado = indice_dia.por_nome.get(caminho_xml.name)
+    if encontrado is None:
+        return False
+    return encontrado == caminho_xml or caminho_xml.exists()
+
+
+def limpar_cache_xmls() -> None:
+    """Descarta as varreduras de pastas memorizadas por gerar_xml_path*()."""
+    _descobrir_todos_xmls_cached.cache_clear()
 
 def normalizar_chave_nfe(chave: str) -> str:
     """
@@ -998,8 +1865,12 @@ def normalizar_chave_nfe(chave: str) -> str:
     if not chave:
         return ''
     
-    # Remove espaços e mantém apenas dígitos
-    chave_limpa = re.sub(r'\D', '', str(chave).strip())
+    # Caminho rapido (caso comum): chave ja com 44 digitos ASCII
+    if isinstance(chave, str) and len(chave) == 44 and chave.isascii() and chave.isdigit():
+        return chave
+    
+    # Mantém apenas dígitos (str.translate, sem regex): espaços já saem aqui, sem strip()
+    chave_limpa = _somente_digitos(str(chave))
     
     # Normaliza para exatamente 44 caracteres
     if len(chave_limpa) >= 44:
@@ -1033,33 +1904,41 @@ def gerar_nome_arquivo_xml(chave: str, dEmi: Union[str, datetime], num_nfe: str)
     if not all([chave, dEmi, num_nfe]):
         raise ValueError(f"Dados obrigatorios ausentes: chave={chave}, dEmi={dEmi}, num_nfe={num_nfe}")
     
-    try:
-        # Conversoo de data para datetime se necessario
-        if isinstance(dEmi, str):
-            dEmi_normalizada = normalizar_data(dEmi.strip())
-            if not dEmi_normalizada:
-                raise ValueError(f"Data de emissoo invalida: '{dEmi}'")
-            dEmi_dt = datetime.strptime(dEmi_normalizada, "%Y-%m-%d")
-        elif isinstance(dEmi, datetime):
-            dEmi_dt = dEmi
-        else:
-            raise ValueError(f"Tipo de dEmi invalido: {type(dEmi)}")
-        
-        # Sanitizacoo dos componentes do nome
-        num_nfe_limpo = str(num_nfe).strip()
-        chave_normalizada = normalizar_chave_nfe(chave)  # NOVA: Normaliza chave para 44 chars
-        data_formatada = dEmi_dt.strftime('%Y%m%d')
-        
-        nome_arquivo = f"{num_nfe_limpo}_{data_formatada}_{chave_normalizada}.xml"
-        
-        # Validacoo do nome gerado
-        if len(nome_arquivo) > 255:  # Limite do sistema de arquivos
-            logger.warning(f"[ARQUIVO] Nome muito longo: {nome_arquivo[:50]}...")
-        
-        return nome_arquivo
-        
-    except Exception as e:
-        raise ValueError(f"Erro ao gerar nome do arquivo XML: {e}")
+    # Data no formato YYYYMMDD: fatiando a string ISO (sem strptime/strftime)
+    if isinstance(dEmi, str):
+        dEmi_normalizada = normalizar_data(dEmi.strip())
+        if not dEmi_normalizada:
+            raise ValueError(f"Data de emissoo invalida: '{dEmi}'")
+        data_formatada = dEmi_normalizada.replace('-', '')
+    elif isinstance(dEmi, datetime):
+        # Unico ponto que pode falhar por conta propria (ano fora da faixa do strftime)
+        try:
+            data_formatada = dEmi.strftime('%Y%m%d')
+        except ValueError as e:
+            raise ValueError(f"Data de emissoo invalida: '{dEmi}': {e}") from e
+    else:
+        raise ValueError(f"Tipo de dEmi invalido: {type(dEmi)}")
+    
+    return _nome_arquivo_xml(_texto_limpo(chave), data_formatada, _texto_limpo(num_nfe))
+
+
+def _nome_arquivo_xml(chave: str, data_formatada: str, num_nfe: str) -> str:
+    """
+    Monta o nome padroo do XML com a data ja no formato YYYYMMDD.
+    
+    Nucleo de gerar_nome_arquivo_xml() para os caminhos em lote, que ja têm a
+    data normalizada e noo precisam convertê-la de novo. Espera chave e num_nfe
+    ja limpos por _texto_limpo().
+    """
+    chave_normalizada = normalizar_chave_nfe(chave)  # NOVA: Normaliza chave para 44 chars
+    
+    nome_arquivo = f"{num_nfe}_{data_formatada}_{chave_normalizada}.xml"
+    
+    # Validacoo do nome gerado
+    if len(nome_arquivo) > 255:  # Limite do sistema de arquivos
+        logger.warning(f"[ARQUIVO] Nome muito longo: {nome_arquivo[:50]}...")
+    
+    return nome_arquivo
 
 def gerar_xml_path(
     chave: str,
@@ -1070,8 +1949,8 @@ def gerar_xml_path(
     """
     Gera caminho completo hierarquico para armazenamento de arquivo XML.
     
-    NOTA: Para melhor performance, considere usar gerar_xml_path_otimizado()
-    que utiliza descobrir_todos_xmls() para busca recursiva mais eficiente.
+    NOTA: Delega para gerar_xml_path_otimizado(); a unica diferença é que XMLs
+    novos sempre vão para a pasta do dia, nunca para uma subpasta existente.
     
     Estrutura: {base_dir}/{ano}/{mes}/{dia}[/{dia}_pasta_{numero}]/{arquivo}.xml
     
@@ -1101,61 +1980,15 @@ def gerar_xml_path(
     See Also:
         gerar_xml_path_otimizado(): Versão otimizada usando descobrir_todos_xmls()
     """
-    # Validacoo de pre-condicões
-    if not all([chave, dEmi, num_nfe]):
-        raise ValueError(f"Dados obrigatorios ausentes: chave={chave}, dEmi={dEmi}, num_nfe={num_nfe}")
-    
-    try:
-        # Normalizacoo da data
-        data_normalizada = normalizar_data(str(dEmi).strip())
-        if not data_normalizada:
-            raise ValueError(f"Data de emissoo invalida: '{dEmi}'")
-        
-        data_dt = datetime.strptime(data_normalizada, "%Y-%m-%d")
-        
-        # Geracoo do nome do arquivo usando funcao centralizada
-        nome_arquivo = gerar_nome_arquivo_xml(chave, data_dt, num_nfe)
-        
-        # Construcoo da estrutura hierarquica de pastas (base)
-        pasta_base = Path(base_dir) / data_dt.strftime('%Y') / data_dt.strftime('%m') / data_dt.strftime('%d')
-        
-        # OTIMIZAÇÃO: Usa descobrir_todos_xmls para busca eficiente
-        # 1. Primeiro verifica se o diretório base existe
-        if not pasta_base.exists():
-            # Se pasta não existe, retorna caminho direto para criação
-            caminho_direto = pasta_base / nome_arquivo
-            return pasta_base, caminho_direto
-        
-        # 2. Usa descobrir_todos_xmls para encontrar arquivos XML na pasta do dia
-        todos_xmls = descobrir_todos_xmls(pasta_base)
-        
-        # 3. Busca por arquivo com nome exato gerado
-        for xml_path in todos_xmls:
-            if xml_path.name == nome_arquivo:
-                # Arquivo encontrado - retorna pasta pai e caminho completo
-                return xml_path.parent, xml_path
-        
-        # 4. Se não encontrou arquivo específico, busca alternativa por chave NFe
-        # (para casos onde o nome pode ter pequenas variações)
-        chave_limpa = str(chave).strip()
-        for xml_path in todos_xmls:
-            if chave_limpa in xml_path.name:
-                logger.debug(f"[XML_PATH] Arquivo encontrado por chave alternativa: {xml_path.name}")
-                return xml_path.parent, xml_path
-        
-        # 5. Se não encontrou em lugar nenhum, retorna caminho direto (para criação)
-        caminho_direto = pasta_base / nome_arquivo
-        return pasta_base, caminho_direto
-        
-    except Exception as e:
-        raise ValueError(f"Erro ao gerar caminho XML: {e}")
+    return gerar_xml_path_otimizado(chave, dEmi, num_nfe, base_dir, preferir_subpasta=False)
 
 
 def gerar_xml_path_otimizado(
     chave: str,
     dEmi: str,
     num_nfe: str,
-    base_dir: str = "resultado"
+    base_dir: str = "resultado",
+    preferir_subpasta: bool = True
 ) -> Tuple[Path, Path]:
     """
     Versão otimizada da função gerar_xml_path usando descobrir_todos_xmls.
@@ -1170,91 +2003,113 @@ def gerar_xml_path_otimizado(
     - Busca por chave alternativa em caso de variação no nome
     
     Args:
-        chave: Chave única da NFe (44 caracteres)
-        dEmi: Data de emissão (dd/mm/yyyy ou yyyy-mm-dd)
-        num_nfe: Número da nota fiscal
-        base_dir: Diretório base para armazenamento
+        chave: Chave única da NFe (44 caracteres)
+        dEmi: Data de emissão (dd/mm/yyyy ou yyyy-mm-dd)
+        num_nfe: Número da nota fiscal
+        base_dir: Diretório base para armazenamento
+        preferir_subpasta: Se True, XMLs novos vão para a primeira subpasta do dia
+            (se houver); se False, sempre para a própria pasta do dia
+        
+    Returns:
+        Tupla contendo (Path da pasta, Path do arquivo completo)
+        
+    Raises:
+        ValueError: Se dados obrigatórios estiverem ausentes ou inválidos
+        OSError: Se a pasta do dia existir mas noo puder ser lida
+        
+    Examples:
+        >>> pasta, arquivo = gerar_xml_path_otimizado("123...", "21/07/2025", "123")
+        >>> # Usa descobrir_todos_xmls para busca eficiente
+    """
+    # Validação de pré-condições
+    if not all([chave, dEmi, num_nfe]):
+        raise ValueError(f"Dados obrigatórios ausentes: chave={chave}, dEmi={dEmi}, num_nfe={num_nfe}")
+    
+    # Normalização da data (normalizar_data devolve None em vez de lançar exceção)
+    data_normalizada = normalizar_data(str(dEmi).strip())
+    if not data_normalizada:
+        raise ValueError(f"Data de emissão inválida: '{dEmi}'")
+    
+    # Chave e número limpos uma unica vez para o nome e para a busca
+    chave_limpa = _texto_limpo(chave)
+    num_nfe_limpo = _texto_limpo(num_nfe)
+    
+    # Geração do nome padrão usando função centralizada
+    nome_arquivo_esperado = _nome_arquivo_xml(chave_limpa, data_normalizada.replace('-', ''), num_nfe_limpo)
+    
+    # Construção da pasta do dia e busca no índice (em cache) da pasta;
+    # falhas de acesso à pasta sobem como OSError, sem reembalar
+    pasta_dia = _pasta_do_dia(base_dir, data_normalizada)
+    indice_dia = _indice_xmls_do_dia(pasta_dia)
+    
+    return _localizar_xml_no_dia(
+        chave_limpa, num_nfe_limpo, nome_arquivo_esperado, pasta_dia, indice_dia, preferir_subpasta
+    )
+
+
+def _pasta_do_dia(base_dir: str, data_iso: str) -> str:
+    """
+    Monta a pasta {base_dir}/{ano}/{mes}/{dia} fatiando a data YYYY-MM-DD.
+    
+    Retorna str (os.path.join): o Path só é criado no retorno para o chamador.
+    """
+    return os.path.join(base_dir, data_iso[:4], data_iso[5:7], data_iso[8:10])
+
+
+def _localizar_xml_no_dia(
+    chave_limpa: str,
+    num_nfe_limpo: str,
+    nome_arquivo_esperado: str,
+    pasta_dia: str,
+    indice_dia: Optional[_IndiceXmlsDia],
+    preferir_subpasta: bool = True
+) -> Tuple[Path, Path]:
+    """
+    Resolve o caminho de um XML a partir do indice ja carregado da pasta do dia.
+    
+    Nucleo de gerar_xml_path_otimizado(), reutilizado pelos mapeamentos em lote
+    que carregam o indice uma vez por dia.
+    
+    Args:
+        chave_limpa: Chave da NFe ja limpa (_texto_limpo)
+        num_nfe_limpo: Numero da nota fiscal ja limpo (_texto_limpo)
+        nome_arquivo_esperado: Nome padroo (gerar_nome_arquivo_xml)
+        pasta_dia: Pasta do dia (str, de _pasta_do_dia)
+        indice_dia: Indice da pasta (_indice_xmls_do_dia) ou None se a pasta noo existe
+        preferir_subpasta: Se True, XMLs novos vão para a primeira subpasta do dia
         
     Returns:
         Tupla contendo (Path da pasta, Path do arquivo completo)
-        
-    Raises:
-        ValueError: Se dados obrigatórios estiverem ausentes ou inválidos
-        
-    Examples:
-        >>> pasta, arquivo = gerar_xml_path_otimizado("123...", "21/07/2025", "123")
-        >>> # Usa descobrir_todos_xmls para busca eficiente
     """
-    # Validação de pré-condições
-    if not all([chave, dEmi, num_nfe]):
-        raise ValueError(f"Dados obrigatórios ausentes: chave={chave}, dEmi={dEmi}, num_nfe={num_nfe}")
-    
-    try:
-        # Normalização da data
-        data_normalizada = normalizar_data(str(dEmi).strip())
-        if not data_normalizada:
-            raise ValueError(f"Data de emissão inválida: '{dEmi}'")
-        
-        data_dt = datetime.strptime(data_normalizada, "%Y-%m-%d")
-        
-        # Geração do nome padrão usando função centralizada
-        nome_arquivo_esperado = gerar_nome_arquivo_xml(chave, data_dt, num_nfe)
-        
-        # Construção da pasta do dia
-        pasta_dia = Path(base_dir) / data_dt.strftime('%Y') / data_dt.strftime('%m') / data_dt.strftime('%d')
-        
-        # Se pasta do dia não existe, retorna caminho para criação
-        if not pasta_dia.exists():
-            caminho_novo = pasta_dia / nome_arquivo_esperado
-            return pasta_dia, caminho_novo
-        
-        # BUSCA OTIMIZADA: Usa descobrir_todos_xmls para scan recursivo
-        logger.debug(f"[XML_PATH] Buscando XMLs recursivamente em: {pasta_dia}")
-        todos_xmls_do_dia = descobrir_todos_xmls(pasta_dia)
-        
-        if not todos_xmls_do_dia:
-            # Sem XMLs na pasta, retorna caminho para criação
-            caminho_novo = pasta_dia / nome_arquivo_esperado
-            return pasta_dia, caminho_novo
-        
-        # ESTRATÉGIA DE BUSCA EM MÚLTIPLAS ETAPAS:
-        chave_limpa = str(chave).strip()
-        num_nfe_limpo = str(num_nfe).strip()
-        
-        # 1. Busca por nome exato (mais precisa)
-        for xml_path in todos_xmls_do_dia:
-            if xml_path.name == nome_arquivo_esperado:
-                logger.debug(f"[XML_PATH] Encontrado por nome exato: {xml_path}")
-                return xml_path.parent, xml_path
-        
-        # 2. Busca por chave NFe no nome (tolerante a variações)
-        for xml_path in todos_xmls_do_dia:
-            if chave_limpa in xml_path.name and num_nfe_limpo in xml_path.name:
-                logger.debug(f"[XML_PATH] Encontrado por chave+número: {xml_path}")
-                return xml_path.parent, xml_path
-        
-        # 3. Busca apenas por chave (fallback)
-        for xml_path in todos_xmls_do_dia:
-            if chave_limpa in xml_path.name:
-                logger.debug(f"[XML_PATH] Encontrado por chave: {xml_path}")
-                return xml_path.parent, xml_path
-        
-        # 4. Nenhum arquivo encontrado - retorna caminho para criação
-        # Escolhe a melhor pasta: direta ou primeira subpasta
-        if any(item.is_dir() for item in pasta_dia.iterdir()):
-            # Se há subpastas, usa a primeira para criação
-            subpastas = [item for item in pasta_dia.iterdir() if item.is_dir()]
-            if subpastas:
-                primeira_subpasta = sorted(subpastas, key=lambda x: x.name)[0]
-                caminho_novo = primeira_subpasta / nome_arquivo_esperado
-                return primeira_subpasta, caminho_novo
-        
-        # Fallback final: pasta direta
-        caminho_novo = pasta_dia / nome_arquivo_esperado
-        return pasta_dia, caminho_novo
-        
-    except Exception as e:
-        raise ValueError(f"Erro ao gerar caminho XML otimizado: {e}")
+    # Se pasta do dia não existe ou não tem XMLs, retorna caminho para criação
+    if indice_dia is None or not indice_dia.todos:
+        caminho_novo = Path(os.path.join(pasta_dia, nome_arquivo_esperado))
+        return Path(pasta_dia), caminho_novo
+    
+    # ESTRATÉGIA DE BUSCA EM MÚLTIPLAS ETAPAS:
+    # 1. Busca por nome exato (mais precisa): consulta direta no indice por nome
+    xml_path = indice_dia.por_nome.get(nome_arquivo_esperado)
+    if xml_path is not None:
+        logger.debug(f"[XML_PATH] Encontrado por nome exato: {xml_path}")
+        return xml_path.parent, xml_path
+    
+    # 2. Busca por chave NFe no nome (tolerante a variações): candidatos pelo indice
+    candidatos = _xmls_com_chave(indice_dia, chave_limpa)
+    for xml_path in candidatos:
+        if num_nfe_limpo in xml_path.name:
+            logger.debug(f"[XML_PATH] Encontrado por chave+número: {xml_path}")
+            return xml_path.parent, xml_path
+    
+    # 3. Busca apenas por chave (fallback)
+    if candidatos:
+        xml_path = candidatos[0]
+        logger.debug(f"[XML_PATH] Encontrado por chave: {xml_path}")
+        return xml_path.parent, xml_path
+    
+    # 4. Nenhum arquivo encontrado - retorna caminho para criação
+    # Pasta escolhida na própria varredura: primeira subpasta (se houver) ou a pasta direta
+    pasta_criacao = indice_dia.pasta_criacao if preferir_subpasta else pasta_dia
+    return Path(pasta_criacao), Path(os.path.join(pasta_criacao, nome_arquivo_esperado))
 
 
 def mapear_xml_data_chave_caminho(
@@ -1268,6 +2123,10 @@ def mapear_xml_data_chave_caminho(
     caminho do arquivo XML correspondente, seguindo a estrutura hierárquica 
     do sistema de arquivos.
     
+    Cada data guarda um unico registro: o ultimo registro valido do dia. Por
+    isso só ele tem o caminho resolvido; os anteriores do mesmo dia contam
+    como processados sem consultar o índice.
+    
     Estrutura de retorno:
     {
         "2025-07-17": {
@@ -1301,46 +2160,70 @@ def mapear_xml_data_chave_caminho(
     
     logger.info(f"[MAPEAR] Iniciando mapeamento de {len(registros)} registros")
     
+    # Cada pasta de dia é varrida uma vez neste lote (cache limpo para refletir o disco atual)
+    limpar_cache_xmls()
+    
+    # 1ª passada: validação e agrupamento por data normalizada (uma normalização por registro)
+    registros_por_dia: Dict[str, List[Tuple[str, str, str]]] = {}
     for chave, dEmi, num_nfe in registros:
+        # Validação de dados obrigatórios
+        if not all([chave, dEmi, num_nfe]):
+            logger.warning(f"[MAPEAR] Registro com dados incompletos ignorado: chave={chave}, dEmi={dEmi}, num_nfe={num_nfe}")
+            registros_com_erro += 1
+            continue
+        
+        # Normalização da data de emissão
+        data_normalizada = normalizar_data(str(dEmi).strip())
+        if not data_normalizada:
+            logger.warning(f"[MAPEAR] Data de emissão inválida ignorada: '{dEmi}' para chave {chave}")
+            registros_com_erro += 1
+            continue
+        
+        # Chave e número limpos uma unica vez por registro
+        registros_por_dia.setdefault(data_normalizada, []).append(
+            (_texto_limpo(chave), dEmi, _texto_limpo(num_nfe))
+        )
+    
+    # 2ª passada: pasta, data e índice resolvidos uma vez por dia; registros consultam o índice
+    for data_normalizada, registros_dia in registros_por_dia.items():
         try:
-            # Validação de dados obrigatórios
-            if not all([chave, dEmi, num_nfe]):
-                logger.warning(f"[MAPEAR] Registro com dados incompletos ignorado: chave={chave}, dEmi={dEmi}, num_nfe={num_nfe}")
-                registros_com_erro += 1
-                continue
-            
-            # Normalização da data de emissão
-            data_normalizada = normalizar_data(str(dEmi).strip())
-            if not data_normalizada:
-                logger.warning(f"[MAPEAR] Data de emissão inválida ignorada: '{dEmi}' para chave {chave}")
-                registros_com_erro += 1
-                continue
-            
-            # Geração do caminho do arquivo XML usando versão otimizada
+            data_formatada = data_normalizada.replace('-', '')
+            pasta_dia = _pasta_do_dia(base_dir, data_normalizada)
+            indice_dia = _indice_xmls_do_dia(pasta_dia)
+        except Exception as e:
+            logger.error(f"[MAPEAR] Erro inesperado ao preparar o dia {data_normalizada}: {e}")
+            registros_com_erro += len(registros_dia)
+            continue
+        
+        # O ultimo registro do dia sobrescreveria os anteriores: resolve do fim para o
+        # inicio e para no primeiro sucesso (os demais apenas contam como processados)
+        for posicao in range(len(registros_dia) - 1, -1, -1):
+            chave, dEmi, num_nfe = registros_dia[posicao]
             try:
-                pasta_xml, caminho_xml = gerar_xml_path_otimizado(chave, dEmi, num_nfe, base_dir)
+                nome_arquivo = _nome_arquivo_xml(chave, data_formatada, num_nfe)
+                pasta_xml, caminho_xml = _localizar_xml_no_dia(
+                    chave, num_nfe, nome_arquivo, pasta_dia, indice_dia
+                )
                 
                 # Mapeamento da estrutura de retorno
                 mapeamento[data_normalizada] = {
-                    "cChaveNFe": str(chave).strip(),
+                    "cChaveNFe": chave,
                     "caminho_arquivo": str(caminho_xml)
                 }
                 
-                registros_processados += 1
+                registros_processados += 1 + posicao
                 
                 # Log de debug para registros processados
                 if logger.isEnabledFor(logging.DEBUG):
                     logger.debug(f"[MAPEAR] Mapeado: {data_normalizada} -> {chave[:20]}... -> {caminho_xml}")
+                break
                     
             except ValueError as e:
                 logger.warning(f"[MAPEAR] Erro ao gerar caminho XML para chave {chave}: {e}")
                 registros_com_erro += 1
-                continue
-                
-        except Exception as e:
-            logger.error(f"[MAPEAR] Erro inesperado ao processar registro (chave={chave}): {e}")
-            registros_com_erro += 1
-            continue
+            except Exception as e:
+                logger.error(f"[MAPEAR] Erro inesperado ao processar registro (chave={chave}): {e}")
+                registros_com_erro += 1
     
     # Log de resumo da operação
     logger.info(f"[MAPEAR] Mapeamento concluído: {registros_processados} sucessos, {registros_com_erro} erros")
@@ -1457,60 +2340,86 @@ def criar_mapeamento_completo_com_descobrir_xmls(
     
     logger.info(f"[MAPEAMENTO] Iniciando mapeamento completo de {len(registros)} registros")
     
+    # Cada pasta de dia é varrida uma vez neste lote (cache limpo para refletir o disco atual)
+    limpar_cache_xmls()
+    
+    # 1ª passada: validação e agrupamento por data normalizada
+    registros_por_dia: Dict[str, List[Tuple[str, str, str]]] = {}
     for chave, dEmi, num_nfe in registros:
+        # Validação de dados
+        if not all([chave, dEmi, num_nfe]):
+            logger.warning(f"[MAPEAMENTO] Dados incompletos: chave={chave}, dEmi={dEmi}, num_nfe={num_nfe}")
+            total_com_erro += 1
+            continue
+        
+        # Normalização da data
+        data_normalizada = normalizar_data(str(dEmi).strip())
+        if not data_normalizada:
+            logger.warning(f"[MAPEAMENTO] Data inválida: '{dEmi}'")
+            total_com_erro += 1
+            continue
+        
+        # Chave e número limpos uma unica vez por registro
+        registros_por_dia.setdefault(data_normalizada, []).append(
+            (_texto_limpo(chave), dEmi, _texto_limpo(num_nfe))
+        )
+    
+    # 2ª passada: data, pasta e índice da pasta resolvidos uma vez por dia
+    for data_normalizada, registros_dia in registros_por_dia.items():
         try:
-            # Validação de dados
-            if not all([chave, dEmi, num_nfe]):
-                logger.warning(f"[MAPEAMENTO] Dados incompletos: chave={chave}, dEmi={dEmi}, num_nfe={num_nfe}")
-                total_com_erro += 1
-                continue
-            
-            # Normalização da data
-            data_normalizada = normalizar_data(str(dEmi).strip())
-            if not data_normalizada:
-                logger.warning(f"[MAPEAMENTO] Data inválida: '{dEmi}'")
-                total_com_erro += 1
-                continue
-            
-            # Geração do nome padrão usando função centralizada
+            data_formatada = data_normalizada.replace('-', '')
+            pasta_dia = _pasta_do_dia(base_dir, data_normalizada)
+            indice_dia = _indice_xmls_do_dia(pasta_dia) if usar_versao_otimizada else None
+        except Exception as e:
+            logger.error(f"[MAPEAMENTO] Erro inesperado ao preparar o dia {data_normalizada}: {e}")
+            total_com_erro += len(registros_dia)
+            continue
+        
+        for chave, dEmi, num_nfe in registros_dia:
             try:
-                data_dt = datetime.strptime(data_normalizada, "%Y-%m-%d")
-                nome_padrao = gerar_nome_arquivo_xml(chave, data_dt, num_nfe)
-            except Exception as e:
-                logger.warning(f"[MAPEAMENTO] Erro ao gerar nome padrão: {e}")
-                total_com_erro += 1
-                continue
-            
-            # Busca do arquivo usando versão otimizada ou original
-            if usar_versao_otimizada:
+                # Geração do nome padrão usando função centralizada
                 try:
-                    pasta_xml, caminho_xml = gerar_xml_path_otimizado(chave, dEmi, num_nfe, base_dir)
+                    nome_padrao = _nome_arquivo_xml(chave, data_formatada, num_nfe)
                 except Exception as e:
-                    logger.warning(f"[MAPEAMENTO] Erro na busca otimizada: {e}")
+                    logger.warning(f"[MAPEAMENTO] Erro ao gerar nome padrão: {e}")
+                    total_com_erro += 1
+                    continue
+                
+                # Busca do arquivo usando versão otimizada (índice do dia) ou original
+                existe = None
+                if usar_versao_otimizada:
+                    try:
+                        pasta_xml, caminho_xml = _localizar_xml_no_dia(
+                            chave, num_nfe, nome_padrao, pasta_dia, indice_dia
+                        )
+                        # Existência respondida pela própria varredura do dia (sem stat)
+                        existe = _xml_existe_no_indice(indice_dia, caminho_xml)
+                    except Exception as e:
+                        logger.warning(f"[MAPEAMENTO] Erro na busca otimizada: {e}")
+                        pasta_xml, caminho_xml = gerar_xml_path(chave, dEmi, num_nfe, base_dir)
+                else:
                     pasta_xml, caminho_xml = gerar_xml_path(chave, dEmi, num_nfe, base_dir)
-            else:
-                pasta_xml, caminho_xml = gerar_xml_path(chave, dEmi, num_nfe, base_dir)
-            
-            # Criação do registro detalhado
-            registro_detalhado = {
-                "cChaveNFe": str(chave).strip(),
-                "nNF": str(num_nfe).strip(),
-                "caminho_arquivo": str(caminho_xml),
-                "nome_padrao": nome_padrao,
-                "existe": caminho_xml.exists(),
-                "pasta_pai": str(pasta_xml)
-            }
-            
-            # Agrupamento por data
-            if data_normalizada not in mapeamento_por_data:
-                mapeamento_por_data[data_normalizada] = []
-            
-            mapeamento_por_data[data_normalizada].append(registro_detalhado)
-            total_processados += 1
-            
-        except Exception as e:
-            logger.error(f"[MAPEAMENTO] Erro inesperado processando {chave}: {e}")
-            total_com_erro += 1
+                
+                if existe is None:
+                    existe = caminho_xml.exists()
+                
+                # Criação do registro detalhado
+                registro_detalhado = {
+                    "cChaveNFe": chave,
+                    "nNF": num_nfe,
+                    "caminho_arquivo": str(caminho_xml),
+                    "nome_padrao": nome_padrao,
+                    "existe": existe,
+                    "pasta_pai": str(pasta_xml)
+                }
+                
+                # Agrupamento por data
+                mapeamento_por_data.setdefault(data_normalizada, []).append(registro_detalhado)
+                total_processados += 1
+                
+            except Exception as e:
+                logger.error(f"[MAPEAMENTO] Erro inesperado processando {chave}: {e}")
+                total_com_erro += 1
     
     # Estatísticas finais
     total_datas = len(mapeamento_por_data)
@@ -1526,6 +2435,10 @@ def criar_mapeamento_completo_com_descobrir_xmls(
     return mapeamento_por_data
 
 
+# Segmentos ano (2000-2099) e mês (01-12) seguidos de mais um segmento, em qualquer separador
+_PADRAO_ANO_MES_NO_CAMINHO = re.compile(r'(?:^|[\\/])(20[0-9]{2})[\\/](0[1-9]|1[0-2])[\\/]')
+
+
 def extrair_mes_do_path(caminho: Path) -> str:
     """
     Extrai identificador de mês (YYYY-MM) da estrutura hierarquica de pastas.
@@ -1543,24 +2456,10 @@ def extrair_mes_do_path(caminho: Path) -> str:
         '2025-07'
     """
     try:
-        partes = caminho.parts
-        
-        # Busca padroo ano/mes na estrutura
-        for i in range(len(partes) - 2):
-            possivel_ano = partes[i]
-            possivel_mes = partes[i + 1]
-            
-            # Validacoo de ano (4 digitos, entre 2000-2099)
-            if (possivel_ano.isdigit() and 
-                len(possivel_ano) == 4 and 
-                2000 <= int(possivel_ano) <= 2099):
-                
-                # Validacoo de mês (2 digitos, entre 01-12)
-                if (possivel_mes.isdigit() and 
-                    len(possivel_mes) == 2 and 
-                    1 <= int(possivel_mes) <= 12):
-                    
-                    return f"{possivel_ano}-{possivel_mes}"
+        # Busca padroo ano/mes na estrutura: uma unica busca sobre o caminho completo
+        encontrado = _PADRAO_ANO_MES_NO_CAMINHO.search(os.fspath(caminho))
+        if encontrado:
+            return f"{encontrado[1]}-{encontrado[2]}"
         
         logger.warning(f"[PATH] Estrutura ano/mês noo encontrada em: {caminho}")
         return "outros"
@@ -1574,6 +2473,9 @@ def criar_lockfile(pasta: Path) -> Path:
     """
     Cria arquivo de lock para controle de acesso exclusivo à pasta.
     
+    A criacoo é atomica (O_CREAT | O_EXCL): dois processos concorrentes noo
+    conseguem obter o mesmo lock. O PID do dono é gravado no arquivo.
+    
     Args:
         pasta: Diretorio onde criar o lockfile
         
@@ -1588,16 +2490,21 @@ def criar_lockfile(pasta: Path) -> Path:
     """
     lockfile = pasta / ".processando.lock"
     
-    if lockfile.exists():
-        raise RuntimeError(f"Pasta em uso por outro processo: {pasta}")
-    
     try:
         pasta.mkdir(parents=True, exist_ok=True)
-        lockfile.touch()
-        logger.debug(f"[LOCK] Lockfile criado: {lockfile}")
-        return lockfile
+        fd = os.open(lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        raise RuntimeError(f"Pasta em uso por outro processo: {pasta}")
     except Exception as e:
         raise RuntimeError(f"Erro ao criar lockfile em {pasta}: {e}")
+    
+    try:
+        os.write(fd, str(os.getpid()).encode())
+    finally:
+        os.close(fd)
+    
+    logger.debug(f"[LOCK] Lockfile criado: {lockfile}")
+    return lockfile
 
 
 def listar_arquivos_xml_em(pasta: Path, incluir_subpastas: bool = True) -> List[Path]:
@@ -1620,23 +2527,25 @@ def listar_arquivos_xml_em(pasta: Path, incluir_subpastas: bool = True) -> List[
             logger.warning(f"[LISTAR] Pasta nao existe: {pasta}")
             return []
         
-        arquivos_xml = []
-        
         if incluir_subpastas:
-            # Busca recursiva usando rglob para melhor performance
-            arquivos_xml = [
-                arquivo for arquivo in pasta.rglob("*.xml")
-                if arquivo.is_file()
+            # Busca recursiva via os.walk: sufixo testado na string, sem fnmatch nem stat extra
+            caminhos = [
+                os.path.join(raiz, nome)
+                for raiz, _, nomes in os.walk(pasta)
+                for nome in nomes
+                if nome[-4:].lower() == ".xml"
             ]
         else:
-            # Busca apenas na pasta atual (comportamento original)
-            arquivos_xml = [
-                arquivo for arquivo in pasta.iterdir()
-                if arquivo.is_file() and arquivo.suffix.lower() == ".xml"
-            ]
+            # Busca apenas na pasta atual, usando o tipo em cache do DirEntry
+            with os.scandir(pasta) as entradas:
+                caminhos = [
+                    entrada.path for entrada in entradas
+                    if entrada.name[-4:].lower() == ".xml" and entrada.is_file(follow_symlinks=False)
+                ]
         
-        # Ordenacoo por nome para consistência
-        arquivos_xml.sort()
+        # Ordenacoo por nome para consistência (uma unica vez, sobre strings)
+        caminhos.sort()
+        arquivos_xml = [Path(caminho) for caminho in caminhos]
         
         if arquivos_xml:
             tipo_busca = "recursivamente" if incluir_subpastas else "na pasta atual"
@@ -1653,29 +2562,61 @@ def listar_arquivos_xml_em(pasta: Path, incluir_subpastas: bool = True) -> List[
 # CONTROLE DE RATE LIMITING
 # =============================================================================
 
-# Estado global para rate limiting assíncrono
-_ultima_chamada_async = 0.0
+class AsyncRateLimiter:
+    """
+    Limitador de taxa assíncrono que reserva horarios de saida (token bucket de 1 ficha).
+    
+    Cada acquire() reserva o proximo horario livre (`proximo_horario`) e so
+    depois aguarda até ele. Como a reserva ocorre sem nenhum await no meio,
+    ela é atomica dentro do event loop: corrotinas concorrentes (asyncio.gather)
+    recebem horarios distintos, espaçados de `min_intervalo`, sem disputa pelo
+    mesmo timestamp nem necessidade de lock.
+    
+    Attributes:
+        min_intervalo: Intervalo minimo em segundos entre liberacões
+        proximo_horario: Horario (loop.time()) da proxima liberacoo disponivel
+    """
+    
+    def __init__(self, min_intervalo: float) -> None:
+        self.min_intervalo = min_intervalo
+        self.proximo_horario = 0.0
+    
+    async def acquire(self) -> None:
+        """Aguarda o horario reservado para esta chamada."""
+        agora = asyncio.get_running_loop().time()
+        horario = max(agora, self.proximo_horario)
+        self.proximo_horario = horario + self.min_intervalo
+        espera = horario - agora
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+# Limitadores por event loop e por intervalo (loops encerrados saem do dicionario)
+_limitadores_async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[float, AsyncRateLimiter]]" = (
+    weakref.WeakKeyDictionary()
+)
+
 
 async def respeitar_limite_requisicoes_async(min_intervalo: float = 0.25) -> None:
     """
     Implementa rate limiting assíncrono para controle de frequência de requisições.
     
-    Versão assíncrona que não bloqueia o event loop e mantém estado global
-    adequado para múltiplas chamadas.
+    Versão assíncrona que não bloqueia o event loop. Usa um AsyncRateLimiter
+    por event loop e intervalo, correto sob chamadas concorrentes.
     
     Args:
         min_intervalo: Intervalo mínimo em segundos entre chamadas (padrão: 0.25s = 4 req/s)
     """
-    global _ultima_chamada_async
-    
-    tempo_atual = monotonic()
-    tempo_decorrido = tempo_atual - _ultima_chamada_async
+    loop = asyncio.get_running_loop()
+    limitadores = _limitadores_async.get(loop)
+    if limitadores is None:
+        limitadores = _limitadores_async[loop] = {}
     
-    if tempo_decorrido < min_intervalo:
-        tempo_espera = min_intervalo - tempo_decorrido
-        await asyncio.sleep(tempo_espera)
+    limitador = limitadores.get(min_intervalo)
+    if limitador is None:
+        limitador = limitadores[min_intervalo] = AsyncRateLimiter(min_intervalo)
     
-    _ultima_chamada_async = monotonic()
+    await limitador.acquire()
 
 
 
@@ -1715,6 +2656,22 @@ class RegistroInvalidoError(ValueError):
     """Exceção para registros com dados inválidos."""
     pass
 
+def _registrar_funcoes_sqlite(conn: sqlite3.Connection) -> None:
+    """
+    Registra funcões Python do modulo como funcões escalares SQL na conexão.
+
+    Funcões registradas:
+    - norm_data(texto): normalizar_data() — converte datas para YYYY-MM-DD
+
+    Marcadas como deterministic para que o SQLite possa reaproveitar resultados
+    dentro da mesma consulta. Não são usadas em índices/schema persistente, pois
+    conexões sem o registro (outros processos, CLI) falhariam ao gravar na tabela.
+
+    Args:
+        conn: Conexão SQLite ativa
+    """
+    conn.create_function("norm_data", 1, normalizar_data, deterministic=True)
+
 @contextmanager
 def conexao_otimizada(db_path: str, config: Optional[DatabaseConfig] = None):
     """
@@ -1742,6 +2699,8 @@ def conexao_otimizada(db_path: str, config: Optional[DatabaseConfig] = None):
         for pragma, valor in config.get_pragmas().items():
             conn.execute(f"PRAGMA {pragma} = {valor}")
         
+        _registrar_funcoes_sqlite(conn)
+        
         yield conn
         
     except sqlite3.Error as e:
@@ -1750,8 +2709,87 @@ def conexao_otimizada(db_path: str, config: Optional[DatabaseConfig] = None):
         raise DatabaseError(f"Erro de conexão SQLite: {e}")
     finally:
         if conn:
+            _otimizar_conexao(conn)
             conn.close()
 
+@contextmanager
+def bulk_write_mode(conn: sqlite3.Connection):
+    """
+    Context manager que desativa fsync (PRAGMA synchronous=OFF) durante cargas em massa.
+
+    ATENÇÃO: em caso de queda de energia/crash do SO durante o bloco, a última
+    transação pode ser perdida ou o banco corrompido. Use apenas em caminhos
+    recuperáveis (cargas que podem ser reexecutadas, como INSERT OR IGNORE).
+    Durante o bloco a conexão usa locking_mode=EXCLUSIVE (sem adquirir e
+    liberar o lock a cada transacoo; outras conexões esperam o fim do bloco).
+    Os valores anteriores de synchronous e locking_mode são restaurados ao final.
+
+    Args:
+        conn: Conexão SQLite ativa
+
+    Yields:
+        sqlite3.Connection: A mesma conexão, com synchronous=OFF
+
+    Examples:
+        >>> with conexao_otimizada("omie.db") as conn, bulk_write_mode(conn):
+        ...     conn.execute("BEGIN IMMEDIATE")
+        ...     conn.executemany(sql, dados)
+        ...     conn.commit()
+    """
+    sync_anterior = conn.execute("PRAGMA synchronous").fetchone()[0]
+    locking_anterior = conn.execute("PRAGMA locking_mode").fetchone()[0]
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+    try:
+        yield conn
+    finally:
+        conn.execute(f"PRAGMA synchronous = {int(sync_anterior)}")
+        conn.execute(f"PRAGMA locking_mode = {locking_anterior}")
+        if locking_anterior.lower() == "normal" and not conn.in_transaction:
+            # O lock exclusivo só é liberado no proximo acesso ao arquivo
+            conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+
+@contextmanager
+def checkpoint_manual(conn: sqlite3.Connection):
+    """
+    Context manager que adia o checkpoint do WAL até o fim de uma fase de escrita em massa.
+
+    Desativa o checkpoint automático (PRAGMA wal_autocheckpoint=0) e o
+    despejo de paginas sujas no meio da transacoo (PRAGMA cache_spill=0)
+    durante o bloco e, ao sair, restaura os valores anteriores e executa um
+    unico wal_checkpoint(TRUNCATE): um só fsync do arquivo principal por fase,
+    e o WAL volta a tamanho zero. Se ainda houver transacoo aberta na saída
+    (erro no bloco), o checkpoint fica para o automático.
+
+    Args:
+        conn: Conexão SQLite ativa (journal_mode=WAL)
+
+    Yields:
+        sqlite3.Connection: A mesma conexão, sem checkpoint automático
+
+    Examples:
+        >>> with sqlite3.connect("omie.db") as conn, checkpoint_manual(conn):
+        ...     conn.execute("BEGIN IMMEDIATE")
+        ...     conn.executemany(sql, dados)
+        ...     conn.commit()
+    """
+    autocheckpoint_anterior = conn.execute("PRAGMA wal_autocheckpoint").fetchone()[0]
+    cache_spill_anterior = conn.execute("PRAGMA cache_spill").fetchone()[0]
+    conn.execute("PRAGMA wal_autocheckpoint = 0")
+    conn.execute("PRAGMA cache_spill = 0")
+    try:
+        yield conn
+    finally:
+        conn.execute(f"PRAGMA wal_autocheckpoint = {int(autocheckpoint_anterior)}")
+        if cache_spill_anterior:
+            # ON volta a usar o limite de paginas ja configurado
+            conn.execute("PRAGMA cache_spill = ON")
+        if not conn.in_transaction:
+            try:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            except sqlite3.Error as e:
+                logger.debug(f"[DB] Aviso ao executar wal_checkpoint: {e}")
+
 def validar_parametros_banco(db_path: str, table_name: str) -> None:
     """
     Valida parâmetros de entrada para operações de banco.
@@ -1771,7 +2809,7 @@ def validar_parametros_banco(db_path: str, table_name: str) -> None:
         raise ValueError("table_name deve ser uma string não vazia")
     
     # Validação de segurança SQL injection
-    if not table_name.replace('_', '').isalnum():
+    if not _PADRAO_NOME_TABELA.fullmatch(table_name):
         raise ValueError(f"table_name contém caracteres inválidos: {table_name}")
     
     # Verifica se diretório é acessível
@@ -1828,14 +2866,23 @@ def criar_schema_base(conn: sqlite3.Connection, table_name: str) -> None:
             
             -- Campos de controle
             xml_baixado BOOLEAN DEFAULT 0,
-            anomesdia INTEGER DEFAULT NULL,
+            -- YYYYMMDD derivado de dEmi pelo proprio SQLite a cada escrita (sempre indexavel)
+            anomesdia INTEGER GENERATED ALWAYS AS (
+                CASE WHEN dEmi LIKE '____-__-__' THEN CAST(REPLACE(dEmi, '-', '') AS INTEGER) END
+            ) STORED,
             caminho_arquivo TEXT DEFAULT NULL,
-            xml_vazio INTEGER DEFAULT 0
+            xml_vazio INTEGER DEFAULT 0,
+            
+            -- Chave gravada ja normalizada (sem espacos nem marcador vazio): permite
+            -- as consultas de invalidos compararem com IN ('', '-') sem TRIM()
+            CHECK (cChaveNFe = TRIM(cChaveNFe) AND cChaveNFe NOT IN ('', '-'))
         )
     """
     
     try:
         conn.execute(schema_sql)
+        if _adicionar_anomesdia_gerada(conn, table_name):
+            logger.info(f"[SCHEMA] Coluna gerada anomesdia adicionada à tabela '{table_name}'")
         logger.info(f"[SCHEMA] Tabela '{table_name}' criada/verificada com sucesso")
     except sqlite3.Error as e:
         raise SchemaError(f"Falha ao criar tabela {table_name}: {e}")
@@ -1847,6 +2894,13 @@ def criar_indices_otimizados(conn: sqlite3.Connection, table_name: str) -> None:
     Índices baseados na análise da estrutura atual do banco,
     incluindo todos os índices necessários para performance.
     
+    Todos os comandos rodam numa unica transacoo (BEGIN IMMEDIATE): um só
+    commit/fsync para o lote inteiro de DDL. Se a conexoo ja estiver numa
+    transacoo, os índices entram nela e o commit fica com o chamador.
+    
+    Ao final executa ANALYZE na tabela, para que o planejador escolha entre
+    os índices sobrepostos com base na seletividade real.
+    
     Args:
         conn: Conexão SQLite ativa
         table_name: Nome da tabela
@@ -1854,37 +2908,37 @@ def criar_indices_otimizados(conn: sqlite3.Connection, table_name: str) -> None:
     Raises:
         SchemaError: Se não conseguir criar índices
     """
-    indices = [
-        # Índice único para chave primária (conforme imagem)
-        f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table_name}_chave ON {table_name}(cChaveNFe)",
-        
-        # Índices simples conforme estrutura do banco
-        f"CREATE INDEX IF NOT EXISTS idx_baixado ON {table_name}(xml_baixado)",
-        f"CREATE INDEX IF NOT EXISTS idx_chave ON {table_name}(cChaveNFe)",
-        f"CREATE UNIQUE INDEX IF NOT EXISTS idx_chave_nfe ON {table_name}(cChaveNFe)",
-        f"CREATE INDEX IF NOT EXISTS idx_dEmi_baixado ON {table_name}(dEmi, xml_baixado)",
-        f"CREATE INDEX IF NOT EXISTS idx_dEmi_nNF ON {table_name}(dEmi, nNF)",
-        f"CREATE INDEX IF NOT EXISTS idx_data_emissao ON {table_name}(dEmi) WHERE dEmi IS NOT NULL",
-        f"CREATE INDEX IF NOT EXISTS idx_notas_baixado ON {table_name}(xml_baixado)",
-        f"CREATE UNIQUE INDEX IF NOT EXISTS idx_notas_chave ON {table_name}(cChaveNFe)",
-        f"CREATE INDEX IF NOT EXISTS idx_notas_data ON {table_name}(dEmi, nNF)",
-        f"CREATE INDEX IF NOT EXISTS idx_notas_pendentes ON {table_name}(dEmi) WHERE xml_baixado = 0",
-        f"CREATE INDEX IF NOT EXISTS idx_xml_vazio ON {table_name}(xml_vazio) WHERE xml_vazio = 1",
-        
-        # Índices para a coluna anomesdia (YYYYMMDD)
-        f"CREATE INDEX IF NOT EXISTS idx_anomesdia ON {table_name}(anomesdia)",
-        f"CREATE INDEX IF NOT EXISTS idx_anomesdia_baixado ON {table_name}(anomesdia, xml_baixado)",
-        f"CREATE INDEX IF NOT EXISTS idx_anomesdia_pendentes ON {table_name}(anomesdia) WHERE xml_baixado = 0"
-    ]
+    indices = [sql_indice.format(table=table_name) for sql_indice in _INDICES_OTIMIZADOS]
+    
+    chave_primaria = any(
+        coluna[1] == 'cChaveNFe' and coluna[5]
+        for coluna in conn.execute(f"PRAGMA table_info({table_name})")
+    )
+    if chave_primaria:
+        indices.extend(sql_indice.format(table=table_name) for sql_indice in _INDICES_CHAVE_REDUNDANTES)
     
     indices_criados = 0
-    for sql_indice in indices:
-        try:
-            conn.execute(sql_indice)
-            indices_criados += 1
-        except sqlite3.Error as e:
-            # Log warning mas não falha - alguns índices podem já existir
-            logger.debug(f"[ÍNDICE] Aviso ao criar índice: {e}")
+    transacao_propria = not conn.in_transaction
+    if transacao_propria:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        for sql_indice in indices:
+            try:
+                conn.execute(sql_indice)
+                indices_criados += 1
+            except sqlite3.Error as e:
+                # Log warning mas não falha - alguns índices podem já existir
+                logger.debug(f"[ÍNDICE] Aviso ao criar índice: {e}")
+        
+        conn.execute("PRAGMA analysis_limit = 400")
+        conn.execute(f"ANALYZE {table_name}")
+        
+        if transacao_propria:
+            conn.commit()
+    except BaseException:
+        if transacao_propria:
+            conn.rollback()
+        raise
     
     logger.info(f"[ÍNDICE] {indices_criados}/{len(indices)} comandos de índice executados")
 
@@ -1956,9 +3010,9 @@ def iniciar_db(
     # 1. Validação rigorosa de parâmetros
     validar_parametros_banco(db_path, table_name)
     
-    # 2. Configuração padrão se não fornecida
+    # 2. Configuração padrão se não fornecida (inicialização é fase de processo único)
     if config is None:
-        config = DatabaseConfig()
+        config = DatabaseConfig.exclusive()
     
     inicio = time.time()
     
@@ -1966,7 +3020,11 @@ def iniciar_db(
         # 3. Conexão otimizada com context manager
         with conexao_otimizada(db_path, config) as conn:
             
-            # 4. Criação do schema base
+            # 4. PRAGMAs persistentes (page_size só vale para banco ainda vazio)
+            for pragma, valor in SQLITE_PRAGMAS_PERSISTENTES.items():
+                conn.execute(f"PRAGMA {pragma} = {valor}")
+            
+            # 4.1 Criação do schema base
             logger.info(f"[DB] Criando schema para tabela '{table_name}'...")
             criar_schema_base(conn, table_name)
             
@@ -2118,26 +3176,88 @@ def atualizar_status_xml(
         return
 
     try:
-        with sqlite3.connect(db_path) as conn:
-            conn.execute("PRAGMA journal_mode=WAL")
-            conn.execute("PRAGMA synchronous=NORMAL")
-            conn.execute("PRAGMA temp_store=MEMORY")
+        # Conexão reutilizada da thread (PRAGMAs aplicados uma unica vez na abertura)
+        conn = _obter_conexao(db_path)
+        with conn:
+            cursor = conn.execute(_Q_ATUALIZAR_STATUS_XML, (caminho_arquivo, xml_vazio, chave))
+
+        if cursor.rowcount == 0:
+            logger.warning(f"[ALERT] Nenhum registro atualizado para chave: {chave}")
+    except Exception as e:
+        logger.exception(f"[ERRO] Falha ao atualizar status do XML para {chave}: {e}")
 
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                UPDATE notas 
-                SET xml_baixado = 1, caminho_arquivo = ?, xml_vazio = ? 
-                WHERE cChaveNFe = ? AND (? IS NOT NULL)
-                """,
-                (caminho_arquivo, xml_vazio, chave, caminho_arquivo)
-            )
 
-            if cursor.rowcount == 0:
-                logger.warning(f"[ALERT] Nenhum registro atualizado para chave: {chave}")
+def atualizar_status_xml_lote(
+    db_path: str,
+    registros: List[Tuple[str, Path, int]]
+) -> int:
+    """
+    Versoo em lote de atualizar_status_xml(): um unico executemany numa transacoo.
+    
+    A verificacoo dos arquivos (exists/resolve) roda antes, em threads, para
+    que a transacoo fique curta e cubra apenas os UPDATEs (um só commit/fsync).
+    No primeiro lote de cada banco no processo executa ANALYZE notas, ja que
+    xml_baixado muda de seletividade apos as atualizacões em massa.
+    
+    Args:
+        db_path: Caminho do banco SQLite
+        registros: Tuplas (chave, caminho do XML, xml_vazio)
+        
+    Returns:
+        Quantidade de registros atualizados no banco
+        
+    Examples:
+        >>> atualizar_status_xml_lote("omie.db", [(chave, Path("resultado/.../x.xml"), 0)])
+    """
+    if not registros:
+        return 0
+    
+    def preparar(registro: Tuple[str, Path, int]) -> Optional[Tuple[str, int, str]]:
+        chave, caminho, xml_vazio = registro
+        if not chave:
+            return None
+        caminho = Path(caminho)
+        if not caminho.exists():
+            return None
+        return (str(caminho.resolve()), xml_vazio, chave)
+    
+    max_workers = min(32, (os.cpu_count() or 1) + 4)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        linhas = [linha for linha in executor.map(preparar, registros) if linha is not None]
+    
+    ignorados = len(registros) - len(linhas)
+    if ignorados:
+        logger.warning("[ERRO] %d XML(s) ignorados no lote: chave ausente ou arquivo inexistente", ignorados)
+    if not linhas:
+        return 0
+    
+    try:
+        conn = _obter_conexao(db_path)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            alteracoes_antes = conn.total_changes
+            conn.executemany(_Q_ATUALIZAR_STATUS_XML, linhas)
+            atualizados = conn.total_changes - alteracoes_antes
             conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
     except Exception as e:
-        logger.exception(f"[ERRO] Falha ao atualizar status do XML para {chave}: {e}")
+        logger.exception(f"[ERRO] Falha ao atualizar status de {len(linhas)} XML(s) em lote: {e}")
+        return 0
+    
+    if atualizados < len(linhas):
+        logger.warning("[ALERT] %d chave(s) do lote sem registro no banco", len(linhas) - atualizados)
+    
+    if db_path not in _bancos_analisados:
+        _bancos_analisados.add(db_path)
+        try:
+            conn.execute("PRAGMA analysis_limit = 400")
+            conn.execute("ANALYZE notas")
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.debug(f"[DB] Aviso ao executar ANALYZE apos lote: {e}")
+    return atualizados
 
 
 def listar_notas_por_data_numero(db_path: str) -> list[tuple]:
@@ -2148,19 +3268,87 @@ def listar_notas_por_data_numero(db_path: str) -> list[tuple]:
         db_path: Caminho do banco SQLite.
 
     Returns:
-        Lista de tuplas (cChaveNFe, dEmi, nNF, ...outros campos) ordenadas.
+        Lista de tuplas (cChaveNFe, dEmi, nNF, ...outros campos) ordenadas.
+    """
+    try:
+        cursor = _obter_conexao(db_path).execute(
+            "SELECT * FROM notas ORDER BY dEmi ASC, nNF ASC"
+        )
+        resultados = cursor.fetchall()
+        logger.info(f"[DB] {len(resultados)} notas listadas por data/numero.")
+        return resultados
+    except Exception as e:
+        logger.error(f"[DB] Erro ao listar notas por data/numero: {e}")
+        return []
+
+
+def iter_notas_por_data_numero(
+    db_path: str,
+    colunas: Tuple[str, ...] = ('cChaveNFe', 'dEmi', 'nNF')
+) -> Iterator[Tuple]:
+    """
+    Versoo em streaming de listar_notas_por_data_numero(), lendo só as colunas pedidas.
+    
+    O cursor é lido em blocos de TAMANHO_BLOCO_CURSOR linhas, sem materializar
+    a tabela inteira. Com as colunas padrão a consulta é respondida apenas pelo
+    índice idx_notas_data (dEmi, nNF, cChaveNFe): a ordenacoo vem do índice e
+    não há acesso às linhas da tabela.
+    
+    Args:
+        db_path: Caminho do banco SQLite
+        colunas: Colunas a ler, na ordem das tuplas produzidas
+        
+    Yields:
+        Tuple: Valores das colunas de cada nota, ordenadas por dEmi e nNF
+        
+    Raises:
+        ValueError: Se algum nome de coluna noo for um identificador valido
+        
+    Note:
+        Usa a conexão reutilizavel da thread; consuma o iterador por completo
+        antes de usar a mesma conexão para escrita.
+        
+    Examples:
+        >>> for chave, dEmi, nNF in iter_notas_por_data_numero("omie.db"):
+        ...     processar(chave, dEmi, nNF)
+    """
+    sql = _sql_notas_por_data_numero(tuple(colunas))
+    
+    try:
+        cursor = _obter_conexao(db_path).cursor()
+        cursor.arraysize = TAMANHO_BLOCO_CURSOR
+        cursor.execute(sql)
+        
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            yield from rows
+    except sqlite3.Error as e:
+        logger.error(f"[DB] Erro ao listar notas por data/numero: {e}")
+
+def _extrair_dEmi_xml(xml_path: Path) -> Optional[str]:
+    """
+    Lê o dEmi (infNFe/ide/dEmi) parando no primeiro encontrado.
+    
+    Usa ET.iterparse em vez de ET.parse: só o inicio do arquivo (até o fim do
+    bloco ide) é lido e montado, sem construir a arvore do XML inteiro.
+    
+    Returns:
+        Texto do dEmi, ou None se o bloco ide terminar sem ele
     """
-    try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.execute(
-                "SELECT * FROM notas ORDER BY dEmi ASC, nNF ASC"
-            )
-            resultados = cursor.fetchall()
-        logger.info(f"[DB] {len(resultados)} notas listadas por data/numero.")
-        return resultados
-    except Exception as e:
-        logger.error(f"[DB] Erro ao listar notas por data/numero: {e}")
-        return []
+    dentro_ide = False
+    for evento, elem in ET.iterparse(xml_path, events=("start", "end")):
+        tag = elem.tag.rpartition("}")[2]
+        if evento == "start":
+            if tag == "ide":
+                dentro_ide = True
+        elif tag == "dEmi" and dentro_ide:
+            return elem.text
+        elif tag == "ide":
+            return None
+    return None
+
 
 def atualizar_dEmi_registros_pendentes(db_path: str, resultado_dir: str = "resultado") -> None:
     """
@@ -2169,47 +3357,40 @@ def atualizar_dEmi_registros_pendentes(db_path: str, resultado_dir: str = "resul
         db_path: Caminho do banco SQLite.
         resultado_dir: Diretorio base onde os XMLs estoo salvos.
     """
-    import xml.etree.ElementTree as ET
-    from pathlib import Path
-
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.execute("SELECT cChaveNFe, nNF FROM notas WHERE xml_baixado = 0 AND (dEmi IS NULL OR dEmi = '')")
-            pendentes = cursor.fetchall()
+        conn = _obter_conexao(db_path)
+        cursor = conn.execute("SELECT cChaveNFe, nNF FROM notas WHERE xml_baixado = 0 AND (dEmi IS NULL OR dEmi = '')")
+        pendentes = cursor.fetchall()
         logger.info(f"[DB] Encontrados {len(pendentes)} registros pendentes para atualizacao de dEmi.")
-        atualizados = 0
+        if not pendentes:
+            return
+        
+        # Uma unica varredura do diretorio; cada registro é resolvido por consulta no dict
+        indice_xmls = _indexar_xmls_por_chave(resultado_dir)
+        
+        atualizacoes: List[Tuple[str, str]] = []
         for chave, nNF in pendentes:
-            # Busca arquivo XML pelo padroo de nome
-            xml_path = None
-            for root, dirs, files in os.walk(resultado_dir):
-                for file in files:
-                    if file.endswith(".xml") and chave in file:
-                        xml_path = Path(root) / file
-                        break
-                if xml_path:
-                    break
-            if not xml_path or not xml_path.exists():
+            xml_path = indice_xmls.get(chave)
+            if xml_path is None:
                 logger.warning(f"[dEmi] XML noo encontrado para chave {chave}.")
                 continue
             try:
-                tree = ET.parse(xml_path)
-                root = tree.getroot()
-                # Tenta extrair dEmi (padroo NFe: infNFe/ide/dEmi)
-                dEmi_elem = root.find(".//{*}ide/{*}dEmi")
-                if dEmi_elem is not None and dEmi_elem.text:
-                    dEmi = dEmi_elem.text
-                    # Normaliza para formato ISO
-                    dEmi_norm = normalizar_data(dEmi)
-                    with sqlite3.connect(db_path) as conn:
-                        conn.execute("UPDATE notas SET dEmi = ? WHERE cChaveNFe = ?", (dEmi_norm, chave))
-                        conn.commit()
-                    atualizados += 1
-                    logger.info(f"[dEmi] Atualizado para chave {chave}: {dEmi_norm}")
+                # Tenta extrair dEmi (padroo NFe: infNFe/ide/dEmi), lendo só até o bloco ide
+                dEmi = _extrair_dEmi_xml(xml_path)
+                if dEmi:
+                    # Normalizacoo para ISO feita no UPDATE (_Q_ATUALIZAR_DEMI)
+                    atualizacoes.append((dEmi, chave))
+                    logger.info(f"[dEmi] Atualizado para chave {chave}: {dEmi}")
                 else:
                     logger.warning(f"[dEmi] Elemento dEmi noo encontrado no XML para chave {chave}.")
             except Exception as e:
                 logger.warning(f"[dEmi] Falha ao extrair dEmi do XML {xml_path} para chave {chave}: {e}")
-        logger.info(f"[DB] atualizacao concluida. {atualizados} registros tiveram dEmi preenchido.")
+        
+        # Todos os UPDATEs numa unica transacoo
+        if atualizacoes:
+            with conn:
+                conn.executemany(_Q_ATUALIZAR_DEMI, atualizacoes)
+        logger.info(f"[DB] atualizacao concluida. {len(atualizacoes)} registros tiveram dEmi preenchido.")
     except Exception as e:
         logger.error(f"[DB] Erro ao atualizar dEmi dos registros pendentes: {e}")
 
@@ -2223,22 +3404,26 @@ def _extrair_valor_xml(root_xml, campo: str) -> Optional[str]:
         Valor extraido ou None.
     """
     if campo == "cnpj_cpf":
-        elem_cnpj = root_xml.find(".//{*}dest/{*}CNPJ")
-        elem_cpf = root_xml.find(".//{*}dest/{*}CPF")
-        valor = elem_cnpj.text if elem_cnpj is not None and elem_cnpj.text else (
-            elem_cpf.text if elem_cpf is not None and elem_cpf.text else None
-        )
-        return valor.strip() if valor else None
+        # Um só percurso da arvore até dest; CNPJ/CPF são filhos diretos dele
+        dest = root_xml.find(".//{*}dest")
+        if dest is None:
+            return None
+        for filho in ("{*}CNPJ", "{*}CPF"):
+            elem = dest.find(filho)
+            if elem is not None and elem.text:
+                return elem.text.strip()
+        return None
     else:
         elem = root_xml.find(XPATHS[campo])
         return elem.text.strip() if elem is not None and elem.text else None
 
 def _indexar_xmls_por_chave(resultado_dir: str) -> dict[str, Path]:
     """
-    Indexa todos os arquivos XML por chave fiscal (cChaveNFe) com processamento paralelo otimizado.
+    Indexa todos os arquivos XML por chave fiscal (cChaveNFe) numa unica passada.
     
     Otimizações implementadas:
-    - Processamento paralelo com ThreadPoolExecutor
+    - Laço direto sobre os nomes (trabalho só de CPU: threads apenas somariam
+      custo de futures/fila sob o GIL)
     - Validação rigorosa da chave fiscal (44 caracteres alfanuméricos)
     - Logging com progresso em tempo real
     - Tratamento robusto de erros
@@ -2291,7 +3476,7 @@ def _indexar_xmls_por_chave(resultado_dir: str) -> dict[str, Path]:
     
     # Lista todos os arquivos XML
     try:
-        todos_xmls = list(resultado_path.rglob("*.xml")) # A função rglob permite buscar recursivamente usando pathlib que é mais eficiente que os.walk ou os.listdir (escrito em cpython ) + Pattern matching integrado (aplicação de filtro direto no sistema de arquivos durante a busca)
+        todos_xmls = descobrir_todos_xmls(resultado_path)  # os.scandir por subarvore, sem fnmatch nem Path por entrada
     except OSError as e:
         logger.error(f"[CAMPOS] Erro ao acessar diretório {resultado_dir}: {e}")
         return {}
@@ -2307,50 +3492,48 @@ def _indexar_xmls_por_chave(resultado_dir: str) -> dict[str, Path]:
     
     logger.info(f"[CAMPOS] Encontrados {total_arquivos} arquivos XML para indexar")
     
-    # Processamento paralelo
+    # Passada unica sobre a lista ja materializada (só nomes, sem I/O por arquivo)
     xml_index: dict[str, Path] = {}
+    # mtime do XML mantido para cada chave duplicada: um só stat por colisão
+    mtimes: dict[str, float] = {}
     processados = 0
     duplicatas = 0
     
-    # Usa numero de workers baseado no numero de CPUs disponíveis
-    max_workers = min(32, (os.cpu_count() or 1) + 4)
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submete todos os arquivos para processamento
-        future_to_xml = {executor.submit(processar_arquivo_xml, xml_file): xml_file 
-                        for xml_file in todos_xmls}
-        
-        # Processa resultados conforme completam
-        for future in concurrent.futures.as_completed(future_to_xml):
-            xml_file = future_to_xml[future]
-            try:
-                resultado = future.result()
-                if resultado:
-                    chave, caminho = resultado
-                    if chave in xml_index:
-                        # Lida com duplicatas (mantém o mais recente)
-                        xml_existente = xml_index[chave]
-                        if caminho.stat().st_mtime > xml_existente.stat().st_mtime:
-                            logger.debug(f"[CAMPOS] Chave duplicada, mantendo mais recente: {chave}")
-                            xml_index[chave] = caminho
-                        duplicatas += 1
-                    else:
+    for xml_file in todos_xmls:
+        try:
+            resultado = processar_arquivo_xml(xml_file)
+            if resultado:
+                chave, caminho = resultado
+                xml_existente = xml_index.get(chave)
+                if xml_existente is None:
+                    xml_index[chave] = caminho
+                else:
+                    # Lida com duplicatas (mantém o mais recente): stat só na colisão
+                    mtime_existente = mtimes.get(chave)
+                    if mtime_existente is None:
+                        mtime_existente = xml_existente.stat().st_mtime
+                    mtime_novo = caminho.stat().st_mtime
+                    if mtime_novo > mtime_existente:
+                        logger.debug(f"[CAMPOS] Chave duplicada, mantendo mais recente: {chave}")
                         xml_index[chave] = caminho
-                    
-                processados += 1
-
-                # Log de progresso a cada 200 arquivos processados
-                if processados % 200 == 0:
-                    tempo_decorrido = time.time() - inicio
-                    taxa = processados / tempo_decorrido
-                    tempo_restante = (total_arquivos - processados) / taxa if taxa > 0 else 0
-                    logger.info(f"[CAMPOS] Progresso: {processados}/{total_arquivos} "
-                              f"({processados/total_arquivos*100:.1f}%) - "
-                              f"Taxa: {taxa:.0f} arq/s - "
-                              f"Tempo restante: {tempo_restante:.0f}s")
-                    
-            except Exception as e:
-                logger.warning(f"[CAMPOS] Erro ao processar {xml_file}: {e}")
+                        mtime_existente = mtime_novo
+                    mtimes[chave] = mtime_existente
+                    duplicatas += 1
+                
+            processados += 1
+
+            # Log de progresso a cada 200 arquivos (calculos e formatacoo só com INFO ativo)
+            if processados % 200 == 0 and logger.isEnabledFor(logging.INFO):
+                tempo_decorrido = time.time() - inicio
+                taxa = processados / tempo_decorrido if tempo_decorrido > 0 else 0
+                tempo_restante = (total_arquivos - processados) / taxa if taxa > 0 else 0
+                logger.info(
+                    "[CAMPOS] Progresso: %d/%d (%.1f%%) - Taxa: %.0f arq/s - Tempo restante: %.0fs",
+                    processados, total_arquivos, processados / total_arquivos * 100, taxa, tempo_restante
+                )
+                
+        except Exception as e:
+            logger.warning(f"[CAMPOS] Erro ao processar {xml_file}: {e}")
     
     tempo_total = time.time() - inicio
     total_indexado = len(xml_index)
@@ -2364,13 +3547,17 @@ def _indexar_xmls_por_chave(resultado_dir: str) -> dict[str, Path]:
     
     return xml_index
 
+
 def atualizar_campos_registros_pendentes(db_path: str, resultado_dir: str = "resultado") -> None:
     """
     Verifica se os arquivos marcados como xml_baixado = 0 realmente não foram baixados,
     atualizando o status quando encontrados nos diretórios locais.
     
     Funcionalidades implementadas:
-    - Processamento paralelo otimizado com concurrent.futures
+    - Anti-join no SQLite (chaves dos XMLs em tabela temporaria): só os pendentes
+      com arquivo no disco são lidos para o Python
+    - Verificação dentro do SQLite (funcões sobre o índice de XMLs): os
+      resultados vão para uma tabela temporaria sem passar pelo Python
     - Verificação inteligente baseada na estrutura de nomes dos arquivos
     - Extração de campos essenciais (dEmi, nNF, cChaveNFe) dos nomes dos arquivos
     - Updates em batch para máxima performance
@@ -2403,268 +3590,140 @@ def atualizar_campos_registros_pendentes(db_path: str, resultado_dir: str = "res
     t1 = time.time()
     logger.info(f"[VERIFICAÇÃO] XMLs indexados em {t1-t0:.2f}s ({len(xml_index)} arquivos)")
 
-    # 2. Busca otimizada dos registros marcados como não baixados usando views e índices
+    # 2. Verificacoo dentro do SQLite: funcões registradas na conexão consultam o
+    #    xml_index, e cada XML pendente custa um stat (existencia e tamanho juntos).
+    #    Nenhuma linha cruza para o Python e volta em executemany
+    def caminho_xml(chave: str) -> Optional[str]:
+        """Caminho absoluto do XML da chave no índice."""
+        try:
+            return str(xml_index[chave][0].resolve())
+        except Exception as e:
+            logger.warning(f"[VERIFICAÇÃO] Erro ao resolver caminho de {chave}: {e}")
+            return None
+
+    def tamanho_xml(chave: str) -> Optional[int]:
+        """Tamanho em bytes do XML da chave; None se o arquivo sumiu ou falhou."""
+        xml_path = xml_index[chave][0]
+        try:
+            return xml_path.stat().st_size
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"[VERIFICAÇÃO] Erro ao acessar arquivo {xml_path}: {e}")
+            return None
+
+    def dado_nome_xml(chave: str, campo: str) -> Optional[str]:
+        """Campo (dEmi, nNF) extraido do nome do XML da chave."""
+        return xml_index[chave][1].get(campo) or None
+
+    # 3. Anti-join no SQLite: chaves indexadas numa tabela temporaria e JOIN com os
+    #    pendentes; só as linhas que têm XML no disco são verificadas, e o resultado
+    #    vai direto para a tabela temporaria aplicada pelo UPDATE ... FROM
     t2 = time.time()
     try:
-        with sqlite3.connect(db_path) as conn:
-            # Configurações de performance para SQLite
-            for pragma, value in SQLITE_PRAGMAS.items():
-                conn.execute(f"PRAGMA {pragma} = {value}")
+        # Conexão reutilizada da thread (PRAGMAs aplicados uma unica vez na abertura)
+        conn = _obter_conexao(db_path)
+        with conn:
+            total_pendentes = conn.execute("SELECT COUNT(*) FROM notas WHERE xml_baixado = 0").fetchone()[0]
             
-            # Usa view otimizada se disponível, senão usa query com índices
-            if db_otimizacoes.get('vw_notas_pendentes', False):
-                # Usa view otimizada que já tem filtros e índices aplicados
-                logger.debug("[VERIFICAÇÃO] Usando view otimizada 'vw_notas_pendentes'")
-                cursor = conn.execute("""
-                    SELECT cChaveNFe, nNF, dEmi, anomesdia
-                    FROM vw_notas_pendentes
-                    ORDER BY anomesdia DESC, cChaveNFe
-                """)
-            elif db_otimizacoes.get('idx_anomesdia_baixado', False):
-                # Usa índice específico disponível
-                logger.debug("[VERIFICAÇÃO] Usando índice específico 'idx_anomesdia_baixado'")
-                cursor = conn.execute("""
-                    SELECT cChaveNFe, nNF, dEmi, anomesdia
-                    FROM notas INDEXED BY idx_anomesdia_baixado
-                    WHERE xml_baixado = 0
-                    ORDER BY anomesdia DESC, cChaveNFe
-                """)
-            elif db_otimizacoes.get('idx_baixado', False):
-                # Usa índice genérico para xml_baixado
-                logger.debug("[VERIFICAÇÃO] Usando índice 'idx_baixado'")
-                cursor = conn.execute("""
-                    SELECT cChaveNFe, nNF, dEmi, 
-                           COALESCE(anomesdia, 
-                                   CASE WHEN dEmi IS NOT NULL 
-                                        THEN CAST(REPLACE(dEmi, '-', '') AS INTEGER)
-                                        ELSE NULL END) as anomesdia
-                    FROM notas INDEXED BY idx_baixado
-                    WHERE xml_baixado = 0
-                    ORDER BY anomesdia DESC NULLS LAST, cChaveNFe
-                """)
-            else:
-                # Query padrão sem hints específicos
-                logger.debug("[VERIFICAÇÃO] Usando consulta padrão sem índices específicos")
-                cursor = conn.execute("""
-                    SELECT cChaveNFe, nNF, dEmi, 
-                           COALESCE(anomesdia, 
-                                   CASE WHEN dEmi IS NOT NULL 
-                                        THEN CAST(REPLACE(dEmi, '-', '') AS INTEGER)
-                                        ELSE NULL END) as anomesdia
-                    FROM notas 
-                    WHERE xml_baixado = 0
-                    ORDER BY anomesdia DESC NULLS LAST, cChaveNFe
-                """)
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS _xmls_encontrados (chave TEXT PRIMARY KEY) WITHOUT ROWID")
+            conn.execute("DELETE FROM temp._xmls_encontrados")
+            conn.executemany(
+                "INSERT INTO temp._xmls_encontrados (chave) VALUES (?)",
+                ((chave,) for chave in xml_index)
+            )
+            conn.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS _xmls_verificados (
+                    chave TEXT PRIMARY KEY,
+                    caminho TEXT,
+                    tamanho INTEGER,
+                    dEmi TEXT,
+                    nNF TEXT
+                ) WITHOUT ROWID
+            """)
+            conn.execute("DELETE FROM temp._xmls_verificados")
             
-            pendentes = cursor.fetchall()
-    except sqlite3.OperationalError as e:
-        # Se índice específico não existir, usa consulta padrão otimizada
-        logger.warning(f"[VERIFICAÇÃO] Índice específico não encontrado, usando consulta padrão: {e}")
-        try:
-            with sqlite3.connect(db_path) as conn:
-                for pragma, value in SQLITE_PRAGMAS.items():
-                    conn.execute(f"PRAGMA {pragma} = {value}")
-                
-                # Query otimizada usando qualquer índice disponível para xml_baixado
-                cursor = conn.execute("""
-                    SELECT cChaveNFe, nNF, dEmi, 
-                           COALESCE(anomesdia, 
-                                   CASE WHEN dEmi IS NOT NULL 
-                                        THEN CAST(REPLACE(dEmi, '-', '') AS INTEGER)
-                                        ELSE NULL END) as anomesdia
-                    FROM notas 
-                    WHERE xml_baixado = 0
-                    ORDER BY anomesdia DESC NULLS LAST, cChaveNFe
-                """)
-                pendentes = cursor.fetchall()
-        except Exception as inner_e:
-            logger.error(f"[VERIFICAÇÃO] Erro na consulta fallback: {inner_e}")
-            return
+            conn.create_function("caminho_xml", 1, caminho_xml)
+            conn.create_function("tamanho_xml", 1, tamanho_xml)
+            conn.create_function("dado_nome_xml", 2, dado_nome_xml, deterministic=True)
+            try:
+                # Percorre a tabela temporaria e busca cada chave pela PRIMARY KEY de notas;
+                # dEmi/nNF do nome do arquivo só quando vazios no banco
+                com_xml_no_disco = conn.execute("""
+                    INSERT INTO temp._xmls_verificados (chave, caminho, tamanho, dEmi, nNF)
+                    SELECT
+                        n.cChaveNFe,
+                        caminho_xml(n.cChaveNFe),
+                        tamanho_xml(n.cChaveNFe),
+                        CASE WHEN n.dEmi IS NULL OR n.dEmi = '' THEN dado_nome_xml(n.cChaveNFe, 'dEmi') END,
+                        CASE WHEN n.nNF IS NULL OR n.nNF = '' THEN dado_nome_xml(n.cChaveNFe, 'nNF') END
+                    FROM temp._xmls_encontrados x
+                    JOIN notas n ON n.cChaveNFe = x.chave
+                    WHERE n.xml_baixado = 0
+                """).rowcount
+            finally:
+                # Conexão do pool: as funcões não devem manter o xml_index vivo
+                for nome, n_args in (("caminho_xml", 1), ("tamanho_xml", 1), ("dado_nome_xml", 2)):
+                    conn.create_function(nome, n_args, None)
+            
+            # A conexão continua aberta: libera as chaves da tabela temporaria
+            conn.execute("DELETE FROM temp._xmls_encontrados")
+            # Arquivos removidos ou inacessiveis desde a indexacoo não são atualizados
+            erros = conn.execute(
+                "DELETE FROM temp._xmls_verificados WHERE caminho IS NULL OR tamanho IS NULL"
+            ).rowcount
+            encontrados, arquivos_vazios = conn.execute(
+                "SELECT COUNT(*), COUNT(*) FILTER (WHERE tamanho < ?) FROM temp._xmls_verificados",
+                (TAMANHO_MINIMO_XML,)
+            ).fetchone()
     except Exception as e:
-        logger.error(f"[VERIFICAÇÃO] Erro ao buscar registros pendentes: {e}")
+        logger.error(f"[VERIFICAÇÃO] Erro ao verificar registros pendentes: {e}")
         return
         
     t3 = time.time()
-    logger.info(f"[VERIFICAÇÃO] {len(pendentes)} registros marcados como não baixados carregados em {t3-t2:.2f}s")
+    logger.info(
+        f"[VERIFICAÇÃO] {total_pendentes} registros marcados como não baixados, "
+        f"{com_xml_no_disco} com XML no disco, verificados em {t3-t2:.2f}s"
+    )
     
-    if not pendentes:
-        logger.info("[VERIFICAÇÃO] Nenhum registro marcado como não baixado encontrado")
+    if not com_xml_no_disco:
+        logger.info("[VERIFICAÇÃO] Nenhum registro marcado como não baixado com XML no disco")
         return
 
-    # 3. Processamento paralelo otimizado
-    def processar_lote_verificacao(lote_registros: List[Tuple]) -> List[Dict]:
-        """Processa um lote de registros verificando se foram realmente baixados"""
-        resultados_lote = []
-        
-        for registro in lote_registros:
-            # Adaptação para suportar tanto 3 quanto 4 campos (com anomesdia)
-            if len(registro) == 4:
-                chave_nfe, nnf_db, demi_db, anomesdia_db = registro
-            else:
-                chave_nfe, nnf_db, demi_db = registro
-                anomesdia_db = None
-            
-            # Busca arquivo XML correspondente no índice
-            dados_xml = xml_index.get(chave_nfe)
-            if not dados_xml:
-                resultados_lote.append({"chave": chave_nfe, "status": "nao_encontrado"})
-                continue
-                
-            xml_path, dados_extraidos = dados_xml
-            
-            if not xml_path.exists():
-                resultados_lote.append({"chave": chave_nfe, "status": "arquivo_removido"})
-                continue
-                
-            try:
-                # Verifica se o arquivo tem tamanho válido
-                tamanho_arquivo = xml_path.stat().st_size
-                xml_vazio = 1 if tamanho_arquivo < 100 else 0  # Arquivos muito pequenos são considerados vazios
-                
-                # Prepara dados para atualização
-                novos_dados = {
-                    'xml_baixado': 1,
-                    'caminho_arquivo': str(xml_path.resolve()),
-                    'xml_vazio': xml_vazio
-                }
-                
-                # Atualiza campos essenciais se estiverem vazios no banco
-                if dados_extraidos:
-                    if not demi_db and dados_extraidos.get('dEmi'):
-                        novos_dados['dEmi'] = dados_extraidos['dEmi']
-                    if not nnf_db and dados_extraidos.get('nNF'):
-                        novos_dados['nNF'] = dados_extraidos['nNF']
-                
-                resultados_lote.append({
-                    "chave": chave_nfe, 
-                    "status": "encontrado",
-                    "novos_dados": novos_dados,
-                    "tamanho": tamanho_arquivo
-                })
-                
-            except OSError as e:
-                logger.warning(f"[VERIFICAÇÃO] Erro ao acessar arquivo {xml_path}: {e}")
-                resultados_lote.append({"chave": chave_nfe, "status": "erro_acesso"})
-            except Exception as e:
-                logger.warning(f"[VERIFICAÇÃO] Erro inesperado para {chave_nfe}: {e}")
-                resultados_lote.append({"chave": chave_nfe, "status": "erro_geral"})
-                
-        return resultados_lote
-
-    # Divisão em lotes para processamento paralelo
-    t4 = time.time()
-    TAMANHO_LOTE = max(100, len(pendentes) // (os.cpu_count() or 4))
-    lotes = [pendentes[i:i + TAMANHO_LOTE] for i in range(0, len(pendentes), TAMANHO_LOTE)]
-    
-    logger.info(f"[VERIFICAÇÃO] Processando {len(lotes)} lotes de ~{TAMANHO_LOTE} registros...")
-    
-    # Processamento paralelo por lotes
-    todos_resultados = []
-    max_workers = min(os.cpu_count() or 4, len(lotes))
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submete todos os lotes para processamento paralelo
-        future_to_lote = {executor.submit(processar_lote_verificacao, lote): i 
-                         for i, lote in enumerate(lotes)}
-        
-        # Coleta resultados conforme completam
-        for future in concurrent.futures.as_completed(future_to_lote):
-            lote_idx = future_to_lote[future]
-            try:
-                resultados_lote = future.result()
-                todos_resultados.extend(resultados_lote)
-                
-                # Log de progresso apenas para lotes grandes
-                if len(lotes) > 10 and (lote_idx + 1) % max(1, len(lotes) // 10) == 0:
-                    progresso = (lote_idx + 1) / len(lotes) * 100
-                    logger.info(f"[VERIFICAÇÃO] Progresso: {progresso:.0f}% ({lote_idx + 1}/{len(lotes)} lotes)")
-                    
-            except Exception as e:
-                logger.warning(f"[VERIFICAÇÃO] Erro ao processar lote {lote_idx}: {e}")
-    
-    t5 = time.time()
-    logger.info(f"[VERIFICAÇÃO] Processamento paralelo concluído em {t5-t4:.2f}s")
-
     # 4. Atualização em batch otimizada
     t6 = time.time()
-    encontrados = 0
-    nao_encontrados = 0
-    erros = 0
-    arquivos_vazios = 0
-    
-    # Separa resultados por status
-    para_atualizar = []
-    
-    for resultado in todos_resultados:
-        status = resultado.get("status")
-        if status == "encontrado":
-            para_atualizar.append(resultado)
-            encontrados += 1
-            if resultado.get("novos_dados", {}).get("xml_vazio") == 1:
-                arquivos_vazios += 1
-        elif status == "nao_encontrado":
-            nao_encontrados += 1
-        else:
-            erros += 1
+    nao_encontrados = total_pendentes - com_xml_no_disco  # Sem XML no disco (fora do JOIN)
     
     # Executa updates em batch
-    if para_atualizar:
+    if encontrados:
         try:
-            with sqlite3.connect(db_path) as conn:
-                # Configurações de performance máxima
-                for pragma, value in SQLITE_PRAGMAS.items():
-                    conn.execute(f"PRAGMA {pragma} = {value}")
+            # Checkpoint do WAL adiado para o fim da fase de escrita
+            conn = _obter_conexao(db_path)
+            with conn, checkpoint_manual(conn):
                 
-                # Prepara dados para batch update
-                dados_update = []
-                for resultado in para_atualizar:
-                    novos_dados = resultado["novos_dados"]
-                    valores = [
-                        novos_dados.get('xml_baixado', 1),
-                        novos_dados.get('caminho_arquivo', ''),
-                        novos_dados.get('xml_vazio', 0),
-                        novos_dados.get('dEmi'),
-                        novos_dados.get('nNF'),
-                        resultado["chave"]
-                    ]
-                    dados_update.append(valores)
+                anomesdia_gerada = _anomesdia_gerada(conn)
                 
-                # Executa batch update otimizado com hint de índice para WHERE clause
-                # Usa o índice único da chave primária para máxima eficiência
-                query_update = """
-                    UPDATE notas 
-                    SET xml_baixado = ?, 
-                        caminho_arquivo = ?, 
-                        xml_vazio = ?,
-                        dEmi = COALESCE(?, dEmi),
-                        nNF = COALESCE(?, nNF),
-                        anomesdia = COALESCE(
-                            anomesdia,
-                            CASE WHEN COALESCE(?, dEmi) IS NOT NULL 
-                                 THEN CAST(REPLACE(COALESCE(?, dEmi), '-', '') AS INTEGER)
-                                 ELSE NULL END
-                        )
-                    WHERE cChaveNFe = ?
-                """
-                
-                # Prepara dados incluindo dEmi para cálculo de anomesdia
-                dados_update_otimizados = []
-                for resultado in para_atualizar:
-                    novos_dados = resultado["novos_dados"]
-                    demi_para_anomesdia = novos_dados.get('dEmi')
-                    valores = [
-                        novos_dados.get('xml_baixado', 1),
-                        novos_dados.get('caminho_arquivo', ''),
-                        novos_dados.get('xml_vazio', 0),
-                        novos_dados.get('dEmi'),
-                        novos_dados.get('nNF'),
-                        demi_para_anomesdia,  # Para cálculo de anomesdia
-                        demi_para_anomesdia,  # Duplicado para o CASE WHEN
-                        resultado["chave"]
-                    ]
-                    dados_update_otimizados.append(valores)
+                # Trava de escrita obtida já no inicio: sem upgrade de leitura para
+                # escrita (SQLITE_BUSY) no meio do lote
+                conn.execute("BEGIN IMMEDIATE")
                 
-                conn.executemany(query_update, dados_update_otimizados)
+                # Coluna gerada (schema atual): o SQLite recalcula anomesdia ao gravar dEmi
+                atribuicao_anomesdia = "" if anomesdia_gerada else """,
+                        anomesdia = COALESCE(
+                            notas.anomesdia,
+                            CAST(REPLACE(COALESCE(v.dEmi, notas.dEmi), '-', '') AS INTEGER)
+                        )"""
+                conn.execute(f"""
+                    UPDATE notas
+                    SET xml_baixado = 1,
+                        caminho_arquivo = v.caminho,
+                        xml_vazio = v.tamanho < {TAMANHO_MINIMO_XML},
+                        dEmi = COALESCE(v.dEmi, notas.dEmi),
+                        nNF = COALESCE(v.nNF, notas.nNF){atribuicao_anomesdia}
+                    FROM temp._xmls_verificados AS v
+                    WHERE notas.cChaveNFe = v.chave
+                """)
+                conn.execute("DELETE FROM temp._xmls_verificados")
                 conn.commit()
                 
                 # Verificação pós-atualização usando view se disponível
@@ -2684,7 +3743,7 @@ def atualizar_campos_registros_pendentes(db_path: str, resultado_dir: str = "res
                 except Exception as ve:
                     logger.debug(f"[VERIFICAÇÃO] Verificação pós-update opcional falhou: {ve}")
                 
-                logger.info(f"[VERIFICAÇÃO] Batch update executado para {len(dados_update_otimizados)} registros")
+                logger.info(f"[VERIFICAÇÃO] Batch update executado para {encontrados} registros")
                 
         except Exception as e:
             logger.error(f"[VERIFICAÇÃO] Erro durante batch update: {e}")
@@ -2695,20 +3754,18 @@ def atualizar_campos_registros_pendentes(db_path: str, resultado_dir: str = "res
 
     # 5. Relatório final detalhado com estatísticas usando views se disponíveis
     tempo_total = t7 - etapa_inicio
-    taxa_processamento = len(pendentes) / tempo_total if tempo_total > 0 else 0
+    taxa_processamento = total_pendentes / tempo_total if tempo_total > 0 else 0
     
     # Estatísticas adicionais usando views otimizadas
     try:
-        with sqlite3.connect(db_path) as conn:
+        conn = _obter_conexao(db_path)
+        with conn:
             estatisticas_extras = {}
             
-            # Usa view de estatísticas se disponível
+            # Usa view de estatísticas se disponível (a view já devolve os totais agregados)
             if db_otimizacoes.get('vw_notas_mes_atual', False):
                 cursor = conn.execute("""
-                    SELECT 
-                        COUNT(*) as total_mes_atual,
-                        SUM(CASE WHEN xml_baixado = 1 THEN 1 ELSE 0 END) as baixados_mes_atual,
-                        SUM(CASE WHEN xml_vazio = 1 THEN 1 ELSE 0 END) as vazios_mes_atual
+                    SELECT total_notas, baixadas, vazias
                     FROM vw_notas_mes_atual
                 """)
                 stats_mes = cursor.fetchone()
@@ -2719,12 +3776,12 @@ def atualizar_campos_registros_pendentes(db_path: str, resultado_dir: str = "res
                         'vazios_mes_atual': stats_mes[2]
                     })
             
-            # Estatísticas gerais
+            # Estatísticas gerais: respondidas só pelo índice idx_baixado_vazio
             cursor = conn.execute("""
                 SELECT 
                     COUNT(*) as total_geral,
-                    SUM(CASE WHEN xml_baixado = 1 THEN 1 ELSE 0 END) as baixados_geral,
-                    SUM(CASE WHEN xml_vazio = 1 THEN 1 ELSE 0 END) as vazios_geral
+                    COUNT(*) FILTER (WHERE xml_baixado = 1) as baixados_geral,
+                    COUNT(*) FILTER (WHERE xml_vazio = 1) as vazios_geral
                 FROM notas
             """)
             stats_geral = cursor.fetchone()
@@ -2740,7 +3797,7 @@ def atualizar_campos_registros_pendentes(db_path: str, resultado_dir: str = "res
         estatisticas_extras = {}
     
     logger.info(f"[VERIFICAÇÃO] === RESULTADO DA VERIFICAÇÃO ===")
-    logger.info(f"[VERIFICAÇÃO] Registros verificados: {len(pendentes)}")
+    logger.info(f"[VERIFICAÇÃO] Registros verificados: {total_pendentes}")
     logger.info(f"[VERIFICAÇÃO] Arquivos encontrados: {encontrados}")
     logger.info(f"[VERIFICAÇÃO] Arquivos não encontrados: {nao_encontrados}")
     logger.info(f"[VERIFICAÇÃO] Arquivos vazios detectados: {arquivos_vazios}")
@@ -2760,111 +3817,81 @@ def atualizar_campos_registros_pendentes(db_path: str, resultado_dir: str = "res
     logger.info(f"[VERIFICAÇÃO] ==========================================")
 
 
+# Views e índices cuja disponibilidade é reportada por _verificar_views_e_indices_disponiveis
+_VIEWS_E_INDICES_OTIMIZACAO: Tuple[str, ...] = (
+    'vw_notas_pendentes',
+    'vw_notas_mes_atual',
+    'vw_notas_recentes',
+    'idx_anomesdia_baixado',
+    'idx_baixado',
+    'idx_pendentes_cover',
+)
+
+
+@lru_cache(maxsize=16)
+def _views_e_indices_por_versao(db_path: str, versao_schema: int) -> frozenset:
+    """
+    Nomes de _VIEWS_E_INDICES_OTIMIZACAO presentes no banco.
+    
+    versao_schema (PRAGMA schema_version) entra só na chave do cache: o SQLite
+    a incrementa a cada DDL, entoo criar ou remover views/índices invalida a
+    entrada sem consultar o sqlite_master a cada verificacoo.
+    """
+    marcadores = ", ".join("?" * len(_VIEWS_E_INDICES_OTIMIZACAO))
+    cursor = _obter_conexao(db_path).execute(
+        f"SELECT name FROM sqlite_master WHERE type IN ('view', 'index') AND name IN ({marcadores})",
+        _VIEWS_E_INDICES_OTIMIZACAO
+    )
+    return frozenset(nome for (nome,) in cursor)
+
+
 def _verificar_views_e_indices_disponiveis(db_path: str) -> Dict[str, bool]:
     """
     Verifica quais views e índices estão disponíveis no banco para otimização.
     
+    O resultado fica em cache por (db_path, PRAGMA schema_version); cada
+    chamada custa apenas a leitura da versoo do schema.
+    
     Args:
         db_path: Caminho do banco SQLite
         
     Returns:
         Dict com disponibilidade de views e índices importantes
     """
-    disponibilidade = {
-        'vw_notas_pendentes': False,
-        'vw_notas_mes_atual': False,
-        'vw_notas_recentes': False,
-        'idx_anomesdia_baixado': False,
-        'idx_chave_nfe': False,
-        'idx_baixado': False
-    }
-    
     try:
-        with sqlite3.connect(db_path) as conn:
-            # Verifica views
-            cursor = conn.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='view' AND name IN ('vw_notas_pendentes', 'vw_notas_mes_atual', 'vw_notas_recentes')
-            """)
-            views_existentes = {row[0] for row in cursor.fetchall()}
-            
-            # Verifica índices
-            cursor = conn.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='index' AND name IN ('idx_anomesdia_baixado', 'idx_chave_nfe', 'idx_baixado')
-            """)
-            indices_existentes = {row[0] for row in cursor.fetchall()}
-            
-            # Atualiza disponibilidade
-            for item in disponibilidade:
-                if item.startswith('vw_'):
-                    disponibilidade[item] = item in views_existentes
-                elif item.startswith('idx_'):
-                    disponibilidade[item] = item in indices_existentes
-                    
+        versao_schema = _obter_conexao(db_path).execute("PRAGMA schema_version").fetchone()[0]
+        existentes = _views_e_indices_por_versao(db_path, versao_schema)
     except Exception as e:
         logger.warning(f"[DB_OTIM] Erro ao verificar views/índices: {e}")
+        existentes = frozenset()
     
+    disponibilidade = {nome: nome in existentes for nome in _VIEWS_E_INDICES_OTIMIZACAO}
     logger.debug(f"[DB_OTIM] Disponibilidade: {disponibilidade}")
     return disponibilidade
 
 
+# Nome padrao dos XMLs baixados: {nNF}_{dEmi_YYYYMMDD}_{cChaveNFe}.xml
+# (data já separada em ano, mes e dia para montar o ISO sem datetime)
+_PADRAO_NOME_XML_COM_DADOS = re.compile(
+    r'^([0-9]+)_([0-9]{4})([0-9]{2})([0-9]{2})_([0-9]{44})\.xml$', re.IGNORECASE
+)
+
+
 def _indexar_xmls_por_chave_com_dados(resultado_dir: str) -> Dict[str, Tuple[Path, Dict[str, str]]]:
     """
     Indexa XMLs por chave fiscal extraindo dados essenciais dos nomes dos arquivos.
     
     Padrão esperado: {nNF}_{dEmi_YYYYMMDD}_{cChaveNFe}.xml
     
+    O trabalho por arquivo (um match de regex e a data montada por concatenacoo)
+    e feito em laco serial: threads apenas adicionariam custo de agendamento.
+    
     Args:
         resultado_dir: Diretório base para busca
         
     Returns:
         Dict[chave_nfe, (Path, dados_extraidos)]
     """
-    import re
-    from datetime import datetime
-    
-    # Padrão regex para extrair dados do nome do arquivo
-    # Formato: numero_dataYYYYMMDD_chave44digitos.xml
-    PADRAO_NOME = re.compile(r'^(\d+)_(\d{8})_([0-9]{44})\.xml$', re.IGNORECASE)
-    
-    def processar_arquivo_xml_com_dados(xml_file: Path) -> Optional[Tuple[str, Path, Dict[str, str]]]:
-        """Processa um arquivo XML extraindo dados do nome."""
-        try:
-            nome = xml_file.name
-            match = PADRAO_NOME.match(nome)
-            
-            if match:
-                nnf, data_str, chave_nfe = match.groups()
-                
-                # Converte data YYYYMMDD para formato ISO
-                try:
-                    data_obj = datetime.strptime(data_str, '%Y%m%d')
-                    demi_iso = data_obj.strftime('%Y-%m-%d')
-                except ValueError:
-                    demi_iso = None
-                
-                dados_extraidos = {
-                    'nNF': nnf,
-                    'dEmi': demi_iso,
-                    'cChaveNFe': chave_nfe
-                }
-                
-                return (chave_nfe, xml_file, dados_extraidos)
-            else:
-                # Fallback: busca chave de 44 dígitos no nome
-                chaves_encontradas = re.findall(r'[0-9]{44}', nome)
-                if chaves_encontradas:
-                    chave_nfe = chaves_encontradas[0]
-                    return (chave_nfe, xml_file, {})
-                
-                logger.debug(f"[INDEXAÇÃO] Padrão não reconhecido: {nome}")
-                return None
-                
-        except Exception as e:
-            logger.warning(f"[INDEXAÇÃO] Falha ao processar {xml_file}: {e}")
-            return None
-    
     logger.info(f"[INDEXAÇÃO] Iniciando indexação com extração de dados em: {resultado_dir}")
     inicio = time.time()
     
@@ -2875,7 +3902,8 @@ def _indexar_xmls_por_chave_com_dados(resultado_dir: str) -> Dict[str, Tuple[Pat
         return {}
     
     try:
-        todos_xmls = list(resultado_path.rglob("*.xml"))
+        # Caminhos em str: Path só é criado para as entradas que vão para o índice
+        todos_xmls = _descobrir_caminhos_xml(os.fspath(resultado_path))
     except OSError as e:
         logger.error(f"[INDEXAÇÃO] Erro ao acessar diretório {resultado_dir}: {e}")
         return {}
@@ -2887,42 +3915,48 @@ def _indexar_xmls_por_chave_com_dados(resultado_dir: str) -> Dict[str, Tuple[Pat
     
     logger.info(f"[INDEXAÇÃO] Encontrados {total_arquivos} arquivos XML para indexar")
     
-    # Processamento paralelo
     xml_index: Dict[str, Tuple[Path, Dict[str, str]]] = {}
     processados = 0
     duplicatas = 0
-    
-    max_workers = min(32, (os.cpu_count() or 1) + 4)
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submete todos os arquivos para processamento
-        future_to_xml = {executor.submit(processar_arquivo_xml_com_dados, xml_file): xml_file 
-                        for xml_file in todos_xmls}
+    log_progresso = logger.isEnabledFor(logging.INFO)
+    
+    for caminho in todos_xmls:
+        nome = os.path.basename(caminho)
+        match = _PADRAO_NOME_XML_COM_DADOS.match(nome)
+        if match:
+            nnf, ano, mes, dia, chave = match.groups()
+            dados = {
+                'nNF': nnf,
+                'dEmi': f"{ano}-{mes}-{dia}",
+                'cChaveNFe': chave
+            }
+        else:
+            # Fallback: busca chave de 44 dígitos no nome
+            chave_encontrada = _PADRAO_CHAVE_NO_NOME.search(nome)
+            if chave_encontrada is None:
+                logger.debug(f"[INDEXAÇÃO] Padrão não reconhecido: {nome}")
+                chave = None
+            else:
+                chave = chave_encontrada.group()
+                dados = {}
         
-        # Processa resultados conforme completam
-        for future in concurrent.futures.as_completed(future_to_xml):
-            xml_file = future_to_xml[future]
-            try:
-                resultado = future.result()
-                if resultado:
-                    chave, caminho, dados = resultado
-                    if chave in xml_index:
-                        duplicatas += 1
-                        logger.debug(f"[INDEXAÇÃO] Chave duplicada encontrada: {chave}")
-                    else:
-                        xml_index[chave] = (caminho, dados)
-                    
-                processados += 1
-
-                # Log de progresso a cada 500 arquivos
-                if processados % 500 == 0:
-                    tempo_decorrido = time.time() - inicio
-                    taxa = processados / tempo_decorrido
-                    progresso = processados / total_arquivos * 100
-                    logger.info(f"[INDEXAÇÃO] Progresso: {progresso:.1f}% - Taxa: {taxa:.0f} arq/s")
-                    
-            except Exception as e:
-                logger.warning(f"[INDEXAÇÃO] Erro ao processar {xml_file}: {e}")
+        if chave is not None:
+            if chave in xml_index:
+                duplicatas += 1
+                logger.debug(f"[INDEXAÇÃO] Chave duplicada encontrada: {chave}")
+            else:
+                xml_index[chave] = (Path(caminho), dados)
+        
+        processados += 1
+        
+        # Log de progresso a cada 500 arquivos
+        if log_progresso and processados % 500 == 0:
+            tempo_decorrido = time.time() - inicio
+            taxa = processados / tempo_decorrido if tempo_decorrido > 0 else 0
+            logger.info(
+                "[INDEXAÇÃO] Progresso: %.1f%% - Taxa: %.0f arq/s",
+                processados / total_arquivos * 100, taxa
+            )
     
     tempo_total = time.time() - inicio
     total_indexado = len(xml_index)
@@ -3062,26 +4096,16 @@ def marcar_como_baixado(
     try:
         caminho_arquivo = str(caminho.resolve())
         
-        with sqlite3.connect(db_path) as conn:
-            conn.execute("PRAGMA journal_mode=WAL")
-            conn.execute("PRAGMA synchronous=NORMAL")
-            
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                UPDATE notas 
-                SET xml_baixado = 1, caminho_arquivo = ?, xml_vazio = ? 
-                WHERE cChaveNFe = ?
-                """,
-                (caminho_arquivo, xml_vazio, chave)
-            )
-            
-            if cursor.rowcount == 0:
-                logger.warning(f"[ALERT] Nenhum registro encontrado para marcar como baixado: {chave}")
-            else:
-                logger.info(f"[BAIXADO] Registro marcado como baixado: {chave}")
-            
-            conn.commit()
+        # Conexão reutilizada da thread: journal_mode (WAL) é persistente no
+        # arquivo e os PRAGMAs por conexão ja foram aplicados na abertura
+        conn = _obter_conexao(db_path)
+        with conn:
+            cursor = conn.execute(_Q_ATUALIZAR_STATUS_XML, (caminho_arquivo, xml_vazio, chave))
+        
+        if cursor.rowcount == 0:
+            logger.warning(f"[ALERT] Nenhum registro encontrado para marcar como baixado: {chave}")
+        else:
+            logger.info(f"[BAIXADO] Registro marcado como baixado: {chave}")
             
     except Exception as e:
         logger.exception(f"[ERRO] Falha ao marcar registro como baixado para {chave}: {e}")
@@ -3213,12 +4237,12 @@ def salvar_nota(
         except Exception as e:
             raise ValueError(f"Falha na transformação de dados para chave {chave[:8]}...: {e}")
         
-        # 4. Operação de banco com configuração otimizada
+        # 4. Operação de banco na conexão reutilizada da thread (sem abrir/configurar por nota)
         try:
-            with conexao_otimizada(db_path) as conn:
+            conn = _obter_conexao(db_path)
+            with conn:
                 # Insert com tratamento de duplicata
                 conn.execute(SCHEMA_NOTAS_INSERT, valores)
-                conn.commit()
                 
                 logger.debug(f"[NOTA] Inserção bem-sucedida: {chave[:8]}...")
                 
@@ -3270,6 +4294,12 @@ def salvar_nota(
             motivo=f"erro_inesperado: {str(e)}"
         )
 
+@lru_cache(maxsize=8)
+def _sql_insert_notas_varias_linhas(linhas: int) -> str:
+    """INSERT OR IGNORE de notas com `linhas` grupos VALUES num unico comando."""
+    return f"{_SQL_INSERT_NOTAS_PREFIXO} VALUES {', '.join([_SQL_INSERT_NOTAS_GRUPO] * linhas)}"
+
+
 def salvar_varias_notas(
     registros: List[Dict[str, Union[str, int, float, None]]], 
     db_path: str,
@@ -3286,9 +4316,10 @@ def salvar_varias_notas(
     Otimizações implementadas:
     - Transação única para todo o lote
     - Configuração SQLite aplicada uma vez
-    - executemany() para inserção em massa
+    - INSERT com várias linhas VALUES por comando (até LINHAS_POR_INSERT)
     - Processamento em lotes configuráveis
-    - Validação em paralelo (opcional)
+    - Validação prévia em passada unica (opcional); serial de propósito: cada
+      registro custa poucas comparacões, menos que enviá-lo a outro processo
     
     Args:
         registros: Lista de dicionários com dados das notas fiscais
@@ -3350,33 +4381,42 @@ def salvar_varias_notas(
         registros = registros_validos
         logger.info(f"[LOTE] {len(registros)} registros válidos após validação")
     
-    # Processamento em lotes
+    # Processamento em lotes (carga recuperável: INSERT OR IGNORE pode ser reexecutado)
     try:
-        with conexao_otimizada(db_path) as conn:
+        with conexao_otimizada(db_path) as conn, bulk_write_mode(conn):
+            conn.execute("BEGIN IMMEDIATE")
             # Processa em lotes para otimizar memória
             for i in range(0, len(registros), tamanho_lote):
                 lote_atual = registros[i:i + tamanho_lote]
-                dados_lote = []
                 
-                # Transforma registros em tuplas
-                for registro in lote_atual:
-                    try:
-                        dados_lote.append(transformar_em_tuple(registro))
-                    except Exception as e:
-                        chave = registro.get('cChaveNFe', 'UNKNOWN')
-                        logger.warning(f"[LOTE] Erro na transformação ({chave[:8]}...): {e}")
-                        chaves_com_erro.append(chave)
-                        total_erros += 1
+                # Transforma registros em tuplas (lote inteiro; registro a registro se houver falha)
+                try:
+                    dados_lote = transformar_em_tuples_batch(lote_atual)
+                except Exception:
+                    dados_lote = []
+                    for registro in lote_atual:
+                        try:
+                            dados_lote.append(transformar_em_tuple(registro))
+                        except Exception as e:
+                            chave = registro.get('cChaveNFe', 'UNKNOWN')
+                            logger.warning(f"[LOTE] Erro na transformação ({chave[:8]}...): {e}")
+                            chaves_com_erro.append(chave)
+                            total_erros += 1
                 
                 if dados_lote:
                     try:
-                        # Insert em lote com INSERT OR IGNORE para tratar duplicatas
-                        conn.executemany(
-                            SCHEMA_NOTAS_INSERT.replace("INSERT INTO", "INSERT OR IGNORE INTO"),
-                            dados_lote
-                        )
+                        # Insert em lote com INSERT OR IGNORE para tratar duplicatas: um comando
+                        # por bloco de LINHAS_POR_INSERT linhas. O rowcount de cada comando conta
+                        # só as linhas inseridas (ignoradas contam 0), sem depender do contador
+                        # global total_changes
+                        inseridos_lote = 0
+                        for j in range(0, len(dados_lote), LINHAS_POR_INSERT):
+                            bloco = dados_lote[j:j + LINHAS_POR_INSERT]
+                            inseridos_lote += conn.execute(
+                                _sql_insert_notas_varias_linhas(len(bloco)),
+                                tuple(chain.from_iterable(bloco))
+                            ).rowcount
                         
-                        inseridos_lote = conn.total_changes - total_inseridos - total_duplicatas
                         duplicatas_lote = len(dados_lote) - inseridos_lote
                         
                         total_inseridos += inseridos_lote
@@ -3424,6 +4464,75 @@ def salvar_varias_notas(
     
     return resultado
 
+def inserir_notas_batch(db_path: str, registros: List[Dict]) -> int:
+    """
+    Insere um lote de notas numa unica transacoo com executemany.
+    
+    Caminho enxuto para cargas em massa ja validadas: transforma os registros
+    sob demanda (map sobre transformar_em_tuple), usa INSERT OR IGNORE com
+    PRAGMA synchronous=OFF e faz um unico commit. Com LIMIAR_RECRIAR_INDICES
+    ou mais registros, os indices de INDICES_RECRIADOS_NA_CARGA sao removidos
+    antes da carga e recriados (a partir da DDL original) na mesma transacoo.
+    
+    Args:
+        db_path: Caminho para o banco SQLite
+        registros: Lista de dicionarios de notas fiscais
+        
+    Returns:
+        Quantidade de registros efetivamente inseridos (duplicatas ignoradas)
+        
+    Raises:
+        ValueError: Se algum registro noo tiver os campos essenciais
+        DatabaseError: Se a carga falhar (nenhuma linha é gravada)
+        
+    Examples:
+        >>> inseridos = inserir_notas_batch("omie.db", registros)
+    """
+    if not registros:
+        return 0
+    
+    sql_insert = SCHEMA_NOTAS_INSERT.replace("INSERT INTO", "INSERT OR IGNORE INTO")
+    
+    try:
+        with conexao_otimizada(db_path) as conn, bulk_write_mode(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                indices_ddl = []
+                if len(registros) >= LIMIAR_RECRIAR_INDICES:
+                    marcadores = ",".join("?" * len(INDICES_RECRIADOS_NA_CARGA))
+                    indices_ddl = conn.execute(
+                        f"SELECT name, sql FROM sqlite_master "
+                        f"WHERE type = 'index' AND tbl_name = 'notas' AND name IN ({marcadores})",
+                        INDICES_RECRIADOS_NA_CARGA
+                    ).fetchall()
+                    for nome, _ in indices_ddl:
+                        conn.execute(f"DROP INDEX {nome}")
+                
+                alteracoes_antes = conn.total_changes
+                conn.executemany(sql_insert, map(transformar_em_tuple, registros))
+                inseridos = conn.total_changes - alteracoes_antes
+                
+                for _, ddl in indices_ddl:
+                    conn.execute(ddl)
+                
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        
+        logger.info(
+            f"[LOTE] {inseridos} inseridos, {len(registros) - inseridos} duplicatas "
+            f"({len(indices_ddl)} indice(s) recriado(s))"
+        )
+        return inseridos
+        
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.exception(f"[LOTE] Erro na insercoo em lote: {e}")
+        raise DatabaseError(f"Falha na insercoo em lote: {e}")
+
+
 # Função deprecated mantida para compatibilidade
 def salvar_nota_deprecated(registro: dict, db_path: str) -> None:
     """
@@ -3447,11 +4556,52 @@ def salvar_nota_deprecated(registro: dict, db_path: str) -> None:
 # 📅 FUNÇÕES DE INDEXAÇÃO TEMPORAL
 # =============================================================================
 
+def _anomesdia_gerada(conn: sqlite3.Connection, table_name: str = "notas") -> bool:
+    """
+    Indica se anomesdia é coluna gerada (bancos criados com o schema atual).
+    
+    Nesses bancos o SQLite calcula anomesdia a partir de dEmi e a coluna noo
+    aceita escrita; bancos antigos continuam com a coluna comum, preenchida
+    por atualizar_anomesdia().
+    """
+    for coluna in conn.execute(f"PRAGMA table_xinfo({table_name})"):
+        # hidden: 2 = gerada VIRTUAL, 3 = gerada STORED
+        if coluna[1] == 'anomesdia':
+            return coluna[6] in (2, 3)
+    return False
+
+
+def _adicionar_anomesdia_gerada(conn: sqlite3.Connection, table_name: str = "notas") -> bool:
+    """
+    Adiciona anomesdia como coluna gerada em tabelas antigas que ainda não a têm.
+    
+    ALTER TABLE só aceita colunas geradas VIRTUAL: o valor é calculado na
+    leitura, mas a coluna pode ser indexada como a STORED do schema atual.
+    Tabelas com a coluna comum (bancos antigos) continuam como estão.
+    
+    Args:
+        conn: Conexão SQLite ativa
+        table_name: Nome da tabela (validado pelo chamador)
+        
+    Returns:
+        True se a coluna foi adicionada, False se ja existia
+    """
+    colunas = {coluna[1] for coluna in conn.execute(f"PRAGMA table_xinfo({table_name})")}
+    if 'anomesdia' in colunas:
+        return False
+    conn.execute(
+        f"ALTER TABLE {table_name} ADD COLUMN anomesdia INTEGER "
+        f"GENERATED ALWAYS AS ({_SQL_ANOMESDIA_GERADA}) VIRTUAL"
+    )
+    return True
+
+
 def garantir_coluna_anomesdia(db_path: str = "omie.db", table_name: str = "notas") -> bool:
     """
     Garante que a coluna anomesdia existe na tabela de notas.
     
-    Esta função verifica se a coluna anomesdia (INTEGER) existe e a cria se necessário.
+    Esta função verifica se a coluna anomesdia (INTEGER) existe e a cria se necessário,
+    como coluna gerada a partir de dEmi (ver _adicionar_anomesdia_gerada).
     É executada na inicialização do pipeline para garantir compatibilidade.
     
     Args:
@@ -3467,25 +4617,13 @@ def garantir_coluna_anomesdia(db_path: str = "omie.db", table_name: str = "notas
     """
     try:
         with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Verifica se a coluna anomesdia já existe
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            colunas = [coluna[1] for coluna in cursor.fetchall()]
-            
-            if 'anomesdia' in colunas:
+            # Verifica se a coluna anomesdia já existe (table_xinfo inclui colunas geradas)
+            if not _adicionar_anomesdia_gerada(conn, table_name):
                 logger.debug("[ANOMESDIA] Coluna anomesdia já existe")
                 return True
             
-            # Adiciona a coluna anomesdia
-            logger.info("[ANOMESDIA] Adicionando coluna anomesdia à tabela...")
-            cursor.execute(f"""
-                ALTER TABLE {table_name} 
-                ADD COLUMN anomesdia INTEGER DEFAULT NULL
-            """)
-            
             conn.commit()
-            logger.info("[ANOMESDIA] ✓ Coluna anomesdia criada com sucesso")
+            logger.info("[ANOMESDIA] ✓ Coluna gerada anomesdia criada com sucesso")
             return True
             
     except sqlite3.Error as e:
@@ -3519,69 +4657,43 @@ def atualizar_anomesdia(db_path: str = "omie.db", table_name: str = "notas") ->
         # SELECT * FROM notas WHERE anomesdia = 20250721
     """
     try:
-        with sqlite3.connect(db_path) as conn:
-            # Otimizações de performance
-            for pragma, valor in SQLITE_PRAGMAS.items():
-                conn.execute(f"PRAGMA {pragma}={valor}")
-            
-            cursor = conn.cursor()
+        # Conexão reutilizada da thread (PRAGMAs aplicados uma unica vez na abertura)
+        conn = _obter_conexao(db_path)
+        with conn:
+            if _anomesdia_gerada(conn, table_name):
+                logger.debug("[ANOMESDIA] Coluna gerada pelo SQLite: nada a atualizar")
+                return 0
             
-            # Busca registros com dEmi válido mas sem anomesdia
-            cursor.execute(f"""
-                SELECT cChaveNFe, dEmi 
-                FROM {table_name} 
-                WHERE dEmi IS NOT NULL 
+            # Registros com dEmi preenchido mas sem anomesdia
+            condicao_pendentes = """
+                dEmi IS NOT NULL 
                 AND dEmi != '' 
                 AND dEmi != '-'
                 AND (anomesdia IS NULL OR anomesdia = 0)
-            """)
-            
-            registros = cursor.fetchall()
-            if not registros:
-                logger.info("[ANOMESDIA] Nenhum registro para atualizar")
-                return 0
-            
-            logger.info(f"[ANOMESDIA] Processando {len(registros)} registros...")
+            """
             
-            atualizacoes = []
-            erros = 0
+            # YYYYMMDD calculado no proprio UPDATE, sem ler as linhas no Python: o CASE
+            # cobre os formatos usuais e norm_data() (normalizar_data) só os demais
+            data_iso = f"COALESCE({_SQL_DEMI_NORMALIZADO}, norm_data(dEmi))"
+            atualizados = conn.execute(f"""
+                UPDATE {table_name}
+                SET anomesdia = CAST(REPLACE({data_iso}, '-', '') AS INTEGER)
+                WHERE {condicao_pendentes}
+                AND {data_iso} IS NOT NULL
+            """).rowcount
+            conn.commit()
             
-            for chave, dEmi in registros:
-                try:
-                    # Normaliza a data para formato ISO
-                    data_normalizada = normalizar_data(dEmi)
-                    if data_normalizada:
-                        # Converte para YYYYMMDD
-                        ano, mes, dia = data_normalizada.split('-')
-                        anomesdia = int(f"{ano}{mes}{dia}")
-                        atualizacoes.append((anomesdia, chave))
-                    else:
-                        logger.warning(f"[ANOMESDIA] Data inválida para chave {chave}: {dEmi}")
-                        erros += 1
-                        
-                except Exception as e:
-                    logger.warning(f"[ANOMESDIA] Erro ao processar {chave}: {e}")
-                    erros += 1
+            # O que ainda casa com o filtro tem data que nenhum formato reconhece
+            erros = conn.execute(f"SELECT COUNT(*) FROM {table_name} WHERE {condicao_pendentes}").fetchone()[0]
             
-            # Executa atualizações em lote
-            if atualizacoes:
-                cursor.executemany(f"""
-                    UPDATE {table_name} 
-                    SET anomesdia = ? 
-                    WHERE cChaveNFe = ?
-                """, atualizacoes)
-                
-                conn.commit()
-                atualizados = len(atualizacoes)
-                
+            if atualizados:
                 logger.info(f"[ANOMESDIA] ✓ {atualizados} registros atualizados")
-                if erros > 0:
-                    logger.warning(f"[ANOMESDIA] ⚠ {erros} registros com erro")
-                
-                return atualizados
             else:
-                logger.info("[ANOMESDIA] Nenhuma atualização válida encontrada")
-                return 0
+                logger.info("[ANOMESDIA] Nenhum registro para atualizar")
+            if erros > 0:
+                logger.warning(f"[ANOMESDIA] ⚠ {erros} registros com data inválida")
+            
+            return atualizados
                 
     except sqlite3.Error as e:
         logger.error(f"[ANOMESDIA] Erro de banco: {e}")
@@ -3796,11 +4908,9 @@ def obter_metricas_completas_banco(db_path: str = "omie.db") -> Dict[str, Any]:
         return {}
     
     try:
-        with sqlite3.connect(db_path) as conn:
-            # Otimizações básicas
-            conn.execute("PRAGMA temp_store = MEMORY")
-            conn.execute("PRAGMA cache_size = -64000")
-            
+        # Conexão reutilizada da thread (temp_store/cache_size ja aplicados na abertura)
+        conn = _obter_conexao(db_path)
+        with conn:
             cursor = conn.cursor()
             
             # ========================================
@@ -156,18 +156,22 @@ def atualizar_status_no_banco(
     total = len(chaves)
     logger.info(f"[BANCO] Iniciando atualizacao de {total} registros em lotes de {batch_size}...")
     try:
-        for i in range(0, total, batch_size):
-            lote = chaves[i:i+batch_size]
-            with sqlite3.connect(db_path) as conn:
-                conn.execute("PRAGMA journal_mode=WAL")
-                conn.execute("PRAGMA synchronous=NORMAL")
-                conn.execute("PRAGMA temp_store=MEMORY")
-                conn.executemany(
-                    f"UPDATE {TABLE_NAME} SET xml_baixado = 1 WHERE cChaveNFe = ?",
-                    [(chave,) for chave in lote]
-                )
-                conn.commit()
-            logger.info(f"[BANCO] Atualizados {min(i+batch_size, total)}/{total} registros.")
+        # Uma conexão para todos os lotes; journal_mode (WAL) é persistente no
+        # arquivo (iniciar_db), só os PRAGMAs por conexão são aplicados aqui
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            for i in range(0, total, batch_size):
+                lote = chaves[i:i+batch_size]
+                with conn:
+                    conn.executemany(
+                        f"UPDATE {TABLE_NAME} SET xml_baixado = 1 WHERE cChaveNFe = ?",
+                        [(chave,) for chave in lote]
+                    )
+                logger.info(f"[BANCO] Atualizados {min(i+batch_size, total)}/{total} registros.")
+        finally:
+            conn.close()
         logger.info(f"[BANCO] {total} registros atualizados com sucesso.")
     except Exception as e:
         logger.exception(f"[BANCO] Falha ao atualizar registros: {e}")